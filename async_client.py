@@ -0,0 +1,353 @@
+import itertools
+import main
+import time
+from psycopg_pool import AsyncConnectionPool
+
+
+# Асинхронные версии функций работы с клиентами для psycopg 3
+# Запросы и проверки данных берутся из тех же констант и функций main, что и в синхронных версиях,
+# повторяющиеся запросы psycopg 3 сам подготавливает на сервере (prepare_threshold)
+
+
+async def create_pool(conninfo, min_size=1, max_size=10, timeout=30):
+    """
+    Создает и открывает асинхронный пул соединений
+    :param conninfo: Строка подключения к базе данных
+    :param min_size: Минимальное количество открытых соединений
+    :param max_size: Максимальное количество соединений
+    :param timeout: Сколько секунд ждать свободного соединения
+    :return: Открытый пул AsyncConnectionPool, соединения берутся через async with pool.connection()
+    """
+    connection_pool = AsyncConnectionPool(conninfo, min_size=min_size, max_size=max_size, timeout=timeout,
+                                          open=False)
+    await connection_pool.open(wait=True)
+
+    return connection_pool
+
+
+async def commit_invalidated(connection, cur, person_id=None):
+    """
+    Фиксирует транзакцию, в которой изменен клиент, и только после commit удаляет его из кэша
+    main.get_client() через main.drop_cached_clients(), как и main.invalidate_client() внутри transaction()
+    Если включено уведомление, перед commit отправляется NOTIFY client_cache
+    :param connection: Соединение, транзакция которого фиксируется
+    :param cur: Курсор, в транзакции которого изменен клиент
+    :param person_id: id клиента, None - очистить весь кэш
+    :return: Ничего не возвращает
+    """
+    if main.client_cache_notify:
+        await cur.execute(main.NOTIFY_CLIENT_CACHE_QUERY, (main.client_cache_payload(person_id),))
+
+    await connection.commit()
+    main.drop_cached_clients(None if person_id is None else [person_id])
+
+
+async def find_client(connection, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None):
+    """
+    Асинхронная версия main.find_client()
+    :return: Возвращает список кортежей в формате main.find_client()
+    """
+    param_dict = main.client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    query, params = main.generate_select_query(param_dict)
+
+    async with connection.cursor() as cur:
+        await cur.execute(query, params)
+        return await cur.fetchall()
+
+
+async def find_client_page(connection, fname, sname, thname, date_of_birth, phone_num, email_address,
+                           person_id=None, page_size=50, page_token=None):
+    """
+    Асинхронная версия main.find_client_page()
+    :return: Кортеж из списка кортежей в формате main.find_client() и токена следующей страницы
+    """
+    param_dict = main.client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    query, params = main.generate_page_query(param_dict, page_size, page_token)
+
+    async with connection.cursor() as cur:
+        await cur.execute(query, params)
+        selected_data = await cur.fetchall()
+
+    if len({row[0] for row in selected_data}) < page_size:
+        return selected_data, None
+
+    return selected_data, main.encode_page_token(selected_data[-1][0])
+
+
+async def find_client_aggregated(connection, fname, sname, thname, date_of_birth, phone_num, email_address,
+                                 person_id=None):
+    """
+    Асинхронная версия main.find_client_aggregated()
+    :return: Возвращает список кортежей в формате main.find_client_aggregated()
+    """
+    param_dict = main.client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    shape, params = main.select_query_shape(param_dict)
+
+    async with connection.cursor() as cur:
+        await cur.execute(main.build_aggregated_query(shape), params)
+        return await cur.fetchall()
+
+
+async def insert_phone_num_for_existing_client(connection, phone_number, person_id):
+    """
+    Асинхронная версия main.insert_phone_num_for_existing_client()
+    :return: TRUE если номер добавлен FALSE если номер не прошел проверку
+    """
+    if not main.is_valid_phone_number(phone_number):
+        return False
+
+    async with connection.cursor() as cur:
+        await cur.execute(main.INSERT_PHONE_QUERY, (phone_number, person_id))
+        await commit_invalidated(connection, cur, person_id)
+
+    return True
+
+
+async def insert_email_for_existing_client(connection, email_address, person_id):
+    """
+    Асинхронная версия main.insert_email_for_existing_client()
+    :return: TRUE если email добавлен FALSE если адрес не прошел проверку
+    """
+    if not main.is_valid_email_address(email_address):
+        print('Адрес электронной почты не будет добавлен')
+        return False
+
+    async with connection.cursor() as cur:
+        await cur.execute(main.INSERT_EMAIL_QUERY, (email_address, person_id))
+        await commit_invalidated(connection, cur, person_id)
+
+    return True
+
+
+async def insert_new_client_data(connection, data_tup):
+    """
+    Асинхронная версия main.insert_new_client_data()
+    Клиент, его телефон и email добавляются в одной транзакции
+    :param data_tup: Кортеж в формате first_name, second_name, third_name, date_of_birth, phone_num_full,
+                           email_full
+    :return: person_id нового клиента
+    """
+    async with connection.cursor() as cur:
+        await cur.execute(main.INSERT_PERSON_QUERY, data_tup[0:4])
+        new_person_id = (await cur.fetchone())[0]
+
+        if main.is_valid_phone_number(data_tup[4]):
+            await cur.execute(main.INSERT_PHONE_QUERY, (data_tup[4], new_person_id))
+        if main.is_valid_email_address(data_tup[5]):
+            await cur.execute(main.INSERT_EMAIL_QUERY, (data_tup[5], new_person_id))
+        else:
+            print('Адрес электронной почты не будет добавлен')
+
+        await commit_invalidated(connection, cur, new_person_id)
+
+    return new_person_id
+
+
+async def insert_clients_many(connection, clients, batch_size=1000):
+    """
+    Асинхронная версия main.insert_clients_many()
+    :return: Список person_id добавленных клиентов в порядке следования clients
+    """
+    clients = iter(clients)
+    new_person_ids = []
+
+    async with connection.cursor() as cur:
+        while True:
+            batch = list(itertools.islice(clients, batch_size))
+            if not batch:
+                break
+
+            # person_id выделяются заранее и вставляются явно: порядок строк RETURNING не гарантирован
+            await cur.execute(main.NEXT_PERSON_IDS_QUERY, (len(batch),))
+            person_ids = [row[0] for row in await cur.fetchall()]
+
+            await cur.execute(main.build_values_query(main.INSERT_PERSONS_VALUES_QUERY, 5, len(batch)),
+                              [v for person_id, client in zip(person_ids, batch) for v in (person_id, *client[0:4])])
+
+            phone_list = [(client[4], person_id) for person_id, client in zip(person_ids, batch)
+                          if main.is_valid_phone_number(client[4])]
+            email_list = [(client[5], person_id) for person_id, client in zip(person_ids, batch)
+                          if main.is_valid_email_address(client[5], quiet=True)]
+
+            if phone_list:
+                await cur.execute(main.build_values_query(main.INSERT_PHONES_VALUES_QUERY, 2, len(phone_list)),
+                                  [v for row in phone_list for v in row])
+            if email_list:
+                await cur.execute(main.build_values_query(main.INSERT_EMAILS_VALUES_QUERY, 2, len(email_list)),
+                                  [v for row in email_list for v in row])
+
+            await connection.commit()
+            new_person_ids.extend(person_ids)
+
+    return new_person_ids
+
+
+async def copy_clients(connection, clients, chunk_size=50000, output=True):
+    """
+    Асинхронная версия main.copy_clients()
+    :param output: Печатать ли отчет о скорости загрузки
+    :return: Количество загруженных клиентов
+    """
+    clients = iter(clients)
+    loaded_qty = 0
+    start_time = time.perf_counter()
+
+    async with connection.cursor() as cur:
+        while True:
+            chunk = list(itertools.islice(clients, chunk_size))
+            if not chunk:
+                break
+
+            await cur.execute(main.NEXT_PERSON_IDS_QUERY, (len(chunk),))
+            person_ids = [row[0] for row in await cur.fetchall()]
+
+            async with cur.copy(main.COPY_PERSON_QUERY) as copy:
+                for person_id, client in zip(person_ids, chunk):
+                    await copy.write_row((person_id, *client[0:4]))
+
+            async with cur.copy(main.COPY_PHONE_QUERY) as copy:
+                for person_id, client in zip(person_ids, chunk):
+                    if main.is_valid_phone_number(client[4]):
+                        await copy.write_row((client[4], person_id))
+
+            async with cur.copy(main.COPY_EMAIL_QUERY) as copy:
+                for person_id, client in zip(person_ids, chunk):
+                    if main.is_valid_email_address(client[5], quiet=True):
+                        await copy.write_row((client[5], person_id))
+
+            await connection.commit()
+            loaded_qty += len(chunk)
+
+    if output:
+        main.print_load_rate(loaded_qty, time.perf_counter() - start_time)
+
+    return loaded_qty
+
+
+async def update_client(connection, person_id, fname, sname, thname, date_of_birth):
+    """
+    Асинхронная версия main.update_client()
+    :return: TRUE если данные клиента изменены FALSE если такого клиента нет
+    """
+    param_dict_update = {'person_id': person_id, 'first_name': fname, 'third_name': thname,
+                         'second_name': sname, 'date_of_birth': date_of_birth}
+
+    query, params = main.generate_update_query(param_dict_update)
+
+    async with connection.cursor() as cur:
+        await cur.execute(query, params)
+        updated = await cur.fetchone() is not None
+
+        if updated:
+            await commit_invalidated(connection, cur, person_id)
+        else:
+            await connection.commit()
+
+    if not updated:
+        print('Такого клиента нет')
+
+    return updated
+
+
+async def delete_phone_number(connection, person_id, phone_number):
+    """
+    Асинхронная версия main.delete_phone_number()
+    :return: TRUE если номер удален FALSE если клиента с таким номером нет
+    """
+    async with connection.cursor() as cur:
+        await cur.execute(main.DELETE_PHONE_QUERY, (person_id, phone_number))
+        deleted = cur.rowcount > 0
+
+        if deleted:
+            await commit_invalidated(connection, cur, person_id)
+        else:
+            await connection.commit()
+
+    if not deleted:
+        print('Клиента с таким номером телефона нет')
+
+    return deleted
+
+
+async def delete_email_address(connection, person_id, email_address):
+    """
+    Асинхронная версия main.delete_email_address()
+    :return: TRUE если email удален FALSE если клиента с таким email нет
+    """
+    async with connection.cursor() as cur:
+        await cur.execute(main.DELETE_EMAIL_QUERY, (person_id, email_address))
+        deleted = cur.rowcount > 0
+
+        if deleted:
+            await commit_invalidated(connection, cur, person_id)
+        else:
+            await connection.commit()
+
+    if not deleted:
+        print('Клиента с таким email нет')
+
+    return deleted
+
+
+async def delete_client(connection, person_id):
+    """
+    Асинхронная версия main.delete_client()
+    :return: TRUE если клиент удален FALSE если такого клиента нет
+    """
+    async with connection.cursor() as cur:
+        await cur.execute(main.DELETE_CLIENT_QUERY, (person_id,))
+        deleted = cur.rowcount > 0
+
+        if deleted:
+            await commit_invalidated(connection, cur, person_id)
+        else:
+            await connection.commit()
+
+    if not deleted:
+        print('Такого клиента в базе данных нет')
+
+    return deleted
+
+
+async def purge_clients(connection, fname, sname, thname, date_of_birth, phone_num, email_address,
+                        person_id=None, batch_size=10000, output=True):
+    """
+    Асинхронная версия main.purge_clients()
+    :param output: Печатать ли ход удаления
+    :return: Количество удаленных клиентов
+    """
+    param_dict = main.client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    shape, params = main.select_query_shape(param_dict)
+    deleted_qty = 0
+
+    async with connection.cursor() as cur:
+        if not shape:
+            await cur.execute(main.COUNT_CLIENTS_QUERY)
+            deleted_qty = (await cur.fetchone())[0]
+            await cur.execute(main.TRUNCATE_CLIENTS_QUERY)
+        else:
+            async with connection.cursor(name=f'purge_clients_{next(main.cursor_counter)}') as id_cur:
+                await id_cur.execute(f"SELECT person_id FROM person {main.person_where_clause(shape)};", params)
+
+                while True:
+                    person_ids = [row[0] for row in await id_cur.fetchmany(batch_size)]
+                    if not person_ids:
+                        break
+
+                    await cur.execute(main.DELETE_CLIENTS_QUERY, (person_ids,))
+                    deleted_qty += cur.rowcount
+
+                    if output:
+                        print(f'Удалено {deleted_qty} клиентов')
+
+        await commit_invalidated(connection, cur)
+
+    if output:
+        print('Всего удалено', deleted_qty, 'клиентов')
+
+    return deleted_qty
+
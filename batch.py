@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import datetime
+import json
+import main
+import psycopg2
+import sys
+import time
+
+
+def json_value(value):
+    """
+    Преобразует значение из базы данных в значение JSON
+    :param value: Значение поля
+    :return: Дата в формате ISO, остальные значения без изменений
+    """
+    return value.isoformat() if isinstance(value, datetime.date) else value
+
+
+def run_find(connection, op):
+    """
+    Поиск клиентов по полям операции
+    :return: Список найденных клиентов в виде словарей столбец - значение
+    """
+    clients = main.find_client_aggregated(connection, op.get('first_name', ''), op.get('second_name', ''),
+                                          op.get('third_name', ''), op.get('date_of_birth'),
+                                          op.get('phone_num', ''), op.get('email', ''), op.get('person_id'))
+
+    return [{column: json_value(value) for column, value in zip(main.SELECT_COLUMN_LIST, client)}
+            for client in clients]
+
+
+def run_add(connection, op):
+    """
+    Добавление нового клиента
+    :return: person_id нового клиента
+    """
+    data_tup = (op['first_name'], op['second_name'], op.get('third_name'), op['date_of_birth'],
+                op.get('phone_num', ''), op.get('email', ''))
+
+    return main.insert_new_client_data(connection, data_tup, False)
+
+
+def run_add_phone(connection, op):
+    """
+    Добавление телефона существующему клиенту
+    :return: TRUE если клиент есть FALSE если такого клиента нет
+    """
+    if not main.get_client(connection, op['person_id']):
+        return False
+
+    main.insert_phone_num_for_existing_client(connection, op['phone_num'], op['person_id'])
+
+    return True
+
+
+def run_add_email(connection, op):
+    """
+    Добавление email существующему клиенту
+    :return: TRUE если клиент есть FALSE если такого клиента нет
+    """
+    if not main.get_client(connection, op['person_id']):
+        return False
+
+    main.insert_email_for_existing_client(connection, op['email'], op['person_id'])
+
+    return True
+
+
+def run_update(connection, op):
+    """
+    Изменение данных клиента
+    :return: TRUE если данные клиента изменены FALSE если такого клиента нет
+    """
+    return main.update_client(connection, op['person_id'], op.get('first_name', ''), op.get('second_name', ''),
+                              op.get('third_name', ''), op.get('date_of_birth', ''))
+
+
+def run_delete(connection, op):
+    """
+    Удаление телефона, email или клиента целиком
+    :return: TRUE если данные удалены FALSE если удалять нечего
+    """
+    if op.get('phone_num'):
+        return main.delete_phone_number(connection, op['person_id'], op['phone_num'])
+    if op.get('email'):
+        return main.delete_email_address(connection, op['person_id'], op['email'])
+
+    return main.delete_client(connection, op['person_id'])
+
+
+# Операции пакетного режима: название - функция, выполняющая операцию через функции main
+OPERATION_DICT = {'find': run_find, 'add': run_add, 'add-phone': run_add_phone, 'add-email': run_add_email,
+                  'update': run_update, 'delete': run_delete}
+
+
+def run_batch(connection, input_stream, output_stream, group_size=100, synchronous_commit=True, output=True):
+    """
+    Выполняет операции из потока JSONL и пишет результаты в поток JSONL
+    Строка операции - объект с полем op (find, add, add-phone, add-email, update, delete), полями клиента
+    first_name, second_name, third_name, date_of_birth, phone_num, email, person_id и необязательным id,
+    который повторяется в результате. delete с phone_num или email удаляет только телефон или email.
+    Результат - объект с полями id, op, ok и result или error
+    Операции выполняются в единице работы main.transaction(), которая фиксируется каждые group_size операций,
+    каждая операция - в своей точке сохранения, поэтому ошибка откатывает только эту операцию.
+    Результаты группы пишутся только после ее фиксации. Если зафиксировать группу не удалось,
+    пишутся результаты ее ошибочных операций и итоговая запись с ok false, error и списком not_committed
+    из id успешно выполненных, но не зафиксированных операций, затем исключение передается дальше.
+    Сообщения функций main выводятся в stderr
+    :param connection: Соединение с базой данных
+    :param input_stream: Поток строк JSONL с операциями
+    :param output_stream: Поток для записи результатов
+    :param group_size: Количество операций в одной транзакции
+    :param synchronous_commit: FALSE - не ждать записи WAL на диск при фиксации групп,
+                               см. main.transaction()
+    :param output: Печатать ли в stderr отчет о скорости выполнения
+    :return: Словарь с количеством выполненных и ошибочных операций, временем выполнения и скоростью
+    """
+    ops_qty = 0
+    errors_qty = 0
+    # Результаты операций текущей группы, которые еще не зафиксированы
+    pending_results = []
+    start_time = time.perf_counter()
+
+    def write_results(results):
+        for op_result in results:
+            output_stream.write(json.dumps(op_result, ensure_ascii=False) + '\n')
+
+    try:
+        with main.transaction(connection, synchronous_commit=synchronous_commit) as unit, \
+                contextlib.redirect_stdout(sys.stderr):
+            for line_num, line in enumerate(input_stream, 1):
+                if not line.strip():
+                    continue
+
+                ops_qty += 1
+                op = {}
+
+                try:
+                    parsed = json.loads(line)
+                    if not isinstance(parsed, dict):
+                        raise ValueError('Операция должна быть объектом JSON')
+                    op = parsed
+                    operation = OPERATION_DICT.get(op.get('op'))
+                    if operation is None:
+                        raise ValueError(f'Неизвестная операция {op.get("op")!r}')
+
+                    with main.transaction(connection):
+                        result = {'ok': True, 'result': operation(connection, op)}
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    raise
+                except (psycopg2.Error, ValueError, KeyError, TypeError) as e:
+                    errors_qty += 1
+                    result = {'ok': False, 'error': f'{type(e).__name__}: {str(e).strip()}'}
+
+                pending_results.append({'id': op.get('id', line_num), 'op': op.get('op'), **result})
+
+                if len(pending_results) >= group_size:
+                    unit.flush()
+                    committed_results, pending_results = pending_results, []
+                    write_results(committed_results)
+
+        committed_results, pending_results = pending_results, []
+        write_results(committed_results)
+    except Exception as e:
+        write_results([op_result for op_result in pending_results if not op_result['ok']])
+        write_results([{'ok': False, 'error': f'{type(e).__name__}: {str(e).strip()}',
+                        'not_committed': [op_result['id'] for op_result in pending_results if op_result['ok']]}])
+        raise
+
+    elapsed = time.perf_counter() - start_time
+
+    result = {'ops': ops_qty, 'errors': errors_qty, 'elapsed_s': round(elapsed, 3),
+              'ops_per_s': round(ops_qty / elapsed) if elapsed else 0}
+
+    if output:
+        print(f'Выполнено {ops_qty} операций, из них с ошибкой {errors_qty}, за {result["elapsed_s"]} с '
+              f'({result["ops_per_s"]} операций/с)', file=sys.stderr)
+
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Пакетное выполнение операций с клиентами из файла JSONL')
+    parser.add_argument('input', nargs='?', default='-', help='Файл с операциями, по умолчанию stdin')
+    parser.add_argument('--dsn', default='', help='Строка подключения к базе данных')
+    parser.add_argument('--output', default='-', help='Файл для результатов, по умолчанию stdout')
+    parser.add_argument('--group-size', type=int, default=100, help='Количество операций в одной транзакции')
+    parser.add_argument('--async-commit', action='store_true',
+                        help='Не ждать записи WAL на диск при фиксации групп (synchronous_commit = off)')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+
+    with contextlib.ExitStack() as stack:
+        input_file = sys.stdin if args.input == '-' else stack.enter_context(open(args.input, encoding='utf-8'))
+        output_file = sys.stdout if args.output == '-' else stack.enter_context(open(args.output, 'w',
+                                                                                      encoding='utf-8'))
+        main.create_tables(conn)
+        main.create_indexes(conn, concurrently=True)
+        run_batch(conn, input_file, output_file, args.group_size, not args.async_commit)
+
+    conn.close()
@@ -0,0 +1,425 @@
+import argparse
+import concurrent.futures
+import data_batch
+import datetime
+import json
+import main
+import multiprocessing
+import psycopg2
+import random
+import resource
+import statistics
+import subprocess
+import time
+
+
+# Поисковые запросы для замера: название и аргументы find_client без соединения
+SEARCH_LIST = [
+    ('person_id', ('', '', '', None, '', '', 500)),
+    ('second_name_prefix', ('', 'Ива%', '', None, '', '')),
+    ('first_second_name', ('Егор', 'Иванов', '', None, '', '')),
+    ('third_name', ('', '', 'Сергеевич', None, '', '')),
+    ('date_of_birth', ('', '', '', '1990-05-15', '', '')),
+    ('phone_prefix', ('', '', '', None, '7915%', '')),
+    ('email', ('', '', '', None, '', 'e.ivanov@mail.ru')),
+]
+
+
+def measure(func, repeat):
+    """
+    Замеряет время выполнения функции
+    :param func: Функция без аргументов
+    :param repeat: Количество повторов
+    :return: Словарь с медианой, минимумом и максимумом времени выполнения в миллисекундах
+    """
+    timings = []
+
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start_time) * 1000)
+
+    return timing_summary(timings)
+
+
+def timing_summary(timings):
+    """
+    Считает статистику по списку замеров
+    :param timings: Список времен выполнения в миллисекундах
+    :return: Словарь с медианой, 95 и 99 процентилями, минимумом и максимумом времени выполнения в миллисекундах
+    """
+    timings = sorted(timings)
+
+    return {'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+            'min_ms': round(timings[0], 3), 'max_ms': round(timings[-1], 3)}
+
+
+def measure_each(func, args_list):
+    """
+    Замеряет время выполнения функции для каждого набора аргументов
+    :param func: Функция
+    :param args_list: Список кортежей аргументов
+    :return: Результат timing_summary()
+    """
+    timings = []
+
+    for args in args_list:
+        start_time = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start_time) * 1000)
+
+    return timing_summary(timings)
+
+
+def measure_searches(connection, repeat):
+    """
+    Замеряет время выполнения поисковых запросов из SEARCH_LIST
+    :param connection: Соединение с базой данных
+    :param repeat: Количество повторов каждого запроса
+    :return: Словарь название запроса - результат measure()
+    """
+    return {name: measure(lambda: main.find_client(connection, *args), repeat) for name, args in SEARCH_LIST}
+
+
+def benchmark_indexes(connection, persons_qty, repeat, seed):
+    """
+    Сравнивает время поиска клиентов без индексов из main.INDEX_LIST и с ними
+    ВНИМАНИЕ: таблицы person, phone_number и email_address удаляются и создаются заново,
+    запускать только на тестовой базе данных
+    :param connection: Соединение с базой данных
+    :param persons_qty: Количество клиентов для загрузки
+    :param repeat: Количество повторов каждого запроса
+    :param seed: Начальное значение генератора случайных чисел
+    :return: Словарь с результатами замеров до и после создания индексов
+    """
+    with connection.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS phone_number, email_address, person;")
+        connection.commit()
+
+    main.create_tables(connection)
+    main.drop_indexes(connection)
+
+    random.seed(seed)
+    main.copy_clients(connection, main.generate_clients(persons_qty))
+
+    with connection.cursor() as cur:
+        cur.execute("ANALYZE person, phone_number, email_address;")
+        connection.commit()
+
+    result = {'persons': persons_qty, 'seed': seed, 'repeat': repeat,
+              'without_indexes': measure_searches(connection, repeat)}
+
+    start_time = time.perf_counter()
+    main.create_indexes(connection)
+    result['index_build_s'] = round(time.perf_counter() - start_time, 3)
+
+    result['with_indexes'] = measure_searches(connection, repeat)
+
+    return result
+
+
+def reset_tables(connection, partitions=None):
+    """
+    Удаляет и заново создает таблицы со всеми индексами
+    :param connection: Соединение с базой данных
+    :param partitions: Количество секций, None - таблицы без секций
+    """
+    with connection.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS phone_number, email_address, person;")
+        connection.commit()
+
+    main.create_tables(connection, partitions)
+    main.create_indexes(connection)
+
+
+def search_args_list(sample):
+    """
+    Формирует аргументы find_client для каждого сочетания условий поиска по существующим клиентам
+    :param sample: Список клиентов в формате find_client_aggregated()
+    :return: Словарь название сочетания условий - список кортежей аргументов find_client без соединения
+    """
+    return {
+        'person_id': [('', '', '', None, '', '', c[0]) for c in sample],
+        'name': [(c[1], c[3], '', None, '', '') for c in sample],
+        'second_name_prefix': [('', c[3][:3] + '%', '', None, '', '') for c in sample],
+        'date_of_birth': [('', '', '', c[4], '', '') for c in sample],
+        'phone': [('', '', '', None, c[5][0], '') for c in sample if c[5]],
+        'email': [('', '', '', None, '', c[6][0]) for c in sample if c[6]],
+    }
+
+
+def benchmark_size(connection, persons_qty, repeat, seed):
+    """
+    Замеряет производительность операций с клиентами на базе заданного размера
+    :param connection: Соединение с тестовой базой данных
+    :param persons_qty: Количество клиентов
+    :param repeat: Количество замеров каждой операции
+    :param seed: Начальное значение генератора случайных чисел
+    :return: Словарь с результатами замеров, пиковой памятью процесса и ее приростом за время замеров
+    """
+    # На Linux ru_maxrss в килобайтах. Это максимум за всю жизнь процесса, поэтому кроме него
+    # сохраняется прирост относительно значения до замеров
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    reset_tables(connection)
+    random.seed(seed)
+
+    start_time = time.perf_counter()
+    main.copy_clients(connection, main.generate_clients(persons_qty), output=False)
+    copy_elapsed = time.perf_counter() - start_time
+
+    with connection.cursor() as cur:
+        cur.execute("ANALYZE person, phone_number, email_address;")
+        connection.commit()
+
+    batch_qty = min(persons_qty, 10000)
+    start_time = time.perf_counter()
+    main.insert_clients_many(connection, main.generate_clients(batch_qty))
+    batch_elapsed = time.perf_counter() - start_time
+
+    single_timings = measure_each(lambda data_tup: main.insert_new_client_data(connection, data_tup, False),
+                                  [(main.generate_data(random.choice('mf')),) for i in range(repeat)])
+
+    rng = random.Random(seed)
+    sample_ids = rng.sample(range(1, persons_qty + 1), min(repeat, persons_qty))
+    sample = [client for person_id in sample_ids
+              for client in main.find_client_aggregated(connection, '', '', '', None, '', '', person_id)]
+
+    result = {
+        'persons': persons_qty,
+        'insert': {
+            'copy_rows_per_s': round(persons_qty / copy_elapsed),
+            'batch_rows_per_s': round(batch_qty / batch_elapsed),
+            'single': single_timings,
+        },
+        'find': {name: measure_each(lambda *args: main.find_client(connection, *args), args_list)
+                 for name, args_list in search_args_list(sample).items()},
+        'update': measure_each(lambda person_id: main.update_client(connection, person_id, 'Бенчмарк', '', '', None),
+                               [(c[0],) for c in sample]),
+        'delete': measure_each(lambda person_id: main.delete_client(connection, person_id),
+                               [(c[0],) for c in sample]),
+    }
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = round(peak_rss / 1024, 1)
+    result['rss_growth_mb'] = round((peak_rss - start_rss) / 1024, 1)
+
+    return result
+
+
+def benchmark_size_process(dsn, database_name, persons_qty, repeat, seed):
+    """
+    Выполняет benchmark_size() на отдельном соединении, вызывается в новом процессе для каждого размера,
+    чтобы пиковая память не включала память замеров предыдущих размеров
+    :param dsn: Строка подключения к серверу
+    :param database_name: Имя тестовой базы данных
+    :return: Результат benchmark_size()
+    """
+    conn = psycopg2.connect(dsn, dbname=database_name)
+    try:
+        return benchmark_size(conn, persons_qty, repeat, seed)
+    finally:
+        conn.close()
+
+
+def benchmark_partitions(connection, persons_qty, partitions_list, repeat, seed):
+    """
+    Сравнивает время поиска, удаления и массового удаления клиентов на таблицах без секций и с секциями
+    ВНИМАНИЕ: таблицы person, phone_number и email_address удаляются и создаются заново,
+    запускать только на тестовой базе данных
+    :param connection: Соединение с базой данных
+    :param persons_qty: Количество клиентов
+    :param partitions_list: Список количеств секций, 0 - таблицы без секций
+    :param repeat: Количество замеров поиска и удаления
+    :param seed: Начальное значение генератора случайных чисел
+    :return: Список словарей с результатами замеров для каждого количества секций
+    """
+    results = []
+
+    for partitions in partitions_list:
+        reset_tables(connection, partitions or None)
+        main.drop_indexes(connection)
+
+        start_time = time.perf_counter()
+        main.copy_clients(connection, data_batch.generate_clients_batch(persons_qty, seed), output=False)
+        load_elapsed = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        main.create_indexes(connection)
+        index_elapsed = time.perf_counter() - start_time
+
+        sample_ids = [(person_id,) for person_id in
+                      random.Random(seed).sample(range(1, persons_qty + 1), min(repeat, persons_qty))]
+
+        result = {
+            'partitions': partitions,
+            'persons': persons_qty,
+            'load_s': round(load_elapsed, 3),
+            'index_build_s': round(index_elapsed, 3),
+            'find_by_id': measure_each(lambda person_id: main.find_client(connection, '', '', '', None, '', '',
+                                                                          person_id), sample_ids),
+            'find_aggregated_by_id': measure_each(
+                lambda person_id: main.find_client_aggregated(connection, '', '', '', None, '', '', person_id),
+                sample_ids),
+            'delete': measure_each(lambda person_id: main.delete_client(connection, person_id), sample_ids),
+        }
+
+        # Массовое удаление примерно десятой части клиентов - всех с одной из десяти мужских фамилий
+        start_time = time.perf_counter()
+        purged_qty = main.purge_clients(connection, '', main.MALE_SECOND_NAME_LIST[0] + '%', '', None, '', '',
+                                        output=False)
+        result['purge'] = {'clients': purged_qty, 'elapsed_s': round(time.perf_counter() - start_time, 3)}
+
+        start_time = time.perf_counter()
+        connection.autocommit = True
+        with connection.cursor() as cur:
+            cur.execute("VACUUM person, phone_number, email_address;")
+        connection.autocommit = False
+        result['vacuum_s'] = round(time.perf_counter() - start_time, 3)
+
+        results.append(result)
+
+    return results
+
+
+def git_commit():
+    """
+    Получает хэш текущего коммита для сравнения результатов между коммитами
+    :return: Хэш коммита или None, если он недоступен
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(dsn, sizes, repeat, seed, keep_database=False):
+    """
+    Создает временную базу данных, выполняет замеры benchmark_size() для каждого размера базы
+    в отдельном процессе и удаляет ее
+    :param dsn: Строка подключения к серверу, на котором можно создавать базы данных
+    :param sizes: Список количеств клиентов
+    :param repeat: Количество замеров каждой операции
+    :param seed: Начальное значение генератора случайных чисел
+    :param keep_database: Не удалять временную базу данных после замеров
+    :return: Словарь с результатами замеров для всех размеров
+    """
+    database_name = f'benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}'
+
+    admin_conn = psycopg2.connect(dsn)
+    admin_conn.autocommit = True
+    with admin_conn.cursor() as cur:
+        cur.execute(f'CREATE DATABASE {database_name};')
+
+    result = {'commit': git_commit(), 'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+              'seed': seed, 'repeat': repeat, 'sizes': []}
+
+    try:
+        for persons_qty in sizes:
+            print(f'Замер на {persons_qty} клиентах')
+            # Процесс создается заново через spawn, а не fork, чтобы не наследовать память родителя
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                        mp_context=multiprocessing.get_context('spawn')) as executor:
+                result['sizes'].append(executor.submit(benchmark_size_process, dsn, database_name, persons_qty,
+                                                       repeat, seed).result())
+    finally:
+        if not keep_database:
+            with admin_conn.cursor() as cur:
+                cur.execute(f'DROP DATABASE {database_name};')
+        admin_conn.close()
+
+    return result
+
+
+def print_suite(result):
+    """
+    Печатает результаты run_suite()
+    :param result: Результат run_suite()
+    """
+    for size_result in result['sizes']:
+        print(f'\nКлиентов: {size_result["persons"]}, COPY: {size_result["insert"]["copy_rows_per_s"]} записей/с, '
+              f'пачками: {size_result["insert"]["batch_rows_per_s"]} записей/с, '
+              f'пиковая память: {size_result["peak_rss_mb"]} МБ (+{size_result["rss_growth_mb"]} МБ за замеры)')
+        print('{:<24}|{:>12}|{:>12}|{:>12}'.format('Операция', 'p50, мс', 'p95, мс', 'p99, мс'))
+        print(62 * '-')
+
+        operations = [('insert', size_result['insert']['single']), ('update', size_result['update']),
+                      ('delete', size_result['delete'])]
+        operations += [(f'find {name}', timing) for name, timing in size_result['find'].items()]
+
+        for name, timing in operations:
+            print('{:<24}|{:>12}|{:>12}|{:>12}'.format(name, timing['median_ms'], timing['p95_ms'], timing['p99_ms']))
+
+
+def print_comparison(result):
+    """
+    Печатает сравнение результатов замеров до и после создания индексов
+    :param result: Результат benchmark_indexes()
+    """
+    print(f'\nКлиентов: {result["persons"]}, построение индексов: {result["index_build_s"]} с')
+    print('{:<22}|{:>16}|{:>16}|{:>10}'.format('Запрос', 'Без индексов, мс', 'С индексами, мс', 'Ускорение'))
+    print(67 * '-')
+
+    for name, timing in result['without_indexes'].items():
+        before = timing['median_ms']
+        after = result['with_indexes'][name]['median_ms']
+        print('{:<22}|{:>16}|{:>16}|{:>10}'.format(name, before, after, f'{before / after:.1f}x' if after else '-'))
+
+
+def print_partitions(results):
+    """
+    Печатает результаты benchmark_partitions()
+    :param results: Результат benchmark_partitions()
+    """
+    print('\n{:<8}|{:>10}|{:>10}|{:>14}|{:>14}|{:>14}|{:>12}|{:>10}'.format(
+        'Секций', 'COPY, с', 'Индексы, с', 'find p50, мс', 'agg p50, мс', 'delete p50, мс', 'purge, с', 'VACUUM, с'))
+    print(100 * '-')
+
+    for result in results:
+        print('{:<8}|{:>10}|{:>10}|{:>14}|{:>14}|{:>14}|{:>12}|{:>10}'.format(
+            result['partitions'], result['load_s'], result['index_build_s'], result['find_by_id']['median_ms'],
+            result['find_aggregated_by_id']['median_ms'], result['delete']['median_ms'],
+            result['purge']['elapsed_s'], result['vacuum_s']))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Замер производительности операций с клиентами')
+    parser.add_argument('--mode', choices=['suite', 'indexes', 'partitions'], default='suite',
+                        help='suite - все операции на временной базе данных для каждого размера из --sizes, '
+                             'indexes - поиск без индексов и с индексами на базе из --dsn, '
+                             'partitions - поиск и удаление на таблицах с секциями из --partitions и без них '
+                             'на базе из --dsn')
+    parser.add_argument('--dsn', default='', help='Строка подключения к тестовому серверу или базе данных')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Количества клиентов для режима suite')
+    parser.add_argument('--persons', type=int, default=1000000,
+                        help='Количество клиентов для режимов indexes и partitions')
+    parser.add_argument('--partitions', type=int, nargs='+', default=[0, 16],
+                        help='Количества секций для режима partitions, 0 - таблицы без секций')
+    parser.add_argument('--repeat', type=int, default=20, help='Количество повторов каждого запроса')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора случайных чисел')
+    parser.add_argument('--keep-database', action='store_true', help='Не удалять временную базу данных')
+    parser.add_argument('--output', help='Файл для сохранения результатов в формате JSON')
+    args = parser.parse_args()
+
+    if args.mode == 'suite':
+        benchmark_result = run_suite(args.dsn, args.sizes, args.repeat, args.seed, args.keep_database)
+        print_suite(benchmark_result)
+    elif args.mode == 'indexes':
+        conn = psycopg2.connect(args.dsn)
+        benchmark_result = benchmark_indexes(conn, args.persons, args.repeat, args.seed)
+        print_comparison(benchmark_result)
+        conn.close()
+    else:
+        conn = psycopg2.connect(args.dsn)
+        benchmark_result = benchmark_partitions(conn, args.persons, args.partitions, args.repeat, args.seed)
+        print_partitions(benchmark_result)
+        conn.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark_result, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,59 @@
+import argparse
+import main
+import psycopg2
+import sys
+
+
+def run_command(connection, command, repair=False, sample_size=20):
+    """
+    Выполняет команду обслуживания client_view и печатает результат
+    :param connection: Получает соединение с базой данных
+    :param command: create, drop, rebuild, triggers или verify
+    :param repair: Для verify - исправить найденные расхождения
+    :param sample_size: Для verify - сколько расходящихся клиентов вывести
+    :return: Код завершения - 0 если все в порядке, 1 если verify нашел расхождения и они не исправлены
+    """
+    if command == 'create':
+        main.create_client_view(connection)
+        print('Таблица client_view создана и заполнена')
+    elif command == 'drop':
+        main.drop_client_view(connection)
+        print('Таблица client_view и ее триггеры удалены')
+    elif command == 'rebuild':
+        print(f'Таблица client_view заполнена заново, клиентов: {main.rebuild_client_view(connection)}')
+    elif command == 'triggers':
+        if main.repair_client_view_triggers(connection):
+            print('Триггеры client_view восстановлены, таблица заполнена заново')
+        else:
+            print('Триггеры client_view на месте или таблицы client_view нет')
+    elif command == 'verify':
+        drift_qty, sample = main.verify_client_view(connection, repair, sample_size)
+        if not drift_qty:
+            print('Расхождений client_view с таблицами клиентов нет')
+            return 0
+        print(f'Расходящихся клиентов: {drift_qty}, ID: {", ".join(str(person_id) for person_id in sample)}')
+        if repair:
+            print('Расхождения исправлены')
+            return 0
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Обслуживание таблицы client_view')
+    parser.add_argument('command', choices=['create', 'drop', 'rebuild', 'triggers', 'verify'],
+                        help='create - создать и заполнить, drop - удалить, rebuild - заполнить заново, '
+                             'triggers - восстановить пропавшие триггеры, verify - сверить с таблицами клиентов')
+    parser.add_argument('--repair', action='store_true', help='Для verify - исправить найденные расхождения')
+    parser.add_argument('--sample-size', type=int, default=20,
+                        help='Для verify - сколько ID расходящихся клиентов вывести')
+    parser.add_argument('--dsn', default='', help='Строка подключения к базе данных')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    exit_code = run_command(conn, args.command, args.repair, args.sample_size)
+    conn.close()
+
+    sys.exit(exit_code)
@@ -0,0 +1,92 @@
+import functools
+import main
+import numpy as np
+import transliterate
+
+
+# Форматы email из generate_email_address(): f - имя, t - отчество, s - фамилия, 0 - первая буква
+EMAIL_FORMAT_LIST = ['{f0}.{t0}.{s}', '{f0}-{t0}-{s}', '{f0}_{t0}_{s}', '{f}.{s}', '{f}-{s}']
+
+
+def translit(text):
+    """
+    Транслитерирует строку так же, как generate_email_address()
+    :param text: Строка на русском языке
+    :return: Строка латиницей в нижнем регистре
+    """
+    return transliterate.translit(text, 'ru', reversed=True).lower()
+
+
+@functools.lru_cache(maxsize=None)
+def name_tables():
+    """
+    Готовит таблицы имен, отчеств и фамилий по полу и таблицу локальных частей email
+    Транслитерация выполняется один раз для каждого имени, отчества, фамилии и их первых букв
+    :return: Кортеж массивов first_names[пол, i], third_names[пол, i], second_names[пол, i],
+             email_locals[пол, формат, имя, отчество, фамилия], пол 0 - мужчина, 1 - женщина
+    """
+    first_names = np.array([main.MALE_FIRST_NAME_LIST, main.FEMALE_FIRST_NAME_LIST], dtype=object)
+    third_names = np.array([[main.make_third_name(name, sex) for name in main.MALE_FIRST_NAME_LIST]
+                            for sex in 'mf'], dtype=object)
+    second_names = np.array([main.MALE_SECOND_NAME_LIST, [name + 'а' for name in main.MALE_SECOND_NAME_LIST]],
+                            dtype=object)
+
+    names = {*first_names.flat, *third_names.flat, *second_names.flat}
+    latin = {name: translit(name) for name in names | {name[0] for name in names}}
+
+    email_locals = np.empty((2, len(EMAIL_FORMAT_LIST), first_names.shape[1], third_names.shape[1],
+                             second_names.shape[1]), dtype=object)
+    for index in np.ndindex(email_locals.shape):
+        sex, email_format, f, t, s = index
+        f_name, t_name, s_name = first_names[sex, f], third_names[sex, t], second_names[sex, s]
+        email_locals[index] = EMAIL_FORMAT_LIST[email_format].format(
+            f=latin[f_name], f0=latin[f_name[0]], t0=latin[t_name[0]], s=latin[s_name])
+
+    return first_names, third_names, second_names, email_locals
+
+
+def generate_data_batch(clients_qty, rng):
+    """
+    Генерирует данные сразу для нескольких клиентов с теми же распределениями, что и generate_data()
+    для клиента случайного пола, все поля формируются операциями над массивами NumPy
+    :param clients_qty: Количество клиентов
+    :param rng: Генератор случайных чисел numpy.random.Generator
+    :return: Список кортежей в формате generate_data()
+    """
+    first_names, third_names, second_names, email_locals = name_tables()
+
+    sex = rng.integers(0, 2, clients_qty)
+    f = rng.integers(0, first_names.shape[1], clients_qty)
+    t = rng.integers(0, third_names.shape[1], clients_qty)
+    s = rng.integers(0, second_names.shape[1], clients_qty)
+
+    # Год 1960 - 2021, месяц 1 - 12, день 1 - 28
+    months = (rng.integers(1960, 2022, clients_qty) - 1970) * 12 + rng.integers(0, 12, clients_qty)
+    dates = months.astype('datetime64[M]').astype('datetime64[D]') + rng.integers(0, 28, clients_qty)
+
+    # Номер из 11 - 15 цифр, первая цифра не ноль; цифры за пределами длины номера - нулевые байты,
+    # которые отбрасываются при преобразовании в строку
+    digits = rng.integers(ord('0'), ord('9') + 1, (clients_qty, 15), dtype=np.uint8)
+    digits[:, 0] = rng.integers(ord('1'), ord('9') + 1, clients_qty, dtype=np.uint8)
+    digits[np.arange(15) >= rng.integers(11, 16, clients_qty)[:, None]] = 0
+    phones = digits.view('S15').ravel().astype('U15')
+
+    domains = np.array(main.DOMAIN_LIST, dtype=object)[rng.integers(0, len(main.DOMAIN_LIST), clients_qty)]
+    emails = email_locals[sex, rng.integers(0, len(EMAIL_FORMAT_LIST), clients_qty), f, t, s] + '@' + domains
+
+    return list(zip(first_names[sex, f].tolist(), second_names[sex, s].tolist(), third_names[sex, t].tolist(),
+                    dates.astype(str).tolist(), phones.tolist(), emails.tolist()))
+
+
+def generate_clients_batch(clients_qty, seed=None, batch_size=100000):
+    """
+    Генерирует заданное количество клиентов пачками через generate_data_batch()
+    :param clients_qty: Количество клиентов
+    :param seed: Начальное значение генератора случайных чисел, при одном и том же seed данные совпадают
+    :param batch_size: Количество клиентов в одной пачке
+    :return: Генератор кортежей в формате generate_data(), подходит для copy_clients()
+    """
+    rng = np.random.default_rng(seed)
+
+    for start in range(0, clients_qty, batch_size):
+        yield from generate_data_batch(min(batch_size, clients_qty - start), rng)
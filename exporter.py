@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import gzip
+import main
+import psycopg2
+from psycopg2 import extensions
+import sys
+import time
+
+
+# Параметры COPY для каждого формата выгрузки. Для JSONL каждая строка - один объект JSON из row_to_json,
+# формат csv с символами-разделителями, которых не бывает в JSON, выводит его без экранирования
+EXPORT_FORMAT_DICT = {
+    'csv': "FORMAT csv, HEADER",
+    'jsonl': "FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02'",
+}
+
+
+class CountingWriter:
+    """
+    Обертка над файлом, которая считает количество записанных байт и строк
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.lines += data.count(b'\n' if isinstance(data, bytes) else '\n')
+        return self.file.write(data)
+
+
+def build_export_query(cur, param_dict_sel, file_format, aggregated=False):
+    """
+    Формирует команду COPY (SELECT ...) TO STDOUT для выгрузки клиентов
+    Отбор и источник такие же, как у generate_select_query(), параметры подставляются в текст запроса через
+    mogrify, поскольку COPY не принимает параметры. С main.use_client_view выгружается client_view,
+    в котором на клиента всегда одна запись
+    :param cur: Курсор
+    :param param_dict_sel: Словарь где ключи - это названия столбцов всех таблиц, а значения - условия отбора
+    :param file_format: csv или jsonl
+    :param aggregated: Выгружать по одной записи на клиента со списками телефонов и email,
+                       как find_client_aggregated(), вместо записи на каждое сочетание телефона и email
+    :return: Текст команды COPY
+    """
+    if aggregated and not main.use_client_view:
+        shape, params = main.select_query_shape(param_dict_sel)
+        query = main.build_aggregated_query(shape)
+    else:
+        query, params = main.generate_select_query(param_dict_sel)
+
+    query = cur.mogrify(query.rstrip().rstrip(';'), params).decode(extensions.encodings[cur.connection.encoding])
+
+    if file_format == 'jsonl':
+        query = f"SELECT row_to_json(client) FROM ({query}) AS client"
+
+    return f"COPY ({query}) TO STDOUT WITH ({EXPORT_FORMAT_DICT[file_format]});"
+
+
+def export_clients(connection, file, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None,
+                   file_format='csv', aggregated=False, output=True):
+    """
+    Потоковая выгрузка клиентов в файл CSV или JSONL командой COPY (SELECT ...) TO STDOUT
+    Данные формируются на сервере и пишутся в файл по мере получения, не накапливаясь в памяти
+    :param connection: Получает соединение с базой данных
+    :param file: Файл, открытый на запись в двоичном режиме, например, gzip.open(path, 'wb')
+    :param file_format: csv или jsonl
+    :param aggregated: Одна запись на клиента со списками телефонов и email
+    :param output: Печатать ли в stderr отчет о скорости выгрузки
+    :return: Словарь с количеством выгруженных строк и байт, временем и скоростью выгрузки
+    """
+    param_dict = main.client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    writer = CountingWriter(file)
+    start_time = time.perf_counter()
+
+    with main.transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.copy_expert(build_export_query(cur, param_dict, file_format, aggregated), writer)
+
+    elapsed = time.perf_counter() - start_time
+    rows_qty = writer.lines - (1 if file_format == 'csv' else 0)
+
+    result = {'rows': rows_qty, 'bytes': writer.bytes, 'elapsed_s': round(elapsed, 3),
+              'rows_per_s': round(rows_qty / elapsed) if elapsed else 0}
+
+    if output:
+        print(f'Выгружено {result["rows"]} строк ({result["bytes"] / 2 ** 20:.1f} МБ без сжатия) '
+              f'за {result["elapsed_s"]} с ({result["rows_per_s"]} строк/с)', file=sys.stderr)
+
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Выгрузка клиентов в файл CSV или JSONL')
+    parser.add_argument('path', help='Файл для выгрузки, при расширении .gz сжимается на лету, - - stdout')
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help='Формат файла, по умолчанию определяется по расширению')
+    parser.add_argument('--aggregated', action='store_true',
+                        help='Одна запись на клиента со списками телефонов и email')
+    parser.add_argument('--dsn', default='', help='Строка подключения к базе данных')
+    parser.add_argument('--first-name', default='', help='Имя, можно использовать %%')
+    parser.add_argument('--second-name', default='', help='Фамилия, можно использовать %%')
+    parser.add_argument('--third-name', default='', help='Отчество, можно использовать %%')
+    parser.add_argument('--date-of-birth', help='Дата рождения ГГГГ-ММ-ДД')
+    parser.add_argument('--phone', default='', help='Телефон, можно использовать %%')
+    parser.add_argument('--email', default='', help='Email, можно использовать %%')
+    parser.add_argument('--person-id', type=int, help='ID клиента')
+    args = parser.parse_args()
+
+    export_format = args.format or ('jsonl' if args.path.removesuffix('.gz').endswith('.jsonl') else 'csv')
+
+    conn = psycopg2.connect(args.dsn)
+
+    with contextlib.ExitStack() as stack:
+        if args.path == '-':
+            export_file = sys.stdout.buffer
+        elif args.path.endswith('.gz'):
+            export_file = stack.enter_context(gzip.open(args.path, 'wb', compresslevel=6))
+        else:
+            export_file = stack.enter_context(open(args.path, 'wb'))
+
+        export_clients(conn, export_file, args.first_name, args.second_name, args.third_name, args.date_of_birth,
+                       args.phone, args.email, args.person_id, export_format, args.aggregated)
+
+    conn.close()
@@ -0,0 +1,266 @@
+import argparse
+import collections
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import main
+import psycopg2
+import sys
+import time
+
+
+# Поля файла с клиентами в порядке столбцов промежуточной таблицы
+IMPORT_FIELD_LIST = ['first_name', 'second_name', 'third_name', 'date_of_birth', 'phone_num', 'email']
+
+# Максимальная длина текстовых полей по определению таблиц в main.create_tables()
+FIELD_MAX_LENGTH_DICT = {'first_name': 40, 'second_name': 50, 'third_name': 50, 'phone_num': 15, 'email': 250}
+
+
+def open_text(path):
+    """
+    Открывает файл на чтение как текст, файлы .gz распаковываются на лету
+    :param path: Путь к файлу, '-' - stdin
+    :return: Текстовый поток
+    """
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(stream, file_format):
+    """
+    Построчно читает клиентов из потока, не загружая файл в память целиком
+    :param stream: Текстовый поток
+    :param file_format: csv - CSV с заголовком, jsonl - по объекту JSON в строке
+    :return: Генератор пар (номер строки, словарь поле - значение или None, если строку не удалось разобрать)
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+
+
+def validate_row(row):
+    """
+    Проверяет строку файла и приводит ее к формату промежуточной таблицы
+    Имя, фамилия и дата рождения обязательны. Телефон проверяется так же, как
+    в main.insert_phone_num_for_existing_client(), email - через main.check_email_address() без вывода сообщений,
+    неподходящие телефон и email отбрасываются, а клиент загружается без них
+    :param row: Словарь поле - значение
+    :return: Кортеж значений в порядке IMPORT_FIELD_LIST
+    :raise ValueError: Если клиента загрузить нельзя
+    """
+    if row is None:
+        raise ValueError('строка не разобрана')
+
+    values = {}
+
+    for field in IMPORT_FIELD_LIST:
+        value = row.get(field)
+        value = value.strip() if isinstance(value, str) else value
+        if value == '':
+            value = None
+        if isinstance(value, str) and len(value) > FIELD_MAX_LENGTH_DICT.get(field, len(value)):
+            raise ValueError(f'слишком длинное поле {field}')
+        values[field] = value
+
+    if not isinstance(values['first_name'], str) or not isinstance(values['second_name'], str):
+        raise ValueError('не указаны имя или фамилия')
+    if values['third_name'] is not None and not isinstance(values['third_name'], str):
+        raise ValueError('неверное отчество')
+
+    try:
+        date_of_birth = datetime.date.fromisoformat(values['date_of_birth'])
+    except (TypeError, ValueError):
+        raise ValueError('неверная дата рождения') from None
+    if date_of_birth > datetime.date.today():
+        raise ValueError('дата рождения в будущем')
+    values['date_of_birth'] = date_of_birth
+
+    if not main.is_valid_phone_number(values['phone_num']):
+        values['phone_num'] = None
+    if not main.is_valid_email_address(values['email'], quiet=True):
+        values['email'] = None
+
+    return tuple(values[field] for field in IMPORT_FIELD_LIST)
+
+
+# Сопоставление строки промежуточной таблицы с клиентом: совпадают ФИО и дата рождения
+PERSON_MATCH_CONDITION = ("p.second_name = s.second_name "
+                          "AND p.first_name = s.first_name "
+                          "AND p.third_name IS NOT DISTINCT FROM s.third_name "
+                          "AND p.date_of_birth = s.date_of_birth")
+
+
+def create_staging_table(cur):
+    """
+    Создает временную промежуточную таблицу, строки которой удаляются при каждом коммите
+    :param cur: Курсор
+    :return: Ничего не возвращает
+    """
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS client_import_staging("
+                "first_name TEXT NOT NULL,"
+                "second_name TEXT NOT NULL,"
+                "third_name TEXT,"
+                "date_of_birth DATE NOT NULL,"
+                "phone_num_full TEXT,"
+                "email_full TEXT,"
+                "person_id INTEGER) "
+                "ON COMMIT DELETE ROWS;")
+
+
+def merge_staging(cur):
+    """
+    Переносит содержимое промежуточной таблицы в person, phone_number и email_address
+    Строки сопоставляются с существующими клиентами по ФИО и дате рождения (при нескольких совпадениях
+    берется наименьший person_id), для остальных клиенты создаются по одному на сочетание ФИО и даты
+    рождения. Телефоны и email добавляются с ON CONFLICT DO NOTHING, поэтому повторная загрузка
+    того же файла ничего не дублирует
+    :param cur: Курсор
+    :return: Кортеж (добавлено клиентов, добавлено телефонов, добавлено email)
+    """
+    cur.execute("ANALYZE client_import_staging;")
+
+    cur.execute("UPDATE client_import_staging s "
+                f"SET person_id = (SELECT min(p.person_id) FROM person p WHERE {PERSON_MATCH_CONDITION});")
+
+    cur.execute("WITH new_person AS ("
+                "    INSERT INTO person(first_name, second_name, third_name, date_of_birth) "
+                "    SELECT DISTINCT first_name, second_name, third_name, date_of_birth "
+                "    FROM client_import_staging "
+                "    WHERE person_id IS NULL "
+                "    RETURNING person_id, first_name, second_name, third_name, date_of_birth), "
+                "matched AS ("
+                "    UPDATE client_import_staging s "
+                "    SET person_id = p.person_id "
+                "    FROM new_person p "
+                f"    WHERE {PERSON_MATCH_CONDITION}) "
+                "SELECT count(*) FROM new_person;")
+    persons_qty = cur.fetchone()[0]
+
+    cur.execute("INSERT INTO phone_number(phone_num_full, person_id) "
+                "SELECT DISTINCT phone_num_full, person_id "
+                "FROM client_import_staging "
+                "WHERE phone_num_full IS NOT NULL "
+                "ON CONFLICT (phone_num_full, person_id) DO NOTHING;")
+    phones_qty = cur.rowcount
+
+    cur.execute("INSERT INTO email_address(email_full, person_id) "
+                "SELECT DISTINCT email_full, person_id "
+                "FROM client_import_staging "
+                "WHERE email_full IS NOT NULL "
+                "ON CONFLICT (email_full, person_id) DO NOTHING;")
+    emails_qty = cur.rowcount
+
+    return persons_qty, phones_qty, emails_qty
+
+
+def import_clients(connection, stream, file_format, chunk_size=50000, output=True):
+    """
+    Потоковая загрузка клиентов из файла CSV или JSONL
+    Файл читается пачками по chunk_size строк, каждая пачка проверяется, загружается через COPY
+    во временную таблицу, переносится в основные таблицы merge_staging() и коммитится, поэтому расход
+    памяти не зависит от размера файла. Отклоненные строки печатаются в stderr
+    :param connection: Получает соединение с базой данных
+    :param stream: Текстовый поток с содержимым файла
+    :param file_format: csv или jsonl
+    :param chunk_size: Количество строк в одной пачке
+    :param output: Печатать ли отклоненные строки и отчет о загрузке
+    :return: Словарь с количеством прочитанных и отклоненных строк, добавленных клиентов, телефонов, email
+             и скоростью загрузки
+    """
+    rows = read_rows(stream, file_format)
+    result = collections.Counter()
+    start_time = time.perf_counter()
+
+    with connection.cursor() as cur:
+        with main.transaction(connection, savepoint=False):
+            create_staging_table(cur)
+
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            buf = io.StringIO()
+
+            for line_num, row in chunk:
+                try:
+                    values = validate_row(row)
+                except ValueError as e:
+                    result['rejected'] += 1
+                    if output:
+                        print(f'Строка {line_num} отклонена: {e}', file=sys.stderr)
+                    continue
+
+                buf.write('\t'.join(main.copy_value(v) for v in values) + '\n')
+
+            buf.seek(0)
+
+            # Клиенты удаляются из кэша после фиксации пачки
+            with main.transaction(connection, savepoint=False):
+                # Внутри внешней транзакции строки предыдущей пачки еще не удалены при commit
+                cur.execute("TRUNCATE client_import_staging;")
+                cur.copy_expert("COPY client_import_staging(first_name, second_name, third_name, date_of_birth, "
+                                "phone_num_full, email_full) FROM STDIN;", buf)
+
+                persons_qty, phones_qty, emails_qty = merge_staging(cur)
+                main.invalidate_client(cur)
+
+            result['rows'] += len(chunk)
+            result['persons'] += persons_qty
+            result['phones'] += phones_qty
+            result['emails'] += emails_qty
+
+    elapsed = time.perf_counter() - start_time
+    result = {key: result[key] for key in ('rows', 'rejected', 'persons', 'phones', 'emails')}
+    result['elapsed_s'] = round(elapsed, 3)
+    result['rows_per_s'] = round(result['rows'] / elapsed) if elapsed else 0
+
+    if output:
+        print(f'\nПрочитано {result["rows"]} строк, отклонено {result["rejected"]}, добавлено клиентов: '
+              f'{result["persons"]}, телефонов: {result["phones"]}, email: {result["emails"]} '
+              f'за {result["elapsed_s"]} с ({result["rows_per_s"]} строк/с)')
+
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Загрузка клиентов из файла CSV или JSONL')
+    parser.add_argument('path', help='Файл с клиентами, .gz распаковывается на лету, - - stdin')
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help='Формат файла, по умолчанию определяется по расширению')
+    parser.add_argument('--dsn', default='', help='Строка подключения к базе данных')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Количество строк в одной пачке')
+    args = parser.parse_args()
+
+    import_format = args.format or ('csv' if args.path.removesuffix('.gz').endswith('.csv') else 'jsonl')
+
+    conn = psycopg2.connect(args.dsn)
+    main.create_tables(conn)
+    main.create_indexes(conn, concurrently=True)
+
+    import_stream = open_text(args.path)
+
+    # stdin не закрывается после загрузки, остальные файлы закрываются
+    with contextlib.nullcontext(import_stream) if import_stream is sys.stdin else import_stream:
+        import_clients(conn, import_stream, import_format, args.chunk_size)
+
+    conn.close()
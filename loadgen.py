@@ -0,0 +1,319 @@
+import argparse
+import benchmark
+import collections
+import concurrent.futures
+import contextlib
+import json
+import main
+import os
+import psycopg2
+from psycopg2 import errorcodes
+import random
+import time
+
+
+# Доли операций по умолчанию: операция - вес
+OPERATION_MIX_DEFAULT = {'find': 70, 'insert': 10, 'update': 15, 'delete': 5}
+
+# Коды ошибок, которые считаются конфликтами блокировок
+DEADLOCK_CODE_LIST = [errorcodes.DEADLOCK_DETECTED, errorcodes.SERIALIZATION_FAILURE, errorcodes.LOCK_NOT_AVAILABLE]
+
+
+def parse_mix(text):
+    """
+    Разбирает доли операций из строки вида find=70,insert=10,update=15,delete=5
+    :param text: Строка с долями операций
+    :return: Словарь операция - вес
+    :raise ValueError: Если операция неизвестна или вес отрицательный
+    """
+    mix = {}
+
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATION_MIX_DEFAULT:
+            raise ValueError(f'Неизвестная операция {name!r}')
+        mix[name] = int(weight)
+        if mix[name] < 0:
+            raise ValueError(f'Отрицательный вес операции {name!r}')
+
+    if not any(mix.values()):
+        raise ValueError('Нет операций с ненулевым весом')
+
+    return mix
+
+
+def run_find(connection, rng, target_id):
+    """
+    Поиск клиента по person_id, по имени и фамилии или по началу номера телефона
+    Замеряется только выполнение запроса и чтение строк через find_client_aggregated(): одна строка
+    на клиента, без вывода таблицы и без размножения строк по сочетаниям телефонов и email
+    """
+    first_name, second_name, third_name, date_of_birth, phone_num, email = main.generate_data(rng.choice('mf'), rng)
+    kind = rng.randrange(3)
+
+    if kind == 0:
+        main.find_client_aggregated(connection, '', '', '', None, '', '', target_id)
+    elif kind == 1:
+        main.find_client_aggregated(connection, first_name, second_name, '', None, '', '')
+    else:
+        main.find_client_aggregated(connection, '', '', '', None, phone_num[:6] + '%', '')
+
+
+def run_insert(connection, rng, target_id):
+    """
+    Добавление нового клиента с данными из generate_data()
+    :return: person_id нового клиента
+    """
+    return main.insert_new_client_data(connection, main.generate_data(rng.choice('mf'), rng), False)
+
+
+def run_update(connection, rng, target_id):
+    """
+    Изменение имени, фамилии, отчества и даты рождения клиента на данные из generate_data()
+    """
+    first_name, second_name, third_name, date_of_birth, phone_num, email = main.generate_data(rng.choice('mf'), rng)
+    main.update_client(connection, target_id, first_name, second_name, third_name, date_of_birth)
+
+
+def run_delete(connection, rng, target_id):
+    """
+    Удаление клиента
+    """
+    main.delete_client(connection, target_id)
+
+
+# Операции нагрузки: название - функция (соединение, генератор случайных чисел, person_id существующего клиента)
+OPERATION_DICT = {'find': run_find, 'insert': run_insert, 'update': run_update, 'delete': run_delete}
+
+
+def run_worker(worker_id, mix, start_at, duration, id_range, seed, connect_kwargs, separate_process=False):
+    """
+    Выполняет операции в случайном порядке с долями из mix по своему соединению до истечения duration
+    Ошибки откатывают транзакцию и учитываются как замеры с кодом ошибки, но не прерывают работу
+    :param worker_id: Номер исполнителя
+    :param mix: Словарь операция - вес
+    :param start_at: Время начала нагрузки по time.time(), одинаковое для всех исполнителей
+    :param duration: Длительность нагрузки в секундах
+    :param id_range: Пара (наименьший, наибольший) person_id клиентов, к которым применяются поиск,
+                     изменение и удаление
+    :param seed: Начальное значение генератора случайных чисел исполнителя
+    :param connect_kwargs: Параметры подключения, передаются в psycopg2.connect
+    :param separate_process: Исполнитель работает в отдельном процессе: не выводятся сообщения функций main
+    :return: Список замеров (операция, секунда от начала нагрузки, время выполнения в мс, код ошибки или None),
+             код ошибки - SQLSTATE для ошибок базы данных, иначе имя класса исключения
+    """
+    rng = random.Random(seed)
+
+    operations = [OPERATION_DICT[name] for name in mix]
+    weights = list(mix.values())
+    names = list(mix)
+    first_id, last_id = id_range
+    samples = []
+
+    connection = psycopg2.connect(**connect_kwargs)
+    try:
+        time.sleep(max(0.0, start_at - time.time()))
+        stop_at = start_at + duration
+
+        with contextlib.ExitStack() as stack:
+            if separate_process:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+
+            while (now := time.time()) < stop_at:
+                index = rng.choices(range(len(operations)), weights)[0]
+                target_id = rng.randint(first_id, last_id)
+                error_code = None
+
+                start_time = time.perf_counter()
+                try:
+                    operations[index](connection, rng, target_id)
+                except Exception as e:
+                    # Ошибки не только базы данных, например ValueError из проверок main, тоже попадают в замеры
+                    error_code = getattr(e, 'pgcode', None) or type(e).__name__
+                    try:
+                        if connection.closed:
+                            connection = psycopg2.connect(**connect_kwargs)
+                        else:
+                            connection.rollback()
+                    except psycopg2.Error:
+                        # Соединение сломано, но еще не отмечено закрытым, - открывается новое
+                        connection.close()
+                        connection = psycopg2.connect(**connect_kwargs)
+                elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+                samples.append((names[index], now - start_at, elapsed_ms, error_code))
+    finally:
+        connection.close()
+
+    return samples
+
+
+def summarize(samples, elapsed):
+    """
+    Считает пропускную способность, процентили времени выполнения и количество ошибок
+    :param samples: Список замеров из run_worker()
+    :param elapsed: Длительность интервала в секундах
+    :return: Словарь с количеством операций, операций в секунду, ошибок, конфликтов блокировок
+             и результатом benchmark.timing_summary()
+    """
+    error_codes = collections.Counter(error_code for name, t, elapsed_ms, error_code in samples if error_code)
+    result = {'ops': len(samples), 'ops_per_s': round(len(samples) / elapsed, 1) if elapsed else 0,
+              'errors': sum(error_codes.values()),
+              'deadlocks': sum(error_codes[code] for code in DEADLOCK_CODE_LIST),
+              'error_codes': dict(error_codes)}
+
+    if samples:
+        result.update(benchmark.timing_summary([elapsed_ms for name, t, elapsed_ms, error_code in samples]))
+
+    return result
+
+
+def build_report(samples, duration, interval):
+    """
+    Формирует отчет по замерам всех исполнителей: итог по всем операциям, по каждой операции
+    и временной ряд по интервалам
+    :param samples: Список замеров всех исполнителей
+    :param duration: Длительность нагрузки в секундах
+    :param interval: Длина интервала временного ряда в секундах
+    :return: Словарь с итогом total, итогами по операциям operations и списком интервалов series
+    """
+    by_operation = collections.defaultdict(list)
+    by_interval = collections.defaultdict(list)
+
+    for sample in samples:
+        by_operation[sample[0]].append(sample)
+        by_interval[int(sample[1] // interval)].append(sample)
+
+    series = []
+
+    for i in range(max(by_interval, default=-1) + 1):
+        interval_samples = by_interval.get(i, [])
+        # Последний интервал может быть короче остальных
+        interval_elapsed = min(interval, duration - i * interval)
+        point = {'t': round(i * interval, 3), **summarize(interval_samples, interval_elapsed), 'operations': {}}
+
+        for name in sorted({sample[0] for sample in interval_samples}):
+            point['operations'][name] = summarize([sample for sample in interval_samples if sample[0] == name],
+                                                  interval_elapsed)
+        series.append(point)
+
+    return {'total': summarize(samples, duration),
+            'operations': {name: summarize(by_operation[name], duration) for name in sorted(by_operation)},
+            'series': series}
+
+
+def run_load(workers=4, duration=30, mix=None, use_processes=False, interval=1, seed=None, hot_qty=None,
+             output=True, **connect_kwargs):
+    """
+    Нагрузочное тестирование: несколько исполнителей, каждый со своим соединением, одновременно выполняют
+    поиск, добавление, изменение и удаление клиентов через функции main с долями из mix
+    Поиск, изменение и удаление выбирают person_id из диапазона клиентов, существующих на момент запуска,
+    при hot_qty - только из первых hot_qty, чтобы исполнители чаще обращались к одним и тем же записям
+    и конфликтовали за блокировки
+    ВНИМАНИЕ: данные клиентов изменяются и удаляются, запускать только на тестовой базе данных
+    :param workers: Количество исполнителей
+    :param duration: Длительность нагрузки в секундах
+    :param mix: Словарь операция - вес, None - OPERATION_MIX_DEFAULT
+    :param use_processes: Исполнители - процессы, а не потоки. Потоки делят GIL, и при быстрых запросах
+                          клиентская сторона может стать узким местом
+    :param interval: Длина интервала временного ряда в секундах
+    :param seed: Начальное значение генератора случайных чисел
+    :param hot_qty: Количество клиентов, к которым обращаются поиск, изменение и удаление, None - все
+    :param output: Печатать ли отчет
+    :param connect_kwargs: Параметры подключения, передаются в psycopg2.connect
+    :return: Словарь с параметрами нагрузки и результатом build_report()
+    """
+    mix = {name: weight for name, weight in (mix or OPERATION_MIX_DEFAULT).items() if weight > 0}
+
+    connection = psycopg2.connect(**connect_kwargs)
+    try:
+        main.create_tables(connection)
+        main.create_indexes(connection, concurrently=True)
+        with connection.cursor() as cur:
+            cur.execute("SELECT min(person_id), max(person_id) FROM person;")
+            first_id, last_id = cur.fetchone()
+        connection.rollback()
+    finally:
+        connection.close()
+
+    if first_id is None:
+        raise ValueError('Таблица person пуста, сначала загрузите клиентов, например, через seeding.py')
+    if hot_qty:
+        last_id = min(last_id, first_id + hot_qty - 1)
+
+    seeds = [random.Random(seed).getrandbits(32) + worker_id for worker_id in range(workers)]
+    start_at = time.time() + 1
+
+    executor_class = concurrent.futures.ProcessPoolExecutor if use_processes else concurrent.futures.ThreadPoolExecutor
+
+    # Сообщения функций main не выводятся. redirect_stdout заменяет sys.stdout для всего процесса,
+    # поэтому потоки-исполнители перенаправляются здесь один раз, а процессы - каждый у себя
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(run_worker, worker_id, mix, start_at, duration, (first_id, last_id),
+                                   seeds[worker_id], connect_kwargs, use_processes)
+                   for worker_id in range(workers)]
+        samples = [sample for future in futures for sample in future.result()]
+
+    result = {'workers': workers, 'mode': 'processes' if use_processes else 'threads', 'duration_s': duration,
+              'mix': mix, 'id_range': [first_id, last_id], **build_report(samples, duration, interval)}
+
+    if output:
+        print_report(result)
+
+    return result
+
+
+def print_report(result):
+    """
+    Печатает результат run_load()
+    :param result: Результат run_load()
+    """
+    total = result['total']
+    print(f'\nИсполнителей: {result["workers"]} ({result["mode"]}), {result["duration_s"]} с, '
+          f'операций: {total["ops"]} ({total["ops_per_s"]} операций/с), ошибок: {total["errors"]}, '
+          f'конфликтов блокировок: {total["deadlocks"]}')
+
+    print('{:<10}|{:>10}|{:>12}|{:>10}|{:>10}|{:>10}|{:>10}|{:>10}'.format(
+        'Операция', 'Операций', 'Операций/с', 'Ошибок', 'Конфликтов', 'p50, мс', 'p95, мс', 'p99, мс'))
+    print(86 * '-')
+
+    for name, stats in result['operations'].items():
+        print('{:<10}|{:>10}|{:>12}|{:>10}|{:>10}|{:>10}|{:>10}|{:>10}'.format(
+            name, stats['ops'], stats['ops_per_s'], stats['errors'], stats['deadlocks'], stats['median_ms'],
+            stats['p95_ms'], stats['p99_ms']))
+
+    print('\n{:>8}|{:>12}|{:>10}|{:>10}|{:>10}|{:>10}|{:>10}'.format(
+        'Время, с', 'Операций/с', 'Ошибок', 'Конфликтов', 'p50, мс', 'p95, мс', 'p99, мс'))
+    print(76 * '-')
+
+    for point in result['series']:
+        print('{:>8}|{:>12}|{:>10}|{:>10}|{:>10}|{:>10}|{:>10}'.format(
+            point['t'], point['ops_per_s'], point['errors'], point['deadlocks'], point.get('median_ms', '-'),
+            point.get('p95_ms', '-'), point.get('p99_ms', '-')))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Нагрузочное тестирование смешанной нагрузкой из нескольких '
+                                                 'соединений. Данные клиентов изменяются и удаляются')
+    parser.add_argument('--dsn', default='', help='Строка подключения к тестовой базе данных')
+    parser.add_argument('--workers', type=int, default=4, help='Количество исполнителей')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность нагрузки в секундах')
+    parser.add_argument('--mix', type=parse_mix, default=OPERATION_MIX_DEFAULT,
+                        help='Доли операций, например, find=70,insert=10,update=15,delete=5')
+    parser.add_argument('--processes', action='store_true', help='Исполнители - процессы, а не потоки')
+    parser.add_argument('--interval', type=float, default=1, help='Длина интервала временного ряда в секундах')
+    parser.add_argument('--seed', type=int, help='Начальное значение генератора случайных чисел')
+    parser.add_argument('--hot', type=int,
+                        help='Количество клиентов, к которым обращаются поиск, изменение и удаление')
+    parser.add_argument('--output', help='Файл для сохранения результатов в формате JSON')
+    args = parser.parse_args()
+
+    load_result = run_load(args.workers, args.duration, args.mix, args.processes, args.interval, args.seed,
+                           args.hot, dsn=args.dsn)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(load_result, f, indent=2, ensure_ascii=False)
@@ -1,41 +1,624 @@
+import base64
+import collections
+import contextlib
 import datetime
 from datetime import date
+import functools
+import hashlib
+import io
+import itertools
 import psycopg2
-from psycopg2 import sql
+from psycopg2 import extensions, extras, pool, sql
+import query_stats
 import random
+import re
+import select
+import sys
+import threading
+import time
 import transliterate
+import weakref
 
 
-def create_tables(connection):
+# Пул соединений с базой данных и семафор, ограничивающий количество выданных соединений
+connection_pool = None
+connection_pool_semaphore = None
+connection_pool_check_interval = 30
+# Время последнего использования соединения для проверки его работоспособности
+connection_last_used = weakref.WeakKeyDictionary()
+
+
+def init_connection_pool(minconn, maxconn, health_check_interval=30, instrumented=False, **connect_kwargs):
+    """
+    Создает пул соединений с базой данных, из которого функции берут соединения
+    :param minconn: Минимальное количество открытых соединений
+    :param maxconn: Максимальное количество соединений
+    :param health_check_interval: Через сколько секунд простоя соединение проверяется запросом SELECT 1
+    :param instrumented: Собирать ли статистику выполнения запросов (см. query_stats)
+    :param connect_kwargs: Параметры подключения, передаются в psycopg2.connect
+    :return: Ничего не возвращает
+    """
+    global connection_pool, connection_pool_semaphore, connection_pool_check_interval
+
+    if instrumented:
+        connect_kwargs['cursor_factory'] = query_stats.InstrumentedCursor
+
+    connection_pool = pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+    connection_pool_semaphore = threading.BoundedSemaphore(maxconn)
+    connection_pool_check_interval = health_check_interval
+
+
+def close_connection_pool():
+    """
+    Закрывает все соединения пула
+    """
+    global connection_pool
+
+    if connection_pool is not None:
+        connection_pool.closeall()
+        connection_pool = None
+
+
+def connection_is_alive(connection):
+    """
+    Проверяет, что соединение пригодно для работы
+    Соединение, простаивавшее дольше интервала проверки, проверяется запросом SELECT 1
+    :param connection: Соединение из пула
+    :return: TRUE если соединение рабочее FALSE если нет
+    """
+    if connection.closed:
+        return False
+
+    if time.monotonic() - connection_last_used.get(connection, 0) < connection_pool_check_interval:
+        return True
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute("SELECT 1;")
+        connection.rollback()
+    except psycopg2.Error:
+        return False
+
+    return True
+
+
+@contextlib.contextmanager
+def pooled_connection(timeout=30):
+    """
+    Выдает соединение из пула на время выполнения блока with и возвращает его в пул
+    Незавершенная транзакция при возврате соединения откатывается, разорванное соединение закрывается
+    :param timeout: Сколько секунд ждать свободного соединения
+    :return: Соединение с базой данных
+    """
+    if connection_pool is None:
+        raise pool.PoolError('Пул соединений не создан')
+
+    if not connection_pool_semaphore.acquire(timeout=timeout):
+        raise pool.PoolError(f'Нет свободных соединений в течение {timeout} с')
+
+    try:
+        connection = connection_pool.getconn()
+        while not connection_is_alive(connection):
+            connection_pool.putconn(connection, close=True)
+            connection = connection_pool.getconn()
+
+        broken = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken and not connection.closed \
+                    and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            connection_last_used[connection] = time.monotonic()
+            connection_pool.putconn(connection, close=broken or bool(connection.closed))
+    finally:
+        connection_pool_semaphore.release()
+
+
+# Открытые на соединениях единицы работы: соединение - UnitOfWork
+units_of_work = weakref.WeakKeyDictionary()
+
+
+class UnitOfWork:
+    """
+    Транзакция, открытая transaction() на соединении, к которой присоединяются функции изменения данных
+    """
+
+    def __init__(self, connection, group_size=None, group_interval_ms=None, synchronous_commit=True):
+        self.connection = connection
+        self.group_size = group_size
+        self.group_interval_ms = group_interval_ms
+        self.synchronous_commit = synchronous_commit
+        # Количество вложенных блоков transaction() внутри внешнего
+        self.depth = 0
+        self.pending_qty = 0
+        self.commits_qty = 0
+        self.group_start_time = time.monotonic()
+        self.settings_applied = False
+        # Клиенты, измененные в незафиксированной транзакции, удаляются из кэша только после commit,
+        # иначе другое соединение может успеть прочитать и вернуть в кэш старую запись
+        self.invalidated_ids = set()
+        self.invalidate_all = False
+
+    def invalidate(self, person_id=None):
+        """
+        Отмечает клиента для удаления из кэша после фиксации транзакции
+        :param person_id: id клиента, None - очистить весь кэш
+        """
+        if person_id is None:
+            self.invalidate_all = True
+        else:
+            self.invalidated_ids.add(person_id)
+
+    def apply_settings(self):
+        """
+        Выполняет SET LOCAL в начале каждой транзакции, поскольку он действует только до ее конца
+        """
+        if not self.synchronous_commit and not self.settings_applied:
+            with self.connection.cursor() as cur:
+                cur.execute("SET LOCAL synchronous_commit = off;")
+            self.settings_applied = True
+
+    def flush(self):
+        """
+        Фиксирует накопленные операции, не дожидаясь конца группы
+        """
+        self.connection.commit()
+        self.commits_qty += 1
+        self.pending_qty = 0
+        self.group_start_time = time.monotonic()
+        self.settings_applied = False
+
+        if self.invalidate_all or self.invalidated_ids:
+            drop_cached_clients(None if self.invalidate_all else self.invalidated_ids)
+            self.invalidated_ids = set()
+            self.invalidate_all = False
+
+    def flush_due(self):
+        """
+        Проверяет, пора ли в режиме группового коммита фиксировать группу
+        :return: TRUE если набралось group_size операций или с начала группы прошло group_interval_ms
+                 и транзакция открыта
+        """
+        if self.group_size and self.pending_qty >= self.group_size:
+            return True
+
+        return self.group_interval_ms is not None \
+            and (time.monotonic() - self.group_start_time) * 1000 >= self.group_interval_ms \
+            and self.connection.get_transaction_status() == extensions.TRANSACTION_STATUS_INTRANS
+
+    def flush_if_due(self):
+        """
+        Фиксирует группу, если это пора сделать по flush_due(). Вызывается при входе во вложенный блок
+        и выходе из него, а также может вызываться владельцем единицы работы между операциями
+        """
+        if self.depth == 0 and self.flush_due():
+            self.flush()
+
+    def operation_done(self):
+        """
+        Учитывает завершенную операцию и в режиме группового коммита фиксирует группу, если пора
+        """
+        self.pending_qty += 1
+        self.flush_if_due()
+
+
+@contextlib.contextmanager
+def transaction(connection, savepoint=True, group_size=None, group_interval_ms=None, synchronous_commit=True):
+    """
+    Единица работы: изменения данных внутри блока with выполняются в одной транзакции,
+    которая фиксируется при выходе из блока и откатывается при исключении
+    Функции изменения данных открывают этот блок сами, поэтому вне transaction() каждая из них по-прежнему
+    фиксирует свои изменения, а внутри - присоединяется к внешней транзакции и не делает commit
+    Вложенный блок с savepoint создает точку сохранения, и исключение в нем откатывает только его изменения
+    В режиме группового коммита (group_size или group_interval_ms) внешний блок фиксирует транзакцию каждые
+    group_size операций или group_interval_ms миллисекунд. Операция - завершившийся без исключения вложенный
+    блок первого уровня, например, вызов функции изменения данных. При исключении во внешнем блоке
+    откатываются только операции после последней фиксации
+    :param connection: Соединение с базой данных
+    :param savepoint: Создавать ли точку сохранения для вложенного блока
+    :param group_size: Фиксировать транзакцию каждые group_size операций, None - только при выходе из блока
+    :param group_interval_ms: Фиксировать транзакцию, если с предыдущей фиксации прошло столько миллисекунд,
+                              None - не фиксировать по времени
+    :param synchronous_commit: FALSE - выполнять в каждой транзакции SET LOCAL synchronous_commit = off,
+                               commit не ждет записи WAL на диск. При сбое сервера последние зафиксированные
+                               транзакции могут потеряться, но целостность базы данных не нарушается.
+                               Подходит для массовых загрузок, которые можно повторить
+    :return: Объект UnitOfWork внешнего блока
+    """
+    unit = units_of_work.get(connection)
+
+    if unit is None:
+        unit = units_of_work[connection] = UnitOfWork(connection, group_size, group_interval_ms, synchronous_commit)
+        try:
+            unit.apply_settings()
+            yield unit
+            unit.flush()
+        except BaseException:
+            if not connection.closed:
+                connection.rollback()
+            raise
+        finally:
+            del units_of_work[connection]
+        return
+
+    # Группа, время которой истекло, пока единица работы простаивала, фиксируется до начала новой операции
+    unit.flush_if_due()
+
+    unit.depth += 1
+    savepoint_name = f'unit_of_work_{unit.depth}' if savepoint else None
+    try:
+        unit.apply_settings()
+        if savepoint_name:
+            with connection.cursor() as cur:
+                cur.execute(f"SAVEPOINT {savepoint_name};")
+
+        try:
+            yield unit
+        except BaseException:
+            if savepoint_name and not connection.closed:
+                with connection.cursor() as cur:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint_name};")
+                    cur.execute(f"RELEASE SAVEPOINT {savepoint_name};")
+            raise
+
+        if savepoint_name:
+            with connection.cursor() as cur:
+                cur.execute(f"RELEASE SAVEPOINT {savepoint_name};")
+    finally:
+        unit.depth -= 1
+
+    if unit.depth == 0:
+        unit.operation_done()
+
+
+def create_tables(connection, partitions=None):
     """
-    Создает таблицы
+    Создает таблицы. Индексы создаются отдельным шагом create_indexes()
     :param connection: На вход получает соединение с базой данных
+    :param partitions: Количество секций, на которые таблицы делятся по хэшу person_id, None - таблицы без секций
+                       Уже секционированные таблицы остаются как есть, таблицы без секций переводит
+                       в секционированные migrate_to_partitioned()
     :return: Ничего не возвращает (надо бы подумать над обработкой исключений)
+    :raise ValueError: Если заданы секции, а таблица person уже создана без них
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('person');")
+        row = cur.fetchone()
+
+    if partitions and row is not None and row[0] != 'p':
+        raise ValueError('Таблица person уже создана без секций, '
+                         'для перевода в секционированные используйте migrate_to_partitioned()')
+
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        if partitions:
+            # Секции уже секционированных таблиц не меняются: секции с другим модулем конфликтовали бы с ними
+            if row is None:
+                create_partitioned_tables(cur, partitions)
+        else:
+            cur.execute("CREATE TABLE IF NOT EXISTS person("
+                        "person_id SERIAL PRIMARY KEY,"
+                        "first_name VARCHAR(40) NOT NULL,"
+                        "second_name VARCHAR(50) NOT NULL,"
+                        "third_name VARCHAR(50),"
+                        "date_of_birth DATE NOT NULL CHECK (date_of_birth <= CURRENT_DATE));")
+
+            cur.execute("CREATE TABLE IF NOT EXISTS phone_number("
+                        "phone_num_full VARCHAR(15) NOT NULL,"
+                        "person_id INTEGER NOT NULL,"
+                        "PRIMARY KEY (phone_num_full, person_id),"
+                        "FOREIGN KEY (person_id)"
+                        "    REFERENCES person (person_id) ON DELETE CASCADE);")
+
+            cur.execute("CREATE TABLE IF NOT EXISTS email_address("
+                        "email_full VARCHAR(250) NOT NULL,"
+                        "person_id INTEGER NOT NULL,"
+                        "PRIMARY KEY (email_full, person_id),"
+                        "FOREIGN KEY (person_id)"
+                        "    REFERENCES person (person_id) ON DELETE CASCADE);")
+
+    migrate_cascade_foreign_keys(connection)
+    repair_client_view_triggers(connection)
+
+
+def create_partitioned_tables(cur, partitions):
+    """
+    Создает таблицы person, phone_number и email_address, секционированные по хэшу person_id
+    Секции всех трех таблиц совпадают, поэтому клиент, его телефоны и email всегда лежат в секциях с одним
+    номером, а поиск, соединение и удаление по person_id затрагивают только эти секции
+    person_id выдается из последовательности person_person_id_seq, как у столбца SERIAL
+    Транзакция не фиксируется
+    :param cur: Курсор
+    :param partitions: Количество секций
+    :return: Ничего не возвращает
+    """
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS person_person_id_seq AS INTEGER;")
+
+    cur.execute("CREATE TABLE IF NOT EXISTS person("
+                "person_id INTEGER NOT NULL DEFAULT nextval('person_person_id_seq'),"
+                "first_name VARCHAR(40) NOT NULL,"
+                "second_name VARCHAR(50) NOT NULL,"
+                "third_name VARCHAR(50),"
+                "date_of_birth DATE NOT NULL CHECK (date_of_birth <= CURRENT_DATE),"
+                "PRIMARY KEY (person_id)) "
+                "PARTITION BY HASH (person_id);")
+
+    cur.execute("ALTER SEQUENCE person_person_id_seq OWNED BY person.person_id;")
+
+    cur.execute("CREATE TABLE IF NOT EXISTS phone_number("
+                "phone_num_full VARCHAR(15) NOT NULL,"
+                "person_id INTEGER NOT NULL,"
+                "PRIMARY KEY (phone_num_full, person_id),"
+                "FOREIGN KEY (person_id)"
+                "    REFERENCES person (person_id) ON DELETE CASCADE) "
+                "PARTITION BY HASH (person_id);")
+
+    cur.execute("CREATE TABLE IF NOT EXISTS email_address("
+                "email_full VARCHAR(250) NOT NULL,"
+                "person_id INTEGER NOT NULL,"
+                "PRIMARY KEY (email_full, person_id),"
+                "FOREIGN KEY (person_id)"
+                "    REFERENCES person (person_id) ON DELETE CASCADE) "
+                "PARTITION BY HASH (person_id);")
+
+    for table_name in ('person', 'phone_number', 'email_address'):
+        for remainder in range(partitions):
+            cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} "
+                                "FOR VALUES WITH (MODULUS %s, REMAINDER %s);").
+                        format(sql.Identifier(f'{table_name}_p{remainder}'), sql.Identifier(table_name)),
+                        (partitions, remainder))
+
+
+def tables_partitioned(connection):
+    """
+    Проверяет, секционирована ли таблица person
+    :param connection: Получает соединение с базой данных
+    :return: TRUE если таблица секционирована FALSE если нет или ее не существует
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('person');")
+        row = cur.fetchone()
+
+    return bool(row and row[0])
+
+
+def migrate_to_partitioned(connection, partitions=16, output=True):
+    """
+    Переводит существующие таблицы без секций в секционированные по хэшу person_id
+    Индексы из INDEX_LIST и TRIGRAM_INDEX_LIST удаляются, старые таблицы переименовываются, данные переносятся
+    в новые таблицы и старые таблицы удаляются в одной транзакции, в ней же на новых таблицах создаются
+    триггеры client_view, если она есть, и она заполняется заново. Затем индексы строятся заново
+    На время переноса таблицы заблокированы, поэтому миграцию нужно выполнять в окно обслуживания
+    :param connection: Получает соединение с базой данных
+    :param partitions: Количество секций
+    :param output: Печатать ли ход миграции
+    :return: TRUE если таблицы переведены FALSE если они уже секционированы
     """
+    if tables_partitioned(connection):
+        if output:
+            print('Таблицы уже секционированы')
+        return False
 
     with connection.cursor() as cur:
-        cur.execute("CREATE TABLE IF NOT EXISTS person("
-                    "person_id SERIAL PRIMARY KEY,"
-                    "first_name VARCHAR(40) NOT NULL,"
-                    "second_name VARCHAR(50) NOT NULL,"
-                    "third_name VARCHAR(50),"
-                    "date_of_birth DATE NOT NULL CHECK (date_of_birth <= CURRENT_DATE));")
+        cur.execute("SELECT count(*) > 0 FROM pg_class WHERE relname = ANY(%s) AND relkind = 'i';",
+                    ([index_name for index_name, table_name, column in TRIGRAM_INDEX_LIST],))
+        trigram_indexes = cur.fetchone()[0]
+
+    start_time = time.perf_counter()
+
+    drop_indexes(connection)
+    drop_trigram_indexes(connection)
+
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        # Последовательность переходит к новой таблице person, имена первичных ключей освобождаются для новых таблиц
+        cur.execute("ALTER SEQUENCE person_person_id_seq OWNED BY NONE;")
+
+        for table_name in ('person', 'phone_number', 'email_address'):
+            cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").
+                        format(sql.Identifier(table_name), sql.Identifier(f'{table_name}_unpartitioned')))
+            cur.execute(sql.SQL("ALTER INDEX IF EXISTS {} RENAME TO {};").
+                        format(sql.Identifier(f'{table_name}_pkey'),
+                               sql.Identifier(f'{table_name}_unpartitioned_pkey')))
+
+        create_partitioned_tables(cur, partitions)
 
-        cur.execute("CREATE TABLE IF NOT EXISTS phone_number("
-                    "phone_num_full VARCHAR(15) NOT NULL,"
-                    "person_id INTEGER NOT NULL,"
-                    "PRIMARY KEY (phone_num_full, person_id),"
-                    "FOREIGN KEY (person_id)"
-                    "    REFERENCES person (person_id));")
+        cur.execute("INSERT INTO person(person_id, first_name, second_name, third_name, date_of_birth) "
+                    "SELECT person_id, first_name, second_name, third_name, date_of_birth "
+                    "FROM person_unpartitioned;")
+        persons_qty = cur.rowcount
+        cur.execute("INSERT INTO phone_number(phone_num_full, person_id) "
+                    "SELECT phone_num_full, person_id FROM phone_number_unpartitioned;")
+        cur.execute("INSERT INTO email_address(email_full, person_id) "
+                    "SELECT email_full, person_id FROM email_address_unpartitioned;")
 
-        cur.execute("CREATE TABLE IF NOT EXISTS email_address("
-                    "email_full VARCHAR(250) NOT NULL,"
-                    "person_id INTEGER NOT NULL,"
-                    "PRIMARY KEY (email_full, person_id),"
-                    "FOREIGN KEY (person_id)"
-                    "    REFERENCES person (person_id));")
+        cur.execute("DROP TABLE phone_number_unpartitioned, email_address_unpartitioned, person_unpartitioned;")
 
-        connection.commit()
+        # Триггеры client_view удалены вместе со старыми таблицами и создаются на новых в этой же транзакции
+        repair_client_view_triggers(connection)
+
+        invalidate_client(cur)
+
+    create_indexes(connection)
+    if trigram_indexes:
+        create_trigram_indexes(connection)
+
+    if output:
+        print(f'Перенесено {persons_qty} клиентов в {partitions} секций за {time.perf_counter() - start_time:.2f} с')
+
+    return True
+
+
+def migrate_cascade_foreign_keys(connection):
+    """
+    Переводит внешние ключи phone_number и email_address на person в режим ON DELETE CASCADE
+    для баз данных, созданных до появления каскадного удаления. Ключ пересоздается как NOT VALID
+    и затем проверяется отдельно, чтобы не блокировать запись в таблицы на время проверки
+    Внутри transaction() оба шага выполняются в транзакции единицы работы
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT conrelid::regclass::text, conname "
+                    "FROM pg_constraint "
+                    "WHERE contype = 'f' "
+                    "AND confrelid = 'person'::regclass "
+                    "AND conrelid IN ('phone_number'::regclass, 'email_address'::regclass) "
+                    "AND confdeltype <> 'c';")
+
+        for table_name, constraint_name in cur.fetchall():
+            with transaction(connection, savepoint=False):
+                cur.execute(sql.SQL("ALTER TABLE {0} DROP CONSTRAINT {1}, "
+                                    "ADD CONSTRAINT {1} FOREIGN KEY (person_id) "
+                                    "REFERENCES person (person_id) ON DELETE CASCADE NOT VALID;").
+                            format(sql.Identifier(table_name), sql.Identifier(constraint_name)))
+            with transaction(connection, savepoint=False):
+                cur.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {};").
+                            format(sql.Identifier(table_name), sql.Identifier(constraint_name)))
+
+
+# Индексы для поиска клиентов: person_id в дочерних таблицах для соединений и удаления,
+# btree по ФИО и дате рождения для точного поиска и сопоставления клиентов при загрузке из файла,
+# text_pattern_ops для поиска по префиксу LIKE 'Ива%'
+INDEX_LIST = [
+    ('phone_number_person_id_idx', 'phone_number', 'person_id'),
+    ('email_address_person_id_idx', 'email_address', 'person_id'),
+    ('person_date_of_birth_idx', 'person', 'date_of_birth'),
+    ('person_full_name_date_of_birth_idx', 'person', 'second_name, first_name, date_of_birth'),
+    ('person_second_name_pattern_idx', 'person', 'second_name text_pattern_ops'),
+    ('person_first_name_pattern_idx', 'person', 'first_name text_pattern_ops'),
+    ('person_third_name_pattern_idx', 'person', 'third_name text_pattern_ops'),
+    ('phone_number_phone_num_full_pattern_idx', 'phone_number', 'phone_num_full text_pattern_ops'),
+    ('email_address_email_full_pattern_idx', 'email_address', 'email_full text_pattern_ops'),
+]
+
+# Индексы, которые больше не создаются и удаляются create_indexes(): поиск по фамилии обслуживают
+# person_full_name_date_of_birth_idx и person_second_name_pattern_idx, поиск по имени и отчеству на равенство
+# и по префиксу - индексы text_pattern_ops
+OBSOLETE_INDEX_LIST = ['person_second_name_idx', 'person_first_name_idx', 'person_third_name_idx']
+
+
+def index_validity(cur):
+    """
+    Находит уже созданные индексы из INDEX_LIST
+    :param cur: Курсор
+    :return: Словарь имя индекса - TRUE если индекс рабочий FALSE если его построение было прервано
+    """
+    cur.execute("SELECT index_name, indisvalid FROM unnest(%s) AS index_name "
+                "JOIN pg_index ON indexrelid = to_regclass(index_name);",
+                ([index_name for index_name, table_name, index_definition in INDEX_LIST],))
+
+    return dict(cur.fetchall())
+
+
+def create_indexes(connection, concurrently=False):
+    """
+    Создает индексы из INDEX_LIST, если их еще нет, и удаляет индексы из OBSOLETE_INDEX_LIST
+    Без concurrently индексы строятся в одной транзакции, которая до своего конца блокирует запись в таблицы
+    клиентов, это подходит для пустых таблиц и массовой загрузки. С concurrently каждый индекс строится
+    CREATE INDEX CONCURRENTLY вне транзакции и не блокирует запись, так индексы создаются на работающей
+    базе данных. Секционированные таблицы не поддерживают CONCURRENTLY, их индексы всегда строятся в транзакции
+    Индекс, построение которого было прервано, остается нерабочим, удаляется и строится заново
+    Статистика таблиц обновляется, только если был создан хотя бы один индекс, чтобы обычный запуск
+    с уже созданными индексами не выполнял ANALYZE всех таблиц
+    :param connection: Получает соединение с базой данных
+    :param concurrently: Строить ли индексы без блокировки записи. Соединение не должно быть в транзакции
+    :return: Количество созданных индексов
+    """
+    if concurrently and not connection.autocommit:
+        # CREATE INDEX CONCURRENTLY нельзя выполнить внутри транзакции
+        connection.autocommit = True
+        try:
+            return create_indexes(connection, concurrently)
+        finally:
+            connection.autocommit = False
+
+    concurrently = concurrently and not tables_partitioned(connection)
+    concurrently_sql = sql.SQL(' CONCURRENTLY' if concurrently else '')
+
+    with contextlib.nullcontext() if concurrently else transaction(connection, savepoint=False), \
+            connection.cursor() as cur:
+        existing_index_dict = index_validity(cur)
+        created_qty = 0
+
+        for index_name, table_name, index_definition in INDEX_LIST:
+            if existing_index_dict.get(index_name):
+                continue
+            if index_name in existing_index_dict:
+                cur.execute(sql.SQL("DROP INDEX{} IF EXISTS {};").format(concurrently_sql, sql.Identifier(index_name)))
+            cur.execute(sql.SQL("CREATE INDEX{} IF NOT EXISTS {} ON {} ({});").
+                        format(concurrently_sql, sql.Identifier(index_name), sql.Identifier(table_name),
+                               sql.SQL(index_definition)))
+            created_qty += 1
+
+        for index_name in OBSOLETE_INDEX_LIST:
+            cur.execute(sql.SQL("DROP INDEX{} IF EXISTS {};").format(concurrently_sql, sql.Identifier(index_name)))
+
+        if created_qty:
+            cur.execute("ANALYZE person, phone_number, email_address;")
+
+    return created_qty
+
+
+def drop_indexes(connection):
+    """
+    Удаляет индексы из INDEX_LIST, например, перед массовой загрузкой данных
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        for index_name, table_name, index_definition in INDEX_LIST:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(index_name)))
+
+
+# Триграммные индексы GIN расширения pg_trgm для поиска по подстроке LIKE/ILIKE '%ov%' и поиска похожих значений
+TRIGRAM_INDEX_LIST = [
+    ('person_first_name_trgm_idx', 'person', 'first_name'),
+    ('person_second_name_trgm_idx', 'person', 'second_name'),
+    ('person_third_name_trgm_idx', 'person', 'third_name'),
+    ('phone_number_phone_num_full_trgm_idx', 'phone_number', 'phone_num_full'),
+    ('email_address_email_full_trgm_idx', 'email_address', 'email_full'),
+]
+
+
+def create_trigram_indexes(connection):
+    """
+    Подключает расширение pg_trgm и создает индексы из TRIGRAM_INDEX_LIST, если их еще нет
+    Для создания расширения нужны права на CREATE в базе данных
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+
+        for index_name, table_name, column in TRIGRAM_INDEX_LIST:
+            cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING gin ({} gin_trgm_ops);").
+                        format(sql.Identifier(index_name), sql.Identifier(table_name), sql.Identifier(column)))
+
+        cur.execute("ANALYZE person, phone_number, email_address;")
+
+
+def drop_trigram_indexes(connection):
+    """
+    Удаляет индексы из TRIGRAM_INDEX_LIST
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        for index_name, table_name, column in TRIGRAM_INDEX_LIST:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(index_name)))
+
+
+# Списки, из которых генерируются данные клиентов
+MALE_FIRST_NAME_LIST = ['Алексей', 'Егор', 'Федор', 'Михаил', 'Петр', 'Сергей', 'Марк', 'Степан', 'Андрей', 'Жорж']
+FEMALE_FIRST_NAME_LIST = ['Арина', 'Мария', 'Злата', 'Петра', 'Светлана', 'Ирина', 'Жанна', 'Виктория', 'Екатерина',
+                          'Татьяна']
+MALE_SECOND_NAME_LIST = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Соколов', 'Михайлов',
+                         'Васильев', 'Федоров']
+DOMAIN_LIST = ['mail.ru', 'gmail.com', 'yandex.ru', 'ya.ru', 'hotmail.com', 'rambler.ru', 'yahoo.com', 'mail.com',
+               'outlook.com', 'protonmail.com']
 
 
 def make_third_name(first_name, sex):
@@ -64,117 +647,240 @@ def make_third_name(first_name, sex):
     return third_name
 
 
-def generate_phone_num():
+def generate_phone_num(rng=random):
     """
     Генерирует номер телефона, состоящий из 11 - 15 цифр
+    :param rng: Генератор случайных чисел, по умолчанию общий генератор модуля random
     :return: Возвращает строку номера
     """
     phone_num = ''
-    phone_num_len = random.randrange(11, 16)
+    phone_num_len = rng.randrange(11, 16)
 
     for i in range(phone_num_len):
         if i == 0:
-            phone_num += str(random.randrange(1, 10))
+            phone_num += str(rng.randrange(1, 10))
         else:
-            phone_num += str(random.randrange(0, 10))
+            phone_num += str(rng.randrange(0, 10))
 
     return phone_num
 
 
-def generate_email_address(s_name, f_name, t_name):
+def generate_email_address(s_name, f_name, t_name, rng=random):
     """
     Генерирует email адрес, используя имя, фамилию, отчество и список доменов
     Для переданных имени и фамилии выполняется транслитерация
     :param f_name: Имя
     :param s_name: Фамилия
     :param t_name: Отчество
+    :param rng: Генератор случайных чисел, по умолчанию общий генератор модуля random
     :return: Возвращает строку email адреса
     """
-    domain_list = ['mail.ru', 'gmail.com', 'yandex.ru', 'ya.ru', 'hotmail.com', 'rambler.ru', 'yahoo.com', 'mail.com',
-                   'outlook.com', 'protonmail.com']
-
-    choice = random.randrange(1, 6)
+    choice = rng.randrange(1, 6)
 
     if choice == 1:
-        email_address = f'{f_name[0]}.{t_name[0]}.{s_name}@{random.choice(domain_list)}'
+        email_address = f'{f_name[0]}.{t_name[0]}.{s_name}@{rng.choice(DOMAIN_LIST)}'
     elif choice == 2:
-        email_address = f'{f_name[0]}-{t_name[0]}-{s_name}@{random.choice(domain_list)}'
+        email_address = f'{f_name[0]}-{t_name[0]}-{s_name}@{rng.choice(DOMAIN_LIST)}'
     elif choice == 3:
-        email_address = f'{f_name[0]}_{t_name[0]}_{s_name}@{random.choice(domain_list)}'
+        email_address = f'{f_name[0]}_{t_name[0]}_{s_name}@{rng.choice(DOMAIN_LIST)}'
     elif choice == 4:
-        email_address = f'{f_name}.{s_name}@{random.choice(domain_list)}'
+        email_address = f'{f_name}.{s_name}@{rng.choice(DOMAIN_LIST)}'
     elif choice == 5:
-        email_address = f'{f_name}-{s_name}@{random.choice(domain_list)}'
+        email_address = f'{f_name}-{s_name}@{rng.choice(DOMAIN_LIST)}'
     elif choice == 6:
-        email_address = f'{f_name}_{s_name}@{random.choice(domain_list)}'
+        email_address = f'{f_name}_{s_name}@{rng.choice(DOMAIN_LIST)}'
 
     return transliterate.translit(email_address, reversed=True).lower()
 
 
-def generate_data(sex):
+def generate_data(sex, rng=random):
     """
     Генерирует кортеж данных одного клиента из заранее подготовленных списков
-    На вход принимает строку из одного символа, соответствующую полу клиента - 'm' - мужчина, 'f' - женщина
+    На вход принимает строку из одного символа, соответствующую полу клиента - 'm' - мужчина, 'f' - женщина,
+    и генератор случайных чисел rng, по умолчанию общий генератор модуля random. С отдельным генератором
+    с заданным начальным значением данные воспроизводятся независимо от других потоков
     :return: Возвращает кортеж с данными в формате first_name, second_name, third_name, date_of_birth,
              phone_num_full, email_full
     """
 
-    male_first_name_list = ['Алексей', 'Егор', 'Федор', 'Михаил', 'Петр', 'Сергей', 'Марк', 'Степан', 'Андрей', 'Жорж']
-    female_first_name_list = ['Арина', 'Мария', 'Злата', 'Петра', 'Светлана', 'Ирина', 'Жанна', 'Виктория', 'Екатерина',
-                              'Татьяна']
-    male_second_name_list = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Соколов', 'Михайлов',
-                             'Васильев', 'Федоров']
-
     if sex == 'm':
-        first_name = random.choice(male_first_name_list)
-        third_name = make_third_name(random.choice(male_first_name_list), 'm')
-        second_name = random.choice(male_second_name_list)
+        first_name = rng.choice(MALE_FIRST_NAME_LIST)
+        third_name = make_third_name(rng.choice(MALE_FIRST_NAME_LIST), 'm')
+        second_name = rng.choice(MALE_SECOND_NAME_LIST)
     elif sex == 'f':
-        first_name = random.choice(female_first_name_list)
-        third_name = make_third_name(random.choice(male_first_name_list), 'f')
-        second_name = random.choice(male_second_name_list) + 'а'
+        first_name = rng.choice(FEMALE_FIRST_NAME_LIST)
+        third_name = make_third_name(rng.choice(MALE_FIRST_NAME_LIST), 'f')
+        second_name = rng.choice(MALE_SECOND_NAME_LIST) + 'а'
 
-    date_of_birth = str(datetime.date(random.randrange(1960, 2022), random.randrange(1, 13), random.randrange(1, 29)))
-    phone_num_full = generate_phone_num()
-    email_full = generate_email_address(second_name, first_name, third_name)
+    date_of_birth = str(datetime.date(rng.randrange(1960, 2022), rng.randrange(1, 13), rng.randrange(1, 29)))
+    phone_num_full = generate_phone_num(rng)
+    email_full = generate_email_address(second_name, first_name, third_name, rng)
 
     return first_name, second_name, third_name, date_of_birth, phone_num_full, email_full
 
 
-def print_table(table_list):
+# Заголовки и ширина столбцов таблицы, которую печатает print_table()
+TABLE_COLUMN_LIST = ['ID', 'Имя', 'Отчество', 'Фамилия', 'Дата рождения', 'Номер телефона', 'email']
+TABLE_COLUMN_WIDTH_LIST = [8, 16, 20, 20, 20, 25, 35]
+# Результаты find_client_similar() печатаются с дополнительным столбцом сходства
+SIMILAR_COLUMN_LIST = TABLE_COLUMN_LIST + ['Сходство']
+SIMILAR_COLUMN_WIDTH_LIST = TABLE_COLUMN_WIDTH_LIST + [10]
+
+# Сколько записей показывать на одной странице при постраничном выводе в меню
+TABLE_PAGE_SIZE = 100
+
+
+def format_cell(value):
+    """
+    Преобразует значение поля в текст ячейки таблицы
+    :param value: Значение поля
+    :return: Пустая строка для NULL, дата в формате ISO, элементы списка через запятую
+    """
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(format_cell(v) for v in value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    return str(value)
+
+
+def table_widths(rows, columns=TABLE_COLUMN_LIST):
+    """
+    Подбирает ширину столбцов по содержимому
+    :param rows: Список записей, в которых значения уже преобразованы format_cell()
+    :param columns: Заголовки столбцов
+    :return: Список ширин столбцов, не меньше ширины заголовка
+    """
+    widths = [len(column) + 2 for column in columns]
+
+    for row in rows:
+        for i, cell in enumerate(row):
+            widths[i] = max(widths[i], len(cell) + 2)
+
+    return widths
+
+
+def print_table(table_list, page_size=None, autofit=False, chunk_size=1000, columns=TABLE_COLUMN_LIST,
+                column_widths=TABLE_COLUMN_WIDTH_LIST):
     """
     Печатает таблицу в красивом виде
-    :param table_list: Список кортежей с записями для печати
-                       Формат записи: (id, fname, sname, tname, date_of_birth, phone_num, email_address)
+    Записи форматируются пачками, и каждая пачка выводится одним вызовом sys.stdout.write,
+    итератор читается по мере вывода, поэтому подходит для потоковых результатов find_client_iter()
+    :param table_list: Список или итератор кортежей с записями для печати
+                       Формат записи: (id, fname, sname, tname, date_of_birth, phone_num, email_address),
+                       телефоны и email могут быть списками, как в find_client_aggregated(), любое поле может быть NULL
+    :param page_size: Количество записей на странице, после каждой страницы выводится запрос на продолжение,
+                      None - выводить все записи без остановки
+    :param autofit: Подбирать ширину столбцов по содержимому первой страницы или пачки
+    :param chunk_size: Количество записей в одной пачке вывода без постраничного режима
+    :param columns: Заголовки столбцов, например SIMILAR_COLUMN_LIST для результатов find_client_similar()
+    :param column_widths: Ширина столбцов без подбора по содержимому
+    :return: Количество выведенных записей
+    :raise ValueError: Если количество полей записи не совпадает с количеством столбцов
     """
+    rows = iter(table_list)
+    printed_qty = 0
+
+    def next_chunk():
+        chunk_rows = [[format_cell(v) for v in row] for row in itertools.islice(rows, page_size or chunk_size)]
+        # Без проверки лишние поля молча отбрасывались бы форматированием строки
+        if any(len(row) != len(columns) for row in chunk_rows):
+            raise ValueError(f'Количество полей записи не совпадает с количеством столбцов {len(columns)}')
+        return chunk_rows
+
+    chunk = next_chunk()
+
+    widths = table_widths(chunk, columns) if autofit else column_widths
+    row_format = ''.join(f'|{{:^{width}}}' for width in widths) + '|\n'
+    line = (len(widths) + 1 + sum(widths)) * '-' + '\n'
+    sys.stdout.write('\n' + line + row_format.format(*columns) + line)
+
+    while chunk:
+        sys.stdout.write(''.join(row_format.format(*row) for row in chunk))
+        printed_qty += len(chunk)
+
+        # Следующая страница читается до запроса на продолжение, чтобы не спрашивать, если записей больше нет
+        chunk = next_chunk()
+
+        if chunk and page_size is not None:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            if input(f'Показано {printed_qty} записей. Нажмите ввод, чтобы продолжить, '
+                     f'или введите q для выхода: ').strip().lower() == 'q':
+                return printed_qty
+
+    sys.stdout.write(line)
+    sys.stdout.flush()
+
+    return printed_qty
+
+
+# Тексты запросов изменения клиентов, общие для функций этого модуля и их асинхронных версий в async_client
+INSERT_PERSON_QUERY = ("INSERT INTO person(first_name, second_name, third_name, date_of_birth) "
+                       "VALUES (%s, %s, %s, %s) "
+                       "RETURNING person_id;")
+INSERT_PHONE_QUERY = "INSERT INTO phone_number(phone_num_full, person_id) VALUES (%s, %s);"
+INSERT_EMAIL_QUERY = "INSERT INTO email_address(email_full, person_id) VALUES (%s, %s);"
+# Запросы для многострочной вставки в формате extras.execute_values(), см. build_values_query()
+INSERT_PERSONS_VALUES_QUERY = ("INSERT INTO person(person_id, first_name, second_name, third_name, date_of_birth) "
+                               "VALUES %s;")
+INSERT_PHONES_VALUES_QUERY = "INSERT INTO phone_number(phone_num_full, person_id) VALUES %s;"
+INSERT_EMAILS_VALUES_QUERY = "INSERT INTO email_address(email_full, person_id) VALUES %s;"
+NEXT_PERSON_IDS_QUERY = ("SELECT nextval(pg_get_serial_sequence('person', 'person_id')) "
+                         "FROM generate_series(1, %s);")
+COPY_PERSON_QUERY = "COPY person(person_id, first_name, second_name, third_name, date_of_birth) FROM STDIN;"
+COPY_PHONE_QUERY = "COPY phone_number(phone_num_full, person_id) FROM STDIN;"
+COPY_EMAIL_QUERY = "COPY email_address(email_full, person_id) FROM STDIN;"
+DELETE_PHONE_QUERY = ("DELETE FROM phone_number "
+                      "WHERE person_id = %s "
+                      "AND phone_num_full LIKE %s "
+                      "RETURNING person_id;")
+DELETE_EMAIL_QUERY = ("DELETE FROM email_address "
+                      "WHERE person_id = %s "
+                      "AND email_full LIKE %s "
+                      "RETURNING person_id;")
+DELETE_CLIENT_QUERY = ("DELETE FROM person "
+                       "WHERE person_id = %s "
+                       "RETURNING person_id;")
+DELETE_CLIENTS_QUERY = "DELETE FROM person WHERE person_id = ANY(%s);"
+COUNT_CLIENTS_QUERY = "SELECT count(*) FROM person;"
+TRUNCATE_CLIENTS_QUERY = "TRUNCATE person, phone_number, email_address CASCADE;"
+NOTIFY_CLIENT_CACHE_QUERY = "SELECT pg_notify('client_cache', %s);"
+
+
+def build_values_query(query, row_length, rows_qty):
+    """
+    Раскрывает VALUES %s запроса в формате extras.execute_values() в rows_qty строк параметров %s
+    для драйверов без execute_values, например psycopg 3
+    :param query: Текст запроса с VALUES %s
+    :param row_length: Количество параметров в одной строке
+    :param rows_qty: Количество строк
+    :return: Текст запроса, параметры которого передаются одним плоским списком
+    """
+    row = f"({', '.join(['%s'] * row_length)})"
 
-    lengths = [8, 16, 20, 20, 20, 25, 35]
-    columns = ['ID', 'Имя', 'Отчество', 'Фамилия', 'Дата рождения', 'Номер телефона', 'email']
+    return query.replace('VALUES %s', f"VALUES {', '.join([row] * rows_qty)}")
 
-    print()
-    print((8 + sum(lengths)) * '-')
-    for i, column in enumerate(columns):
-        print('|{:^{width}}'.format(column, width=lengths[i]), end='')
-    print('|')
-    print((8 + sum(lengths)) * '-')
-
-    for row in table_list:
-        # print(row)
-        for i in range(4):
-            # print(row[i])
-            if row[i] is not None:
-                print('|{:^{width}}'.format(row[i], width=lengths[i]), end='')
-            else:
-                print('|{:^{width}}'.format('', width=lengths[i]), end='')
-        print('|{:^{width}}'.format(date.isoformat(row[4]), width=lengths[4]), end='')
-        for i in range(5, 7):
-            if row[i] is not None:
-                print('|{:^{width}}'.format(row[i], width=lengths[i]), end='')
-            else:
-                print('|{:^{width}}'.format('', width=lengths[i]), end='')
-        print('|')
-
-    print((8 + sum(lengths)) * '-')
+
+def is_valid_phone_number(phone_number):
+    """
+    Проверяет номер телефона перед добавлением в базу данных
+    :param phone_number: Номер телефона
+    :return: TRUE если номер - строка ненулевой длины, содержащая только цифры
+    """
+    return isinstance(phone_number, str) and phone_number.isdigit()
+
+
+def is_valid_email_address(email_address, quiet=False):
+    """
+    Проверяет адрес email перед добавлением в базу данных
+    :param email_address: Адрес email
+    :param quiet: Не печатать сообщение check_email_address() о неподходящем адресе
+    :return: TRUE если адрес - строка ненулевой длины, прошедшая check_email_address()
+    """
+    return isinstance(email_address, str) and len(email_address) > 0 and check_email_address(email_address, quiet)
 
 
 def insert_phone_num_for_existing_client(connection, phone_number, person_id):
@@ -183,27 +889,32 @@ def insert_phone_num_for_existing_client(connection, phone_number, person_id):
     :param connection: Получает открытое соединение с базой данных
     :param phone_number: Получает номер телефона. Должен быть строкой ненулевой длины
     :param person_id: Получает id клиента из таблицы person
-    :return: Ничего не возвращает
+    :return: TRUE если номер добавлен FALSE если номер не прошел проверку
     """
-    with connection.cursor() as cur:
-        if isinstance(phone_number, str) and phone_number.isdigit() and len(phone_number) > 0:
-            # В базу данных вносятся только текстовые ненулевые данные, содержащие только цифры
-            cur.execute("INSERT INTO phone_number(phone_num_full, person_id)"
-                        "VALUES (%s, %s);", (phone_number, person_id))
-            connection.commit()
+    # В базу данных вносятся только текстовые ненулевые данные, содержащие только цифры
+    if not is_valid_phone_number(phone_number):
+        return False
+
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute(INSERT_PHONE_QUERY, (phone_number, person_id))
+        invalidate_client(cur, person_id)
+
+    return True
 
 
-def check_email_address(email_str):
+def check_email_address(email_str, quiet=False):
     """
     Выполняет простейшую проверку того, что email_str похож на адрес email
     :param email_str: строка для проверки
+    :param quiet: Не печатать сообщение о неподходящем адресе, например, при проверке строк файла
     :return: TRUE если проверка пройдена FALSE если не пройдена
     """
     if len(email_str) >= 6 and email_str.count('@') == 1 and email_str.count('@', 1, -4) == 1 \
             and email_str.count('.', -5, -1) == 1:
         return True
     else:
-        print(f'Адрес "{email_str}" скорее всего не является адресом электронной почты')
+        if not quiet:
+            print(f'Адрес "{email_str}" скорее всего не является адресом электронной почты')
         return False
 
 
@@ -213,117 +924,996 @@ def insert_email_for_existing_client(connection, email_address, person_id):
     :param connection: Получает открытое соединение с базой данных
     :param email_address: Получает email адрес. Должен быть строкой ненулевой длины
     :param person_id: Получает id клиента из таблицы person
-    :return: Ничего не возвращает
+    :return: TRUE если email добавлен FALSE если адрес не прошел проверку
     """
-    with connection.cursor() as cur:
-        if isinstance(email_address, str) and len(email_address) > 0 and check_email_address(email_address):
-            # В базу данных вносятся только текстовые ненулевые данные, в который присутствует
-            # символ '@' и длина минимально достаточна для формирования адреса email
-            # Как понял, проверка адреса email это не такая уж тривиальая задача,
-            # поэтому сделал простейшую проверку, чтобы адрес просто был похож на email
-            cur.execute("INSERT INTO email_address(email_full, person_id)"
-                        "VALUES (%s, %s);", (email_address, person_id))
-            connection.commit()
-        else:
-            print('Адрес электронной почты не будет добавлен')
+    # В базу данных вносятся только текстовые ненулевые данные, в который присутствует
+    # символ '@' и длина минимально достаточна для формирования адреса email
+    # Как понял, проверка адреса email это не такая уж тривиальая задача,
+    # поэтому сделал простейшую проверку, чтобы адрес просто был похож на email
+    if not is_valid_email_address(email_address):
+        print('Адрес электронной почты не будет добавлен')
+        return False
+
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute(INSERT_EMAIL_QUERY, (email_address, person_id))
+        invalidate_client(cur, person_id)
+
+    return True
 
 
 def insert_new_client_data(connection, data_tup, output=True):
     """
-    Добавляет во все таблицы данные нового клиента
+    Добавляет во все таблицы данные нового клиента одной транзакцией
     :param connection: Получает соединение с базой данных
     :param data_tup: Кортеж в формате first_name, second_name, third_name, date_of_birth, phone_num_full,
                            email_full
-    :return: Ничего не возвращает
+    :return: person_id нового клиента
     """
 
-    with connection.cursor() as cur:
-        cur.execute("INSERT INTO person(first_name, second_name, third_name, date_of_birth)"
-                    "VALUES (%s, %s, %s, %s);", data_tup[0:4])
-
-        # Запрос person_id новой записи клиента для заполнения таблиц телефонов и email
-        cur.execute("SELECT person_id "
-                    "FROM person "
-                    "ORDER BY person_id DESC "
-                    "LIMIT 1;")
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        # person_id новой записи клиента для заполнения таблиц телефонов и email возвращается тем же запросом
+        cur.execute(INSERT_PERSON_QUERY, data_tup[0:4])
 
         new_person_id = cur.fetchone()[0]
 
-        connection.commit()
-
-        # Добавление телефона и email коммитится в своих функциях
+        # Добавление телефона и email присоединяется к этой же транзакции
         insert_phone_num_for_existing_client(connection, data_tup[4], new_person_id)
         insert_email_for_existing_client(connection, data_tup[5], new_person_id)
 
-        if output:
-            print()
-            print('Добавлен новый клиент:')
-            print_table(find_client(conn, '', '', '', '', '', '', new_person_id))
+    if output:
+        print()
+        print('Добавлен новый клиент:')
+        print_table(find_client(connection, '', '', '', '', '', '', new_person_id))
+
+    return new_person_id
+
+
+def insert_clients_many(connection, clients, batch_size=1000):
+    """
+    Добавляет во все таблицы данные нескольких новых клиентов
+    person_id для пачки выделяются одним запросом из последовательности, клиенты, телефоны и email
+    вставляются многострочными INSERT - одним запросом на таблицу, каждая пачка коммитится один раз,
+    а внутри transaction() становится операцией единицы работы
+    :param connection: Получает соединение с базой данных
+    :param clients: Итерируемый объект с кортежами в формате first_name, second_name, third_name, date_of_birth,
+                    phone_num_full, email_full
+    :param batch_size: Количество клиентов в одной транзакции
+    :return: Список person_id добавленных клиентов в порядке следования clients
+    """
+    clients = iter(clients)
+    new_person_ids = []
+
+    with connection.cursor() as cur:
+        while True:
+            batch = list(itertools.islice(clients, batch_size))
+            if not batch:
+                break
+
+            with transaction(connection, savepoint=False):
+                # person_id выделяются заранее и вставляются явно: порядок строк RETURNING не гарантирован
+                cur.execute(NEXT_PERSON_IDS_QUERY, (len(batch),))
+                person_ids = [row[0] for row in cur.fetchall()]
+                extras.execute_values(cur, INSERT_PERSONS_VALUES_QUERY,
+                                      [(person_id, *client[0:4]) for person_id, client in zip(person_ids, batch)],
+                                      page_size=len(batch))
+
+                # Телефоны и email проходят те же проверки, что и при добавлении по одному, но без сообщения
+                # о каждом неподходящем адресе
+                phone_list = [(client[4], person_id) for person_id, client in zip(person_ids, batch)
+                              if is_valid_phone_number(client[4])]
+                email_list = [(client[5], person_id) for person_id, client in zip(person_ids, batch)
+                              if is_valid_email_address(client[5], quiet=True)]
+
+                if phone_list:
+                    extras.execute_values(cur, INSERT_PHONES_VALUES_QUERY, phone_list, page_size=len(phone_list))
+                if email_list:
+                    extras.execute_values(cur, INSERT_EMAILS_VALUES_QUERY, email_list, page_size=len(email_list))
+
+            new_person_ids.extend(person_ids)
+
+    return new_person_ids
+
+
+# Столбцы, которые возвращает поиск клиента, в порядке вывода в print_table
+SELECT_COLUMN_LIST = ['person_id', 'first_name', 'third_name', 'second_name', 'date_of_birth', 'phone_num_full',
+                      'email_full']
+
+# Кэш записей клиентов: person_id - (время помещения в кэш, записи find_client())
+client_cache = collections.OrderedDict()
+client_cache_lock = threading.Lock()
+client_cache_size = 10000
+client_cache_ttl = 60
+client_cache_notify = False
+# Номер поколения кэша, увеличивается при каждом удалении клиентов из кэша. get_client() не помещает в кэш
+# запись, если за время ее чтения поколение сменилось: запись могла быть прочитана до commit изменившей ее транзакции
+client_cache_generation = 0
+
+# Счетчик для уникальных имен серверных курсоров
+cursor_counter = itertools.count(1)
+
+# Искать ли текстовые значения без учета регистра (ILIKE вместо LIKE), с индексами из TRIGRAM_INDEX_LIST
+# поиск по подстроке в любом регистре тоже выполняется по индексу
+case_insensitive_search = False
+
+# Читать ли find_client() из таблицы client_view (см. create_client_view()) вместо соединения таблиц
+use_client_view = False
+
+# Выполнять ли запросы через PREPARE/EXECUTE и какие запросы уже подготовлены на каждом соединении
+use_prepared_statements = False
+prepared_statements = weakref.WeakKeyDictionary()
+
+
+def client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None):
+    """
+    Собирает условия поиска клиента в словарь для select_query_shape() и generate_select_query()
+    Аргументы в том же порядке, что и у find_client()
+    :return: Словарь, где ключи - это названия столбцов из SELECT_COLUMN_LIST, а значения - условия поиска
+    """
+    return {'person_id': person_id, 'first_name': fname, 'third_name': thname, 'second_name': sname,
+            'date_of_birth': date_of_birth, 'phone_num_full': phone_num, 'email_full': email_address}
+
+
+def select_query_shape(param_dict_sel):
+    """
+    Определяет форму запроса на выборку - по каким столбцам и с каким оператором выполняется отбор
+    Непустые текстовые значения ищутся через LIKE (ILIKE, если включено case_insensitive_search),
+    person_id и дата рождения - на равенство,
+    дата рождения учитывается, только если не указан person_id
+    :param param_dict_sel: Словарь где ключи - это названия столбцов всех таблиц,
+                       а значения - это параметры для выполнения запроса
+    :return: Кортеж из формы запроса (кортеж пар столбец, оператор) и списка параметров
+    """
+    shape = []
+    params = []
+
+    for k, v in param_dict_sel.items():
+        if k not in SELECT_COLUMN_LIST:
+            raise ValueError(f'Неизвестный столбец {k}')
+        if v is not None and isinstance(v, str) and len(v) > 0 and k != 'date_of_birth':
+            shape.append((k, 'ILIKE' if case_insensitive_search else 'LIKE'))
+            params.append(v)
+
+    if param_dict_sel.get('person_id') is not None:
+        shape.append(('person_id', '='))
+        params.append(param_dict_sel['person_id'])
+    elif param_dict_sel.get('date_of_birth') is not None and param_dict_sel['date_of_birth'] != '':
+        shape.append(('date_of_birth', '='))
+        params.append(param_dict_sel['date_of_birth'])
+
+    return tuple(shape), params
+
+
+def where_clause(shape):
+    """
+    Формирует условие WHERE с параметрами %s по форме запроса
+    :param shape: Форма запроса из select_query_shape()
+    :return: Строка условия или пустая строка, если отбор не нужен
+    """
+    if not shape:
+        return ''
+
+    return 'WHERE ' + ' AND '.join(f'{column} {operator} %s' for column, operator in shape) + ' '
+
+
+@functools.lru_cache(maxsize=None)
+def build_select_query(shape):
+    """
+    Формирует текст SQL-запроса на выборку из всех таблиц для формы запроса
+    Текст запроса для каждой формы формируется один раз и кэшируется
+    :param shape: Форма запроса из select_query_shape()
+    :return: Текст SQL-запроса с параметрами %s
+    """
+    return (f"SELECT {', '.join(SELECT_COLUMN_LIST)} FROM person "
+            "LEFT JOIN phone_number AS pn "
+            "USING (person_id) "
+            "LEFT JOIN email_address AS ea "
+            "USING (person_id) "
+            f"{where_clause(shape)}"
+            "ORDER BY person_id;")
 
 
 def generate_select_query(param_dict_sel):
     """
     Формирует SQL-запрос на выборку из всех таблиц по переданным значениям
+    Если включено use_client_view, запрос читает client_view (build_view_query()), и на каждого клиента
+    приходится одна запись в формате find_client_aggregated()
     :param param_dict_sel: Словарь где ключи - это названия столбцов всех таблиц,
                        а значения - это параметры для выполнения запроса
-    :return: SQL-запрос в виде sql-объекта psychopg2
+    :return: Кортеж из текста SQL-запроса с параметрами %s и списка параметров
     """
+    if use_client_view:
+        shape, params = client_view_shape(param_dict_sel)
+        return build_view_query(shape), params
 
-    select_column_list = sql.SQL(', ').join(sql.Identifier(n) for n in list(param_dict_sel))
+    shape, params = select_query_shape(param_dict_sel)
 
-    composed_list = [sql.SQL("SELECT {} FROM person "
-                             "LEFT JOIN phone_number AS pn "
-                             "USING (person_id) "
-                             "LEFT JOIN email_address AS ea "
-                             "USING (person_id) "
-                             "").format(select_column_list)]
+    return build_select_query(shape), params
 
-    counter = 0
 
-    for k, v in param_dict_sel.items():
-        if v is not None and isinstance(v, str) and len(v) > 0 and k != 'date_of_birth':
-            if counter == 0:
-                composed_list.append(sql.SQL("WHERE {} LIKE {} ").format(sql.Identifier(k), sql.Literal(v)))
-            else:
-                composed_list.append(sql.SQL("AND {} LIKE {} ").format(sql.Identifier(k), sql.Literal(v)))
-            counter += 1
+@functools.lru_cache(maxsize=None)
+def prepared_statement_text(query):
+    """
+    Формирует имя подготовленного запроса и его текст с параметрами $1, $2... вместо %s
+    :param query: Текст SQL-запроса с параметрами %s
+    :return: Кортеж из имени и текста подготовленного запроса
+    """
+    counter = itertools.count(1)
+    statement_name = 'query_' + hashlib.md5(query.encode()).hexdigest()[:16]
 
-    if counter == 0 and param_dict_sel['person_id'] is not None:
-        composed_list.append(sql.SQL("WHERE {} = {} ").
-                             format(sql.Identifier('person_id'), sql.Literal(param_dict_sel['person_id'])))
-    elif counter != 0 and param_dict_sel['person_id'] is not None:
-        composed_list.append(sql.SQL("AND {} = {} ").
-                             format(sql.Identifier('person_id'), sql.Literal(param_dict_sel['person_id'])))
+    return statement_name, re.sub('%s', lambda m: f'${next(counter)}', query)
 
-    if counter == 0 and param_dict_sel['date_of_birth'] is not None and param_dict_sel['person_id'] is None:
-        composed_list.append(sql.SQL("WHERE {} = {} ").
-                             format(sql.Identifier('date_of_birth'), sql.Literal(param_dict_sel['date_of_birth'])))
-    elif counter != 0 and param_dict_sel['date_of_birth'] is not None and param_dict_sel['person_id'] is None:
-        composed_list.append(sql.SQL("AND {} = {} ").
-                             format(sql.Identifier('date_of_birth'), sql.Literal(param_dict_sel['date_of_birth'])))
 
-    composed_list.append(sql.SQL("ORDER BY person_id"))
+def execute_query(cur, query, params):
+    """
+    Выполняет SQL-запрос с параметрами
+    Если включено use_prepared_statements, запрос подготавливается командой PREPARE один раз на соединение
+    и далее выполняется командой EXECUTE без повторного планирования на сервере
+    :param cur: Курсор
+    :param query: Текст SQL-запроса с параметрами %s
+    :param params: Список параметров
+    :return: Ничего не возвращает
+    """
+    if not use_prepared_statements:
+        cur.execute(query, params)
+        return
+
+    statement_name, statement_text = prepared_statement_text(query)
+    connection_statements = prepared_statements.setdefault(cur.connection, set())
 
-    return sql.Composed(composed_list)
+    if statement_name not in connection_statements:
+        cur.execute(f'PREPARE {statement_name} AS {statement_text}')
+        connection_statements.add(statement_name)
+
+    if params:
+        cur.execute(f"EXECUTE {statement_name} ({', '.join(['%s'] * len(params))});", params)
+    else:
+        cur.execute(f'EXECUTE {statement_name};')
 
 
 def find_client(connection, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None):
     """
     Поиск клиента по имени, фамилии, отчеству, адресу электронной почты, телефону
+    Если включено use_client_view, клиенты читаются из client_view, см. generate_select_query()
     :return: Возвращает список кортежей с id, именем, фамилией и отчеством клиента
     """
-    param_dict = {'person_id': person_id, 'first_name': fname, 'third_name': thname, 'second_name': sname,
-                  'date_of_birth': date_of_birth, 'phone_num_full': phone_num, 'email_full': email_address}
+    param_dict = client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
 
-    query = generate_select_query(param_dict)
+    query, params = generate_select_query(param_dict)
 
     with connection.cursor() as cur:
-        cur.execute(query)
+        execute_query(cur, query, params)
         selected_data = cur.fetchall()
 
     return selected_data
 
 
+def find_client_iter(connection, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None,
+                     itersize=2000, withhold=False):
+    """
+    Поиск клиента с потоковым чтением результата через именованный (серверный) курсор
+    Записи передаются с сервера пачками по itersize, поэтому расход памяти не зависит от размера результата
+    :param itersize: Количество записей, получаемых с сервера за один раз
+    :param withhold: Создать курсор WITH HOLD, который не закрывается при commit во время чтения,
+                     например, если записи удаляются по мере чтения
+    :return: Генератор кортежей в формате find_client(), с use_client_view - из client_view
+    """
+    param_dict = client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    query, params = generate_select_query(param_dict)
+
+    with connection.cursor(name=f'find_client_{next(cursor_counter)}', withhold=withhold) as cur:
+        cur.itersize = itersize
+        cur.execute(query, params)
+        yield from cur
+
+
+def encode_page_token(person_id):
+    """
+    Формирует непрозрачный токен страницы из последнего person_id страницы
+    :param person_id: person_id последнего клиента на странице
+    :return: Строка токена
+    """
+    return base64.urlsafe_b64encode(f'person_id:{person_id}'.encode()).decode()
+
+
+def decode_page_token(page_token):
+    """
+    Получает person_id из токена страницы
+    :param page_token: Токен из find_client_page() или None для первой страницы
+    :return: person_id, после которого начинается страница
+    """
+    if page_token is None:
+        return 0
+
+    try:
+        prefix, person_id = base64.urlsafe_b64decode(page_token.encode()).decode().split(':')
+        if prefix != 'person_id':
+            raise ValueError
+
+        return int(person_id)
+    except ValueError:
+        raise ValueError(f'Неверный токен страницы {page_token}') from None
+
+
+def person_where_clause(shape, *extra_conditions):
+    """
+    Формирует условие WHERE по таблице person для формы запроса
+    Отбор по телефону и email выполняется через EXISTS, поэтому на каждого клиента приходится одна строка
+    :param shape: Форма запроса из select_query_shape()
+    :param extra_conditions: Дополнительные условия по таблице person
+    :return: Строка условия или пустая строка, если отбор не нужен
+    """
+    conditions = []
+
+    for column, operator in shape:
+        if column == 'phone_num_full':
+            conditions.append("EXISTS (SELECT 1 FROM phone_number AS pn WHERE pn.person_id = person.person_id "
+                              f"AND pn.phone_num_full {operator} %s)")
+        elif column == 'email_full':
+            conditions.append("EXISTS (SELECT 1 FROM email_address AS ea WHERE ea.person_id = person.person_id "
+                              f"AND ea.email_full {operator} %s)")
+        else:
+            conditions.append(f'person.{column} {operator} %s')
+
+    conditions.extend(extra_conditions)
+
+    if not conditions:
+        return ''
+
+    return 'WHERE ' + ' AND '.join(conditions) + ' '
+
+
+@functools.lru_cache(maxsize=None)
+def build_page_query(shape):
+    """
+    Формирует текст SQL-запроса на выборку страницы клиентов для формы запроса
+    Страница выбирается по ключу (person_id > %s ... LIMIT %s), а не через OFFSET,
+    поэтому любая страница выбирается так же быстро, как первая
+    :param shape: Форма запроса из select_query_shape()
+    :return: Текст SQL-запроса с параметрами %s: параметры отбора, person_id, размер страницы, параметры отбора
+    """
+    return (f"SELECT {', '.join(SELECT_COLUMN_LIST)} FROM ("
+            "SELECT person_id FROM person "
+            f"{person_where_clause(shape, 'person.person_id > %s')}"
+            "ORDER BY person_id "
+            "LIMIT %s) AS page "
+            "JOIN person USING (person_id) "
+            "LEFT JOIN phone_number AS pn "
+            "USING (person_id) "
+            "LEFT JOIN email_address AS ea "
+            "USING (person_id) "
+            f"{where_clause(shape)}"
+            "ORDER BY person_id;")
+
+
+def generate_page_query(param_dict_sel, page_size, page_token=None):
+    """
+    Формирует SQL-запрос на выборку страницы клиентов из того же источника, что и generate_select_query()
+    :param param_dict_sel: Словарь где ключи - это названия столбцов всех таблиц,
+                       а значения - это параметры для выполнения запроса
+    :param page_size: Количество клиентов на странице
+    :param page_token: Токен страницы или None для первой страницы
+    :return: Кортеж из текста SQL-запроса с параметрами %s и списка параметров
+    """
+    if use_client_view:
+        shape, params = client_view_shape(param_dict_sel)
+        return build_view_page_query(shape), [*params, decode_page_token(page_token), page_size]
+
+    shape, params = select_query_shape(param_dict_sel)
+
+    return build_page_query(shape), [*params, decode_page_token(page_token), page_size, *params]
+
+
+def find_client_page(connection, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None,
+                     page_size=50, page_token=None):
+    """
+    Поиск клиента с постраничной выдачей
+    На странице находится не более page_size клиентов, у каждого клиента может быть несколько записей
+    :param page_size: Количество клиентов на странице
+    :param page_token: Токен следующей страницы из предыдущего вызова или None для первой страницы
+    :return: Кортеж из списка кортежей в формате find_client() и токена следующей страницы
+             (None, если страница последняя)
+    """
+    param_dict = client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    query, params = generate_page_query(param_dict, page_size, page_token)
+
+    with connection.cursor() as cur:
+        execute_query(cur, query, params)
+        selected_data = cur.fetchall()
+
+    if len({row[0] for row in selected_data}) < page_size:
+        return selected_data, None
+
+    return selected_data, encode_page_token(selected_data[-1][0])
+
+
+@functools.lru_cache(maxsize=None)
+def build_aggregated_query(shape):
+    """
+    Формирует текст SQL-запроса на выборку клиентов, в котором на каждого клиента приходится одна строка,
+    а телефоны и email собраны в массивы
+    :param shape: Форма запроса из select_query_shape()
+    :return: Текст SQL-запроса с параметрами %s
+    """
+    return ("SELECT person.person_id, first_name, third_name, second_name, date_of_birth, "
+            "pn.phones, ea.emails FROM person "
+            "CROSS JOIN LATERAL (SELECT COALESCE(array_agg(phone_num_full ORDER BY phone_num_full), '{}') AS phones "
+            "FROM phone_number WHERE phone_number.person_id = person.person_id) AS pn "
+            "CROSS JOIN LATERAL (SELECT COALESCE(array_agg(email_full ORDER BY email_full), '{}') AS emails "
+            "FROM email_address WHERE email_address.person_id = person.person_id) AS ea "
+            f"{person_where_clause(shape)}"
+            "ORDER BY person.person_id;")
+
+
+def find_client_aggregated(connection, fname, sname, thname, date_of_birth, phone_num, email_address,
+                           person_id=None):
+    """
+    Поиск клиента, при котором на каждого клиента возвращается одна запись
+    Если отбор выполняется по телефону или email, у найденного клиента возвращаются все его телефоны и email
+    :return: Возвращает список кортежей с id, именем, отчеством, фамилией, датой рождения клиента,
+             списком телефонов и списком email
+    """
+    param_dict = client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    shape, params = select_query_shape(param_dict)
+
+    with connection.cursor() as cur:
+        execute_query(cur, build_aggregated_query(shape), params)
+        selected_data = cur.fetchall()
+
+    return selected_data
+
+
+# Поиск похожих значений: поле поиска - запрос, который отбирает по триграммному индексу person_id кандидатов
+# и их сходство с искомой строкой, параметры - искомая строка, повторенная нужное количество раз
+SIMILAR_CANDIDATE_QUERY_DICT = {
+    'name': ("SELECT person_id, greatest(similarity(first_name, %s), similarity(second_name, %s), "
+             "similarity(third_name, %s)) AS score FROM person "
+             "WHERE first_name %% %s OR second_name %% %s OR third_name %% %s", 6),
+    'phone': ("SELECT person_id, similarity(phone_num_full, %s) AS score FROM phone_number "
+              "WHERE phone_num_full %% %s", 2),
+    'email': ("SELECT person_id, similarity(email_full, %s) AS score FROM email_address "
+              "WHERE email_full %% %s", 2),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def build_similar_query(field):
+    """
+    Формирует текст SQL-запроса на поиск клиентов, у которых значение поля похоже на искомую строку
+    :param field: Поле поиска из SIMILAR_CANDIDATE_QUERY_DICT
+    :return: Текст SQL-запроса с параметрами %s: искомая строка для запроса кандидатов, количество клиентов
+    """
+    return ("SELECT person.person_id, first_name, third_name, second_name, date_of_birth, "
+            "pn.phones, ea.emails, round(match.score::numeric, 3) FROM ("
+            "SELECT person_id, max(score) AS score "
+            f"FROM ({SIMILAR_CANDIDATE_QUERY_DICT[field][0]}) AS candidate "
+            "GROUP BY person_id "
+            "ORDER BY score DESC, person_id "
+            "LIMIT %s) AS match "
+            "JOIN person USING (person_id) "
+            "CROSS JOIN LATERAL (SELECT COALESCE(array_agg(phone_num_full ORDER BY phone_num_full), '{}') AS phones "
+            "FROM phone_number WHERE phone_number.person_id = person.person_id) AS pn "
+            "CROSS JOIN LATERAL (SELECT COALESCE(array_agg(email_full ORDER BY email_full), '{}') AS emails "
+            "FROM email_address WHERE email_address.person_id = person.person_id) AS ea "
+            "ORDER BY match.score DESC, person.person_id;")
+
+
+def find_client_similar(connection, text, field='name', limit=20, threshold=0.3):
+    """
+    Поиск клиентов с похожими именем, отчеством или фамилией, телефоном или email, устойчивый к опечаткам
+    Кандидаты отбираются оператором % расширения pg_trgm по индексам из TRIGRAM_INDEX_LIST
+    и сортируются по убыванию similarity(). Для печати используйте print_table(..., columns=SIMILAR_COLUMN_LIST,
+    column_widths=SIMILAR_COLUMN_WIDTH_LIST)
+    :param text: Искомая строка
+    :param field: name - имя, отчество и фамилия, phone - телефон, email - email
+    :param limit: Максимальное количество клиентов
+    :param threshold: Минимальное сходство от 0 до 1, задается только для этого запроса
+    :return: Список кортежей в формате find_client_aggregated() со сходством последним элементом
+    """
+    if field not in SIMILAR_CANDIDATE_QUERY_DICT:
+        raise ValueError(f'Неизвестное поле поиска {field}')
+
+    # Порог задается set_config(..., true) только до конца транзакции. Оба запроса отправляются одной командой,
+    # которая и в режиме autocommit выполняется одной неявной транзакцией. Вне внешней единицы работы
+    # transaction() фиксирует транзакцию сразу, и порог не действует на следующие запросы соединения
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        # Не через execute_query(): оператор %% в тексте запроса несовместим с PREPARE без параметров
+        cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true); " + build_similar_query(field),
+                    [str(threshold)] + [text] * SIMILAR_CANDIDATE_QUERY_DICT[field][1] + [limit])
+        selected_data = cur.fetchall()
+
+    return selected_data
+
+
+# Функции триггеров, которые поддерживают client_view в актуальном состоянии. Триггеры срабатывают один раз
+# на команду и получают измененные строки через таблицы переходов, поэтому массовая загрузка через COPY
+# обновляет client_view одним запросом на команду, а не на каждую строку
+# Триггер person меняет у существующих записей только ФИО и дату рождения, массивы телефонов и email собираются
+# из дочерних таблиц только для новых записей: у только что добавленного клиента других транзакций,
+# меняющих его телефоны и email, быть не может
+CLIENT_VIEW_PERSON_FUNCTION = """
+CREATE OR REPLACE FUNCTION client_view_sync_person() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        TRUNCATE client_view;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM client_view AS v USING old_rows AS o
+        WHERE v.person_id = o.person_id;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM client_view AS v USING old_rows AS o
+        WHERE v.person_id = o.person_id
+        AND NOT EXISTS (SELECT 1 FROM new_rows AS n WHERE n.person_id = o.person_id);
+
+        UPDATE client_view AS v
+        SET first_name = n.first_name, third_name = n.third_name, second_name = n.second_name,
+            date_of_birth = n.date_of_birth
+        FROM new_rows AS n
+        WHERE v.person_id = n.person_id;
+    END IF;
+
+    INSERT INTO client_view(person_id, first_name, third_name, second_name, date_of_birth, phones, emails)
+    SELECT n.person_id, n.first_name, n.third_name, n.second_name, n.date_of_birth,
+           COALESCE((SELECT array_agg(phone_num_full ORDER BY phone_num_full) FROM phone_number
+                     WHERE phone_number.person_id = n.person_id), '{}'),
+           COALESCE((SELECT array_agg(email_full ORDER BY email_full) FROM email_address
+                     WHERE email_address.person_id = n.person_id), '{}')
+    FROM new_rows AS n
+    WHERE TG_OP = 'INSERT' OR NOT EXISTS (SELECT 1 FROM client_view AS v WHERE v.person_id = n.person_id)
+    ON CONFLICT (person_id) DO NOTHING;
+
+    RETURN NULL;
+END
+$$;
+"""
+
+# Функция триггеров дочерней таблицы: {table} - таблица, {column} - столбец со значением, {array} - столбец client_view
+# Массив не собирается заново из дочерней таблицы, а меняется от текущего значения: из него удаляются значения
+# из old_rows и добавляются значения из new_rows. Если ту же запись client_view одновременно меняет другая
+# транзакция, UPDATE дожидается ее фиксации и применяет изменение к новой версии записи, поэтому одновременное
+# добавление телефонов одному клиенту не теряет ни одного из них
+CLIENT_VIEW_CHILD_FUNCTION = """
+CREATE OR REPLACE FUNCTION client_view_sync_{table}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE client_view SET {array} = '{{}}' WHERE {array} <> '{{}}';
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE client_view AS v
+        SET {array} = ARRAY(SELECT item FROM unnest(v.{array}) AS item WHERE item <> ALL(o.removed) ORDER BY item)
+        FROM (SELECT person_id, array_agg({column}) AS removed FROM old_rows GROUP BY person_id) AS o
+        WHERE v.person_id = o.person_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE client_view AS v
+        SET {array} = ARRAY(SELECT item FROM unnest(v.{array} || n.added) AS item ORDER BY item)
+        FROM (SELECT person_id, array_agg({column}) AS added FROM new_rows GROUP BY person_id) AS n
+        WHERE v.person_id = n.person_id;
+    END IF;
+
+    RETURN NULL;
+END
+$$;
+"""
+
+# Таблицы, изменения которых переносятся в client_view: таблица - функция триггера
+CLIENT_VIEW_TRIGGER_LIST = [
+    ('person', 'client_view_sync_person'),
+    ('phone_number', 'client_view_sync_phone_number'),
+    ('email_address', 'client_view_sync_email_address'),
+]
+
+# Индексы client_view: btree по ФИО и дате рождения и text_pattern_ops для поиска по префиксу, как у person,
+# GIN по массивам телефонов и email для поиска по точному значению
+CLIENT_VIEW_INDEX_LIST = [
+    ('client_view_full_name_date_of_birth_idx', 'second_name, first_name, date_of_birth'),
+    ('client_view_first_name_idx', 'first_name'),
+    ('client_view_third_name_idx', 'third_name'),
+    ('client_view_date_of_birth_idx', 'date_of_birth'),
+    ('client_view_second_name_pattern_idx', 'second_name text_pattern_ops'),
+    ('client_view_first_name_pattern_idx', 'first_name text_pattern_ops'),
+    ('client_view_third_name_pattern_idx', 'third_name text_pattern_ops'),
+    ('client_view_phones_idx', 'phones', 'gin'),
+    ('client_view_emails_idx', 'emails', 'gin'),
+]
+
+
+def create_client_view(connection):
+    """
+    Создает таблицу client_view с одной записью на клиента - ФИО, датой рождения, массивами телефонов и email,
+    ее индексы и триггеры на person, phone_number и email_address, которые обновляют ее при каждом изменении,
+    и заполняет ее текущими данными
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute("CREATE TABLE IF NOT EXISTS client_view("
+                    "person_id INTEGER PRIMARY KEY,"
+                    "first_name VARCHAR(40) NOT NULL,"
+                    "third_name VARCHAR(50),"
+                    "second_name VARCHAR(50) NOT NULL,"
+                    "date_of_birth DATE NOT NULL,"
+                    "phones VARCHAR(15)[] NOT NULL DEFAULT '{}',"
+                    "emails VARCHAR(250)[] NOT NULL DEFAULT '{}');")
+
+        create_client_view_triggers(cur)
+
+        for index_name, index_definition, *index_method in CLIENT_VIEW_INDEX_LIST:
+            cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON client_view USING {} ({});").
+                        format(sql.Identifier(index_name), sql.SQL(index_method[0] if index_method else 'btree'),
+                               sql.SQL(index_definition)))
+
+    rebuild_client_view(connection)
+
+
+def create_client_view_triggers(cur):
+    """
+    Создает функции триггеров client_view и триггеры на person, phone_number и email_address,
+    существующие триггеры пересоздаются. Транзакция не фиксируется
+    :param cur: Курсор
+    :return: Ничего не возвращает
+    """
+    cur.execute(CLIENT_VIEW_PERSON_FUNCTION)
+    cur.execute(CLIENT_VIEW_CHILD_FUNCTION.format(table='phone_number', column='phone_num_full', array='phones'))
+    cur.execute(CLIENT_VIEW_CHILD_FUNCTION.format(table='email_address', column='email_full', array='emails'))
+
+    for table_name, function_name in CLIENT_VIEW_TRIGGER_LIST:
+        # Таблицы переходов можно указать только у триггера на одно событие
+        for event, transition_tables in (('INSERT', 'NEW TABLE AS new_rows'),
+                                         ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                                         ('DELETE', 'OLD TABLE AS old_rows')):
+            trigger_name = sql.Identifier(f'{table_name}_client_view_{event.lower()}')
+            cur.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {};").
+                        format(trigger_name, sql.Identifier(table_name)))
+            cur.execute(sql.SQL("CREATE TRIGGER {} AFTER {} ON {} REFERENCING {} "
+                                "FOR EACH STATEMENT EXECUTE FUNCTION {}();").
+                        format(trigger_name, sql.SQL(event), sql.Identifier(table_name),
+                               sql.SQL(transition_tables), sql.Identifier(function_name)))
+
+        trigger_name = sql.Identifier(f'{table_name}_client_view_truncate')
+        cur.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {};").format(trigger_name, sql.Identifier(table_name)))
+        cur.execute(sql.SQL("CREATE TRIGGER {} AFTER TRUNCATE ON {} "
+                            "FOR EACH STATEMENT EXECUTE FUNCTION {}();").
+                    format(trigger_name, sql.Identifier(table_name), sql.Identifier(function_name)))
+
+
+def client_view_trigger_names():
+    """
+    Имена всех триггеров, которые создает create_client_view_triggers()
+    :return: Список пар (таблица, имя триггера)
+    """
+    return [(table_name, f'{table_name}_client_view_{event}') for table_name, function_name in CLIENT_VIEW_TRIGGER_LIST
+            for event in ('insert', 'update', 'delete', 'truncate')]
+
+
+def repair_client_view_triggers(connection):
+    """
+    Восстанавливает триггеры client_view, если таблица client_view есть, а каких-то ее триггеров нет,
+    например, после пересоздания таблиц клиентов в migrate_to_partitioned(). Без триггеров client_view
+    могла отстать от таблиц клиентов, поэтому в той же транзакции она заполняется заново
+    :param connection: Получает соединение с базой данных
+    :return: TRUE если триггеры восстановлены FALSE если client_view нет или все триггеры на месте
+    """
+    trigger_names = client_view_trigger_names()
+
+    with connection.cursor() as cur:
+        cur.execute("SELECT to_regclass('client_view') IS NOT NULL, count(t.oid) "
+                    "FROM unnest(%s::text[], %s::text[]) AS n(table_name, trigger_name) "
+                    "LEFT JOIN pg_trigger AS t "
+                    "ON t.tgrelid = to_regclass(n.table_name) AND t.tgname = n.trigger_name;",
+                    ([table_name for table_name, trigger_name in trigger_names],
+                     [trigger_name for table_name, trigger_name in trigger_names]))
+        view_exists, triggers_qty = cur.fetchone()
+
+    if not view_exists or triggers_qty == len(trigger_names):
+        return False
+
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        create_client_view_triggers(cur)
+        rebuild_client_view(connection)
+
+    return True
+
+
+def drop_client_view(connection):
+    """
+    Удаляет таблицу client_view, ее триггеры и функции триггеров
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        for table_name, trigger_name in client_view_trigger_names():
+            cur.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {};").
+                        format(sql.Identifier(trigger_name), sql.Identifier(table_name)))
+        for table_name, function_name in CLIENT_VIEW_TRIGGER_LIST:
+            cur.execute(sql.SQL("DROP FUNCTION IF EXISTS {}();").format(sql.Identifier(function_name)))
+
+        cur.execute("DROP TABLE IF EXISTS client_view;")
+
+
+def rebuild_client_view(connection):
+    """
+    Заново заполняет client_view из person, phone_number и email_address
+    :param connection: Получает соединение с базой данных
+    :return: Количество клиентов в client_view
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute("LOCK TABLE person, phone_number, email_address IN SHARE MODE;")
+        cur.execute("TRUNCATE client_view;")
+        cur.execute("INSERT INTO client_view(person_id, first_name, third_name, second_name, date_of_birth, "
+                    "phones, emails) "
+                    f"{build_aggregated_query(()).rstrip(';')};")
+        rebuilt_qty = cur.rowcount
+        cur.execute("ANALYZE client_view;")
+
+    return rebuilt_qty
+
+
+def verify_client_view(connection, repair=False, sample_size=20):
+    """
+    Сверяет client_view с person, phone_number и email_address и находит расхождения
+    :param connection: Получает соединение с базой данных
+    :param repair: Исправить ли найденные расхождения
+    :param sample_size: Сколько person_id расходящихся клиентов вернуть
+    :return: Кортеж из количества расходящихся клиентов и списка не более sample_size их person_id
+    """
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE client_view_drift AS "
+                    "SELECT COALESCE(v.person_id, b.person_id) AS person_id "
+                    "FROM client_view AS v "
+                    f"FULL JOIN ({build_aggregated_query(()).rstrip(';')}) "
+                    "AS b(person_id, first_name, third_name, second_name, date_of_birth, phones, emails) "
+                    "USING (person_id) "
+                    "WHERE (v.first_name, v.third_name, v.second_name, v.date_of_birth, v.phones, v.emails) "
+                    "IS DISTINCT FROM (b.first_name, b.third_name, b.second_name, b.date_of_birth, "
+                    "b.phones, b.emails);")
+        drift_qty = cur.rowcount
+
+        cur.execute("SELECT person_id FROM client_view_drift ORDER BY person_id LIMIT %s;", (sample_size,))
+        drift_sample = [row[0] for row in cur.fetchall()]
+
+        if repair and drift_qty:
+            cur.execute("DELETE FROM client_view WHERE person_id IN (SELECT person_id FROM client_view_drift);")
+            cur.execute("INSERT INTO client_view(person_id, first_name, third_name, second_name, date_of_birth, "
+                        "phones, emails) "
+                        f"SELECT * FROM ({build_aggregated_query(()).rstrip(';')}) AS b "
+                        "WHERE person_id IN (SELECT person_id FROM client_view_drift);")
+
+        # Внутри внешней транзакции таблица удаляется сразу, а не при commit, чтобы ее можно было создать снова
+        cur.execute("DROP TABLE client_view_drift;")
+
+    return drift_qty, drift_sample
+
+
+def client_view_shape(param_dict_sel):
+    """
+    Определяет форму запроса к client_view
+    Отличается от select_query_shape() тем, что значения без символов % и _ ищутся на равенство,
+    телефон и email в этом случае ищутся по индексу GIN массивов
+    :param param_dict_sel: Словарь где ключи - это названия столбцов всех таблиц,
+                       а значения - это параметры для выполнения запроса
+    :return: Кортеж из формы запроса и списка параметров
+    """
+    shape, params = select_query_shape(param_dict_sel)
+
+    return tuple((column, '=') if operator == 'LIKE' and not re.search('[%_]', param) else (column, operator)
+                 for (column, operator), param in zip(shape, params)), params
+
+
+def view_where_clause(shape, *extra_conditions):
+    """
+    Формирует условие WHERE по таблице client_view для формы запроса
+    :param shape: Форма запроса из client_view_shape()
+    :param extra_conditions: Дополнительные условия по таблице client_view
+    :return: Строка условия или пустая строка, если отбор не нужен
+    """
+    conditions = []
+
+    for column, operator in shape:
+        array = {'phone_num_full': 'phones', 'email_full': 'emails'}.get(column)
+        if array is None:
+            conditions.append(f'{column} {operator} %s')
+        elif operator == '=':
+            conditions.append(f'{array} @> ARRAY[%s]::VARCHAR[]')
+        else:
+            conditions.append(f'EXISTS (SELECT 1 FROM unnest({array}) AS value WHERE value {operator} %s)')
+
+    conditions.extend(extra_conditions)
+
+    if not conditions:
+        return ''
+
+    return 'WHERE ' + ' AND '.join(conditions) + ' '
+
+
+@functools.lru_cache(maxsize=None)
+def build_view_query(shape):
+    """
+    Формирует текст SQL-запроса на выборку клиентов из client_view для формы запроса
+    :param shape: Форма запроса из client_view_shape()
+    :return: Текст SQL-запроса с параметрами %s
+    """
+    return ("SELECT person_id, first_name, third_name, second_name, date_of_birth, phones, emails "
+            "FROM client_view "
+            f"{view_where_clause(shape)}"
+            "ORDER BY person_id;")
+
+
+@functools.lru_cache(maxsize=None)
+def build_view_page_query(shape):
+    """
+    Формирует текст SQL-запроса на выборку страницы клиентов из client_view, в которой на клиента одна строка
+    :param shape: Форма запроса из client_view_shape()
+    :return: Текст SQL-запроса с параметрами %s: параметры отбора, person_id, размер страницы
+    """
+    return ("SELECT person_id, first_name, third_name, second_name, date_of_birth, phones, emails "
+            "FROM client_view "
+            f"{view_where_clause(shape, 'person_id > %s')}"
+            "ORDER BY person_id "
+            "LIMIT %s;")
+
+
+def find_client_view(connection, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None):
+    """
+    Поиск клиента в client_view без соединения таблиц
+    :return: Список кортежей в формате find_client_aggregated()
+    """
+    param_dict = client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    shape, params = client_view_shape(param_dict)
+
+    with connection.cursor() as cur:
+        execute_query(cur, build_view_query(shape), params)
+        selected_data = cur.fetchall()
+
+    return selected_data
+
+
+def configure_client_cache(size=10000, ttl=60, notify=False):
+    """
+    Настраивает кэш записей клиентов, используемый get_client()
+    :param size: Максимальное количество клиентов в кэше, 0 - кэш отключен
+    :param ttl: Сколько секунд запись клиента хранится в кэше
+    :param notify: Сообщать ли другим процессам об изменении клиента через NOTIFY client_cache
+    :return: Ничего не возвращает
+    """
+    global client_cache_size, client_cache_ttl, client_cache_notify
+
+    with client_cache_lock:
+        client_cache_size = size
+        client_cache_ttl = ttl
+        client_cache_notify = notify
+        client_cache.clear()
+
+
+def get_client(connection, person_id):
+    """
+    Поиск клиента по person_id с чтением через кэш
+    Если клиента нет в кэше или запись устарела, клиент ищется через find_client() и помещается в кэш,
+    при переполнении из кэша удаляются давно не использованные клиенты
+    Внутри transaction() кэш не используется: транзакция может содержать незафиксированные изменения,
+    которые нельзя ни помещать в кэш, ни подменять записями из кэша
+    :param connection: Соединение с базой данных
+    :param person_id: id клиента
+    :return: Список кортежей в формате find_client(), пустой список если клиента нет
+    """
+    if connection in units_of_work:
+        return list(find_client(connection, '', '', '', None, '', '', person_id))
+
+    now = time.monotonic()
+
+    with client_cache_lock:
+        cached = client_cache.get(person_id)
+        if cached is not None and now - cached[0] < client_cache_ttl:
+            client_cache.move_to_end(person_id)
+            return list(cached[1])
+        generation = client_cache_generation
+
+    selected_data = find_client(connection, '', '', '', None, '', '', person_id)
+
+    # Отсутствие клиента не кэшируется, чтобы не следить за появлением новых person_id
+    if selected_data and client_cache_size > 0:
+        with client_cache_lock:
+            if client_cache_generation != generation:
+                return list(selected_data)
+            client_cache[person_id] = (now, selected_data)
+            client_cache.move_to_end(person_id)
+            while len(client_cache) > client_cache_size:
+                client_cache.popitem(last=False)
+
+    return list(selected_data)
+
+
+def drop_cached_clients(person_ids=None):
+    """
+    Удаляет клиентов из кэша и меняет поколение кэша
+    :param person_ids: Итерируемый объект с id клиентов, None - очистить весь кэш
+    :return: Ничего не возвращает
+    """
+    global client_cache_generation
+
+    with client_cache_lock:
+        client_cache_generation += 1
+        if person_ids is None:
+            client_cache.clear()
+        else:
+            for person_id in person_ids:
+                client_cache.pop(person_id, None)
+
+
+def client_cache_payload(person_id=None):
+    """
+    Формирует текст уведомления client_cache об изменении клиента
+    :param person_id: id клиента, None - все клиенты
+    :return: Строка с person_id или '*'
+    """
+    return '*' if person_id is None else str(person_id)
+
+
+def invalidate_client(cur, person_id=None):
+    """
+    Отмечает клиента, измененного в транзакции transaction(), для удаления из кэша после ее фиксации
+    Вне transaction() клиент удаляется из кэша сразу, поэтому такой вызов должен следовать за commit
+    Если включено уведомление, другим процессам отправляется NOTIFY client_cache, который доставляется при commit
+    :param cur: Курсор, в транзакции которого изменен клиент
+    :param person_id: id клиента, None - очистить весь кэш
+    :return: Ничего не возвращает
+    """
+    unit = units_of_work.get(cur.connection)
+
+    if unit is None:
+        drop_cached_clients(None if person_id is None else [person_id])
+    else:
+        unit.invalidate(person_id)
+
+    if client_cache_notify:
+        cur.execute(NOTIFY_CLIENT_CACHE_QUERY, (client_cache_payload(person_id),))
+
+
+def start_client_cache_listener(**connect_kwargs):
+    """
+    Запускает поток, который получает уведомления client_cache об изменении клиентов в других процессах
+    и удаляет этих клиентов из кэша. Для остановки нужно закрыть возвращенное соединение
+    :param connect_kwargs: Параметры подключения, передаются в psycopg2.connect
+    :return: Соединение, на котором выполнен LISTEN client_cache
+    """
+    connection = psycopg2.connect(**connect_kwargs)
+    connection.autocommit = True
+
+    with connection.cursor() as cur:
+        cur.execute("LISTEN client_cache;")
+
+    def listen():
+        while not connection.closed:
+            try:
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+            except (psycopg2.Error, OSError, ValueError):
+                break
+
+            while connection.notifies:
+                payload = connection.notifies.pop(0).payload
+                if payload == '*':
+                    drop_cached_clients()
+                elif payload.isdigit():
+                    drop_cached_clients([int(payload)])
+
+    threading.Thread(target=listen, name='client_cache_listener', daemon=True).start()
+
+    return connection
+
+
 def insert_init_data():
     """
     Заполняет таблицу данными
@@ -333,111 +1923,268 @@ def insert_init_data():
 
     init_data = []
 
-    for i in range(males_qty):
-        person_data = generate_data('m')
-        insert_new_client_data(conn, person_data, False)
-        init_data.append(*find_client(conn, *person_data))
+    with pooled_connection() as connection, transaction(connection):
+        for i in range(males_qty):
+            person_data = generate_data('m')
+            new_person_id = insert_new_client_data(connection, person_data, False)
+            init_data.extend(find_client_aggregated(connection, '', '', '', None, '', '', new_person_id))
 
-    for i in range(males_qty, males_qty + females_qty):
-        person_data = generate_data('f')
-        insert_new_client_data(conn, person_data, False)
-        init_data.append(*find_client(conn, *person_data))
-
-    conn.commit()
+        for i in range(males_qty, males_qty + females_qty):
+            person_data = generate_data('f')
+            new_person_id = insert_new_client_data(connection, person_data, False)
+            init_data.extend(find_client_aggregated(connection, '', '', '', None, '', '', new_person_id))
 
     print('\nДобавлено', males_qty + females_qty, 'записей')
     print_table(init_data)
 
 
+def generate_clients(clients_qty):
+    """
+    Генерирует заданное количество клиентов случайного пола
+    :param clients_qty: Количество клиентов
+    :return: Генератор кортежей в формате generate_data()
+    """
+    for i in range(clients_qty):
+        yield generate_data(random.choice('mf'))
+
+
+def copy_value(value):
+    """
+    Преобразует значение в поле текстового формата COPY
+    :param value: Значение поля
+    :return: Строка, в которой экранированы спецсимволы, None преобразуется в \\N
+    """
+    if value is None:
+        return '\\N'
+
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_clients(connection, clients, chunk_size=50000, output=True):
+    """
+    Массовая загрузка клиентов в таблицы person, phone_number и email_address через COPY FROM STDIN
+    person_id для каждой пачки выделяются одним запросом из последовательности таблицы person,
+    каждая пачка коммитится отдельно, а внутри transaction() становится операцией единицы работы
+    :param connection: Получает соединение с базой данных
+    :param clients: Любой итерируемый объект с кортежами в формате generate_data()
+    :param chunk_size: Количество клиентов в одной пачке
+    :param output: Печатать ли отчет о скорости загрузки
+    :return: Количество загруженных клиентов
+    """
+    clients = iter(clients)
+    loaded_qty = 0
+    start_time = time.perf_counter()
+
+    with connection.cursor() as cur:
+        while True:
+            chunk = list(itertools.islice(clients, chunk_size))
+            if not chunk:
+                break
+
+            cur.execute(NEXT_PERSON_IDS_QUERY, (len(chunk),))
+            person_ids = [row[0] for row in cur.fetchall()]
+
+            person_buf, phone_buf, email_buf = io.StringIO(), io.StringIO(), io.StringIO()
+
+            for person_id, client in zip(person_ids, chunk):
+                person_buf.write('\t'.join(copy_value(v) for v in (person_id, *client[0:4])) + '\n')
+                # Телефоны и email проходят те же проверки, что и при добавлении по одному, но без сообщения
+                # о каждом неподходящем адресе
+                if is_valid_phone_number(client[4]):
+                    phone_buf.write(f'{copy_value(client[4])}\t{person_id}\n')
+                if is_valid_email_address(client[5], quiet=True):
+                    email_buf.write(f'{copy_value(client[5])}\t{person_id}\n')
+
+            with transaction(connection, savepoint=False):
+                for buf, copy_query in ((person_buf, COPY_PERSON_QUERY), (phone_buf, COPY_PHONE_QUERY),
+                                        (email_buf, COPY_EMAIL_QUERY)):
+                    buf.seek(0)
+                    cur.copy_expert(copy_query, buf)
+            loaded_qty += len(chunk)
+
+    elapsed = time.perf_counter() - start_time
+
+    if output:
+        print_load_rate(loaded_qty, elapsed)
+
+    return loaded_qty
+
+
+def print_load_rate(loaded_qty, elapsed):
+    """
+    Печатает отчет о скорости массовой загрузки клиентов
+    :param loaded_qty: Количество загруженных клиентов
+    :param elapsed: Время загрузки в секундах
+    :return: Ничего не возвращает
+    """
+    print(f'\nЗагружено {loaded_qty} записей за {elapsed:.2f} с '
+          f'({loaded_qty / elapsed if elapsed else 0:.0f} записей/с)')
+
+
+# Столбцы таблицы person, которые можно изменить
+UPDATE_COLUMN_LIST = ['first_name', 'third_name', 'second_name', 'date_of_birth']
+
+
+@functools.lru_cache(maxsize=None)
+def build_update_query(columns):
+    """
+    Формирует текст SQL-запроса на изменение данных о клиенте для набора изменяемых столбцов
+    Текст запроса для каждого набора столбцов формируется один раз и кэшируется
+    :param columns: Кортеж изменяемых столбцов
+    :return: Текст SQL-запроса с параметрами %s, последний параметр - person_id
+    """
+    return (f"UPDATE person SET {', '.join(f'{column} = %s' for column in columns)} "
+            "WHERE person_id = %s "
+            "RETURNING person_id;")
+
+
 def generate_update_query(param_dict_update):
     """
     Формирует SQL-запрос на изменение данных о клиенте на переданные значения
     :param param_dict_update: Словарь где ключи - это названия столбцов таблицы person,
                        а значения - это параметры для выполнения запроса
-    :return: SQL-запрос в виде sql-объекта psychopg2
+    :return: Кортеж из текста SQL-запроса с параметрами %s и списка параметров
     """
-
-    composed_list = [sql.SQL("UPDATE person ")]
-    counter = 0
+    columns = []
+    params = []
 
     for k, v in param_dict_update.items():
         if k != 'person_id' and v is not None and isinstance(v, str) and len(v) > 0 or isinstance(v, datetime.date):
-            if counter == 0:
-                composed_list.append(sql.SQL("SET {} = {} ").format(sql.Identifier(k), sql.Literal(v)))
-            else:
-                composed_list.append(sql.SQL(", {} = {} ").format(sql.Identifier(k), sql.Literal(v)))
-            counter += 1
+            if k not in UPDATE_COLUMN_LIST:
+                raise ValueError(f'Неизвестный столбец {k}')
+            columns.append(k)
+            params.append(v)
 
-    composed_list.append(sql.SQL("WHERE {} = {} ").
-                         format(sql.Identifier('person_id'), sql.Literal(param_dict_update['person_id'])))
+    if not columns:
+        raise ValueError('Нет данных для изменения')
 
-    return sql.Composed(composed_list)
+    params.append(param_dict_update['person_id'])
+
+    return build_update_query(tuple(columns)), params
 
 
 def update_client(connection, person_id, fname, sname, thname, date_of_birth):
     """
     Изменение данных клиента - имени, фамилии, отчества и даты рождения
+    Наличие клиента проверяется тем же запросом UPDATE ... RETURNING
+    :return: TRUE если данные клиента изменены FALSE если такого клиента нет
     """
     param_dict_update = {'person_id': person_id, 'first_name': fname, 'third_name': thname,
                          'second_name': sname, 'date_of_birth': date_of_birth}
 
-    found_client = find_client(connection, '', '', '', '', '', '', person_id)
+    query, params = generate_update_query(param_dict_update)
 
-    if found_client:
-        query = generate_update_query(param_dict_update)
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        execute_query(cur, query, params)
+        updated = cur.fetchone() is not None
 
-        with connection.cursor() as cur:
-            cur.execute(query)
+        if updated:
+            invalidate_client(cur, person_id)
 
-            connection.commit()
-    else:
+    if not updated:
         print('Такого клиента нет')
 
+    return updated
+
 
 def delete_phone_number(connection, person_id, phone_number):
     """
     Удаляет из таблицы phone_number запись с указанным person_id  и phone_number
+    :return: TRUE если номер удален FALSE если клиента с таким номером нет
     """
-    if find_client(connection, '', '', '', '', phone_number, '', person_id):
-        with connection.cursor() as cur:
-            cur.execute("DELETE FROM phone_number "
-                        "WHERE person_id = %s "
-                        "AND phone_num_full LIKE %s;", (person_id, phone_number))
-            connection.commit()
-    else:
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute(DELETE_PHONE_QUERY, (person_id, phone_number))
+        deleted = cur.rowcount > 0
+
+        if deleted:
+            invalidate_client(cur, person_id)
+
+    if not deleted:
         print('Клиента с таким номером телефона нет')
 
+    return deleted
+
 
 def delete_email_address(connection, person_id, email_address):
     """
     Удаляет из таблицы email_address запись с указанным person_id  и email_address
+    :return: TRUE если email удален FALSE если клиента с таким email нет
     """
-    if find_client(connection, '', '', '', '', '', email_address, person_id):
-        with connection.cursor() as cur:
-            cur.execute("DELETE FROM email_address "
-                        "WHERE person_id = %s "
-                        "AND email_full LIKE %s;", (person_id, email_address))
-            connection.commit()
-    else:
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute(DELETE_EMAIL_QUERY, (person_id, email_address))
+        deleted = cur.rowcount > 0
+
+        if deleted:
+            invalidate_client(cur, person_id)
+
+    if not deleted:
         print('Клиента с таким email нет')
 
+    return deleted
+
 
 def delete_client(connection, person_id):
     """
     Удаляет из таблицы person и всех связанных таблиц записи с указанным person_id
+    Телефоны и email удаляются каскадно внешними ключами ON DELETE CASCADE
+    :return: TRUE если клиент удален FALSE если такого клиента нет
     """
-    if find_client(connection, '', '', '', '', '', '', person_id):
-        with connection.cursor() as cur:
-            cur.execute("DELETE FROM phone_number "
-                        "WHERE person_id = %s; ", (person_id,))
-            cur.execute("DELETE FROM email_address "
-                        "WHERE person_id = %s; ", (person_id,))
-            cur.execute("DELETE FROM person "
-                        "WHERE person_id = %s; ", (person_id,))
-            connection.commit()
-    else:
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        cur.execute(DELETE_CLIENT_QUERY, (person_id,))
+        deleted = cur.rowcount > 0
+
+        if deleted:
+            invalidate_client(cur, person_id)
+
+    if not deleted:
         print('Такого клиента в базе данных нет')
 
+    return deleted
+
+
+def purge_clients(connection, fname, sname, thname, date_of_birth, phone_num, email_address, person_id=None,
+                  batch_size=10000, output=True):
+    """
+    Удаляет всех клиентов, подходящих под условия поиска, в одной транзакции
+    Если условия не заданы, все таблицы очищаются командой TRUNCATE ... CASCADE,
+    иначе person_id подходящих клиентов читаются серверным курсором и удаляются пачками
+    DELETE ... WHERE person_id = ANY(%s), телефоны и email удаляются каскадно
+    :param batch_size: Количество клиентов, удаляемых одним запросом
+    :param output: Печатать ли ход удаления
+    :return: Количество удаленных клиентов
+    """
+    param_dict = client_filter_params(fname, sname, thname, date_of_birth, phone_num, email_address, person_id)
+
+    shape, params = select_query_shape(param_dict)
+    deleted_qty = 0
+
+    with transaction(connection, savepoint=False), connection.cursor() as cur:
+        if not shape:
+            cur.execute(COUNT_CLIENTS_QUERY)
+            deleted_qty = cur.fetchone()[0]
+            cur.execute(TRUNCATE_CLIENTS_QUERY)
+        else:
+            with connection.cursor(name=f'purge_clients_{next(cursor_counter)}') as id_cur:
+                id_cur.execute(f"SELECT person_id FROM person {person_where_clause(shape)};", params)
+
+                while True:
+                    person_ids = [row[0] for row in id_cur.fetchmany(batch_size)]
+                    if not person_ids:
+                        break
+
+                    cur.execute(DELETE_CLIENTS_QUERY, (person_ids,))
+                    deleted_qty += cur.rowcount
+
+                    if output:
+                        print(f'Удалено {deleted_qty} клиентов')
+
+        invalidate_client(cur)
+
+    if output:
+        print('Всего удалено', deleted_qty, 'клиентов')
+
+    return deleted_qty
+
 
 def input_client_info():
     """
@@ -485,10 +2232,11 @@ def user_choice_find():
 
     fname ,sname, tname, date_of_birth, phone_num, email_address = input_client_info()
 
-    search_result = find_client(conn, fname, sname, tname, date_of_birth, phone_num, email_address)
+    with pooled_connection() as connection:
+        search_result = find_client(connection, fname, sname, tname, date_of_birth, phone_num, email_address)
 
     if search_result:
-        print_table(search_result)
+        print_table(search_result, page_size=TABLE_PAGE_SIZE)
     else:
         print()
         print('По вашему запросу ничего не найдено')
@@ -504,7 +2252,8 @@ def user_choice_add_new_client():
     print('Для добавления нового клиента ввод имени, фамилии и даты рождения обязательны')
     new_client = input_client_info()
     if new_client[0] and new_client[1] and new_client[3]:
-        insert_new_client_data(conn, new_client)
+        with pooled_connection() as connection:
+            insert_new_client_data(connection, new_client)
     else:
         print('\nНе все необходимые данные введены, ничего не добавлено')
 
@@ -525,40 +2274,46 @@ def user_choice_add_remove_phone_email(choice):
     print(80 * '-')
     client_info = input_client_info()
     print('\nПо введенным данным найден(ы) клиент(ы): ')
-    print_table(find_client(conn, *client_info))
+    with pooled_connection() as connection:
+        print_table(find_client(connection, *client_info))
     print(f'\nЧтобы {text_1} {text_2}, введите ID выбранного клиента и {text_2}:')
     person_id = input('Введите ID клиента: ')
 
     if person_id is None or person_id == '' or not person_id.isdigit():
         print('Необходимо ввести ID клиента')
         return
-    elif not find_client(conn,  '', '', '', '', '', '', int(person_id)):
-        print('Такого клиента в базе данных нет')
-        return
     else:
         person_id = int(person_id)
 
+    with pooled_connection() as connection:
+        client_exists = bool(get_client(connection, person_id))
+
+    if not client_exists:
+        print('Такого клиента в базе данных нет')
+        return
+
     phone_num_email = input(f'Введите {text_2}: ')
 
-    if 'phone_num' in choice and 'add' in choice:
-        insert_phone_num_for_existing_client(conn, phone_num_email, person_id)
+    with pooled_connection() as connection:
+        if 'phone_num' in choice and 'add' in choice:
+            insert_phone_num_for_existing_client(connection, phone_num_email, person_id)
 
-    if 'email_address' in choice and 'add' in choice:
-        insert_email_for_existing_client(conn, phone_num_email, person_id)
+        if 'email_address' in choice and 'add' in choice:
+            insert_email_for_existing_client(connection, phone_num_email, person_id)
 
-    if 'phone_num' in choice and 'remove' in choice:
-        delete_phone_number(conn, person_id, phone_num_email)
+        if 'phone_num' in choice and 'remove' in choice:
+            delete_phone_number(connection, person_id, phone_num_email)
 
-    if 'email_address' in choice and 'remove' in choice:
-        delete_email_address(conn, person_id, phone_num_email)
+        if 'email_address' in choice and 'remove' in choice:
+            delete_email_address(connection, person_id, phone_num_email)
 
-    if 'add' in choice:
-        print(f'\nДобавлен {text_2}:')
-        print_table(find_client(conn, '', '', '', '', '', '', person_id))
+        if 'add' in choice:
+            print(f'\nДобавлен {text_2}:')
+            print_table(get_client(connection, person_id))
 
-    if 'remove' in choice:
-        print(f'\nПроверьте, что {text_2} удален:')
-        print_table(find_client(conn, '', '', '', '', '', '', person_id))
+        if 'remove' in choice:
+            print(f'\nПроверьте, что {text_2} удален:')
+            print_table(get_client(connection, person_id))
 
 
 def user_choice_update_client_info():
@@ -568,7 +2323,8 @@ def user_choice_update_client_info():
     print(80 * '-')
     client_info = input_client_info()
     print('\nПо введенным данным найден(ы) клиент(ы): ')
-    print_table(find_client(conn, *client_info))
+    with pooled_connection() as connection:
+        print_table(find_client(connection, *client_info))
     print('\nЧтобы изменить данные, введите ID выбранного клиента и данные для изменения')
     print('(если данные не меняются, ничего вводить не нужно)')
     print('(Изменить можно только Имя, Фамилию, Отчество и дату рождения):')
@@ -578,23 +2334,45 @@ def user_choice_update_client_info():
     if person_id is None or person_id == '' or not person_id.isdigit():
         print('Необходимо ввести ID клиента')
         return
-    elif not find_client(conn,  '', '', '', '', '', '', int(person_id)):
-        print('Такого клиента в базе данных нет')
-        return
     else:
         person_id = int(person_id)
 
+    with pooled_connection() as connection:
+        client_exists = bool(get_client(connection, person_id))
+
+    if not client_exists:
+        print('Такого клиента в базе данных нет')
+        return
+
     client_info_new = input_client_info()
 
     if client_info_new[0] or client_info_new[1] or client_info_new[2] or client_info_new[3]:
-        update_client(conn, person_id, *client_info_new[0:4])
-        print()
-        print('Обновлена информация:')
-        print_table(find_client(conn, '', '', '', '', '', '', person_id))
+        with pooled_connection() as connection:
+            update_client(connection, person_id, *client_info_new[0:4])
+            print()
+            print('Обновлена информация:')
+            print_table(get_client(connection, person_id))
     else:
         print('Информация не введена, ничего обновлено не будет')
 
 
+def user_choice_bulk_load():
+    """
+    Функция массовой загрузки тестовых данных
+    :return:
+    """
+
+    print()
+    clients_qty = input('Введите количество клиентов для загрузки: ')
+
+    if not clients_qty.isdigit() or int(clients_qty) == 0:
+        print('Необходимо ввести количество клиентов')
+        return
+
+    with pooled_connection() as connection:
+        copy_clients(connection, generate_clients(int(clients_qty)))
+
+
 def user_choice_input():
     """
     Функция выбора действий пользователя второго уровня.
@@ -603,10 +2381,11 @@ def user_choice_input():
     """
 
     choice_dict = {'1': 'Добавить нового клиента', '2': 'Добавить телефон', '3': 'Добавить email',
-                   '4': 'Изменить данные клиента', '5': 'Добавить тестовые данные'}
+                   '4': 'Изменить данные клиента', '5': 'Добавить тестовые данные',
+                   '6': 'Массовая загрузка тестовых данных'}
     choice_dict_commands = {'1': user_choice_add_new_client, '2': user_choice_add_remove_phone_email,
                             '3': user_choice_add_remove_phone_email, '4': user_choice_update_client_info,
-                            '5': insert_init_data}
+                            '5': insert_init_data, '6': user_choice_bulk_load}
 
     print('Вы можете:')
     for k, v in choice_dict.items():
@@ -635,22 +2414,28 @@ def user_choice_remove_client():
     print(80 * '-')
     client_info = input_client_info()
     print('\nПо введенным данным найден(ы) клиент(ы): ')
-    print_table(find_client(conn, *client_info))
+    with pooled_connection() as connection:
+        print_table(find_client(connection, *client_info))
     person_id = input('Введите ID клиента, которого хотите удалить: ')
 
     if person_id is None or person_id == '' or not person_id.isdigit():
         print('Необходимо ввести ID клиента')
         return
-    elif not find_client(conn,  '', '', '', '', '', '', int(person_id)):
-        print('Такого клиента в базе данных нет')
-        return
     else:
         person_id = int(person_id)
 
-    delete_client(conn, person_id)
+    with pooled_connection() as connection:
+        client_exists = bool(get_client(connection, person_id))
+
+    if not client_exists:
+        print('Такого клиента в базе данных нет')
+        return
 
-    print(f'\nПроверьте, что клиент удален:')
-    print_table(find_client(conn, *client_info))
+    with pooled_connection() as connection:
+        delete_client(connection, person_id)
+
+        print(f'\nПроверьте, что клиент удален:')
+        print_table(find_client(connection, *client_info))
 
 
 def user_choice_remove_all_clients():
@@ -661,22 +2446,19 @@ def user_choice_remove_all_clients():
 
     print()
     print('В базе данных находятся записи о следующих клиентах:')
-    all_clients = find_client(conn, '', '', '', None, '', '')
-    print_table(all_clients)
+    with pooled_connection() as connection:
+        print_table(find_client_iter(connection, '', '', '', None, '', ''), page_size=TABLE_PAGE_SIZE)
     r_u_s = input("Если вы уверены, что хотите удалить всех клиентов, введите 'да': ")
 
-    if r_u_s == 'да':
-        counter = 0
-        for client in all_clients:
-            delete_client(conn, client[0])
-            counter += 1
-    else:
+    if r_u_s != 'да':
         print('Ничего не будет удалено')
         return
 
-    print('Удалено', counter, 'записей')
-    print('\nСейчас в базе данных содержатся следующие записи:')
-    print_table(find_client(conn, '', '', '', None, '', ''))
+    with pooled_connection() as connection:
+        purge_clients(connection, '', '', '', None, '', '')
+
+        print('\nСейчас в базе данных содержатся следующие записи:')
+        print_table(find_client_iter(connection, '', '', '', None, '', ''))
 
 
 def user_choice_remove():
@@ -733,10 +2515,12 @@ def base_user_module():
 
 if __name__ == '__main__':
 
-    conn = psycopg2.connect(database="", user="", password="")
+    init_connection_pool(1, 5, database="", user="", password="")
 
-    create_tables(conn)
+    with pooled_connection() as connection:
+        create_tables(connection)
+        create_indexes(connection, concurrently=True)
 
     base_user_module()
 
-    conn.close()
+    close_connection_pool()
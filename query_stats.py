@@ -0,0 +1,273 @@
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+from psycopg2 import extensions, sql
+
+
+logger = logging.getLogger('query_stats')
+
+# Верхние границы интервалов гистограммы времени выполнения в миллисекундах: от 0.05 мс до ~40 с
+BUCKET_BOUNDS_MS = [0.05 * 2 ** (i / 2) for i in range(40)]
+
+# Порог медленного запроса в миллисекундах (None - план не снимается)
+# и минимальный интервал в секундах между EXPLAIN одного и того же запроса
+slow_query_ms = None
+explain_interval = 60
+
+# Статистика по формам запросов: текст запроса - словарь счетчиков
+query_stats = {}
+query_stats_lock = threading.Lock()
+# Время последнего EXPLAIN для каждой формы запроса
+last_explain_time = {}
+
+EXPLAIN_PREFIXES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'EXECUTE')
+# Запросы, которые можно выполнить повторно под EXPLAIN ANALYZE, если в них нет изменяющих данные подзапросов,
+# блокировок строк и вызовов функций не из READ_ONLY_CALLS
+READ_ONLY_PREFIXES = ('SELECT', 'WITH')
+# Изменяющие данные подзапросы WITH и блокировки строк FOR UPDATE
+MODIFYING_PATTERN = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b')
+# Имя перед открывающей скобкой: вызов функции, ключевое слово или псевдоним с именами столбцов
+CALL_PATTERN = re.compile(r'([A-Z_][A-Z0-9_$.]*)\s*\(')
+# Функции без побочных эффектов и ключевые слова, после которых идет скобка. Любой другой вызов, например nextval,
+# setval, pg_notify или пользовательская функция, может изменять данные, и для такого запроса снимается план
+# без ANALYZE
+READ_ONLY_CALLS = frozenset([
+    'ALL', 'AND', 'ANY', 'ARRAY', 'ARRAY_AGG', 'ARRAY_LENGTH', 'AS', 'AVG', 'CARDINALITY', 'CAST', 'COALESCE',
+    'COUNT', 'EXISTS', 'EXTRACT', 'FILTER', 'FROM', 'GENERATE_SERIES', 'GREATEST', 'IN', 'JOIN', 'JSON_AGG',
+    'LATERAL', 'LEAST', 'LENGTH', 'LOWER', 'MAX', 'MIN', 'NOT', 'NULLIF', 'NUMERIC', 'ON', 'OR', 'OVER', 'ROUND',
+    'ROW', 'ROW_NUMBER', 'ROW_TO_JSON', 'SELECT', 'SIMILARITY', 'STRING_AGG', 'SUM', 'TO_REGCLASS', 'UNNEST',
+    'UPPER', 'USING', 'VALUES', 'VARCHAR', 'WHERE', 'WITHIN',
+])
+
+
+def is_read_only(query):
+    """
+    Проверяет, что запрос только читает данные и его можно выполнить повторно под EXPLAIN ANALYZE
+    Проверка консервативная: запрос с любым незнакомым вызовом считается изменяющим данные
+    :param query: Текст запроса
+    :return: TRUE если запрос SELECT или WITH без изменяющих данные подзапросов, FOR UPDATE
+             и вызовов функций не из READ_ONLY_CALLS
+    """
+    statement = query.lstrip().upper()
+
+    return statement.startswith(READ_ONLY_PREFIXES) and MODIFYING_PATTERN.search(statement) is None \
+        and all(name in READ_ONLY_CALLS for name in CALL_PATTERN.findall(statement))
+
+
+def configure(slow_ms=None, interval=60):
+    """
+    Настраивает снятие планов медленных запросов
+    :param slow_ms: Порог времени выполнения в миллисекундах, после которого выполняется
+                    EXPLAIN (ANALYZE, BUFFERS), для изменяющих данные запросов - EXPLAIN без выполнения,
+                    и план пишется в лог, None - не снимать планы
+    :param interval: Не чаще скольких секунд снимать план одного и того же запроса
+    :return: Ничего не возвращает
+    """
+    global slow_query_ms, explain_interval
+
+    slow_query_ms = slow_ms
+    explain_interval = interval
+
+
+def reset_stats():
+    """
+    Сбрасывает накопленную статистику
+    """
+    with query_stats_lock:
+        query_stats.clear()
+        last_explain_time.clear()
+
+
+def record(query_key, elapsed_ms, rows):
+    """
+    Учитывает выполнение запроса в статистике
+    :param query_key: Форма запроса - текст запроса с параметрами %s
+    :param elapsed_ms: Время выполнения в миллисекундах
+    :param rows: Количество строк, которое вернул или изменил запрос
+    :return: Ничего не возвращает
+    """
+    with query_stats_lock:
+        stats = query_stats.get(query_key)
+        if stats is None:
+            stats = query_stats[query_key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'bytes': 0,
+                                              'buckets': [0] * (len(BUCKET_BOUNDS_MS) + 1)}
+
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        stats['rows'] += max(rows, 0)
+        stats['buckets'][bisect.bisect_left(BUCKET_BOUNDS_MS, elapsed_ms)] += 1
+
+
+def record_bytes(query_key, rows):
+    """
+    Учитывает объем полученных строк в статистике
+    Объем оценивается по длине текстового представления значений
+    :param query_key: Форма запроса
+    :param rows: Список полученных строк
+    :return: Ничего не возвращает
+    """
+    fetched_bytes = sum(len(v) if isinstance(v, (str, bytes)) else len(str(v))
+                        for row in rows for v in row if v is not None)
+
+    with query_stats_lock:
+        if query_key in query_stats:
+            query_stats[query_key]['bytes'] += fetched_bytes
+
+
+def percentile(buckets, count, fraction):
+    """
+    Оценивает процентиль по гистограмме
+    :param buckets: Счетчики интервалов гистограммы
+    :param count: Общее количество замеров
+    :param fraction: Доля, например, 0.95
+    :return: Верхняя граница интервала, в который попадает процентиль, в миллисекундах
+    """
+    threshold = count * fraction
+    cumulative = 0
+
+    for i, bucket in enumerate(buckets):
+        cumulative += bucket
+        if cumulative >= threshold:
+            return round(BUCKET_BOUNDS_MS[i], 3) if i < len(BUCKET_BOUNDS_MS) else float('inf')
+
+    return float('inf')
+
+
+def stats_snapshot():
+    """
+    Возвращает снимок накопленной статистики
+    :return: Словарь форма запроса - количество выполнений, суммарное, среднее и максимальное время,
+             p50/p95/p99 в миллисекундах, количество строк и объем полученных данных в байтах
+    """
+    with query_stats_lock:
+        snapshot = {}
+
+        for query_key, stats in query_stats.items():
+            snapshot[query_key] = {
+                'count': stats['count'],
+                'total_ms': round(stats['total_ms'], 3),
+                'mean_ms': round(stats['total_ms'] / stats['count'], 3),
+                'p50_ms': percentile(stats['buckets'], stats['count'], 0.5),
+                'p95_ms': percentile(stats['buckets'], stats['count'], 0.95),
+                'p99_ms': percentile(stats['buckets'], stats['count'], 0.99),
+                'max_ms': round(stats['max_ms'], 3),
+                'rows': stats['rows'],
+                'bytes': stats['bytes'],
+            }
+
+    return snapshot
+
+
+def start_periodic_dump(interval=60, path=None):
+    """
+    Запускает поток, который периодически пишет снимок статистики в лог или в файл в формате JSON
+    :param interval: Период в секундах
+    :param path: Файл для записи снимка, None - писать в лог
+    :return: threading.Event, установка которого останавливает поток
+    """
+    stop_event = threading.Event()
+
+    def dump():
+        while not stop_event.wait(interval):
+            snapshot = stats_snapshot()
+            if path is None:
+                logger.info('Статистика запросов: %s', json.dumps(snapshot, ensure_ascii=False))
+            else:
+                with open(path, 'w') as f:
+                    json.dump(snapshot, f, indent=2, ensure_ascii=False)
+
+    threading.Thread(target=dump, name='query_stats_dump', daemon=True).start()
+
+    return stop_event
+
+
+class InstrumentedCursor(extensions.cursor):
+    """
+    Курсор, который учитывает время выполнения, количество строк и объем полученных данных каждого запроса
+    и снимает план медленных запросов. Подключается через cursor_factory соединения
+    """
+
+    query_key = None
+
+    def execute(self, query, vars=None):
+        query_key = query.as_string(self) if isinstance(query, sql.Composable) else query
+        self.query_key = query_key
+
+        start_time = time.perf_counter()
+        result = super().execute(query, vars)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+        record(query_key, elapsed_ms, self.rowcount)
+
+        if slow_query_ms is not None and elapsed_ms >= slow_query_ms and self.name is None:
+            self.explain(query_key, vars, elapsed_ms)
+
+        return result
+
+    def explain(self, query_key, vars, elapsed_ms):
+        """
+        Выполняет EXPLAIN (ANALYZE, BUFFERS) медленного запроса и пишет план в лог
+        Изменяющие данные запросы не выполняются повторно: для них снимается план EXPLAIN без ANALYZE,
+        иначе медленный INSERT, UPDATE или DELETE выполнялся бы второй раз и держал те же блокировки.
+        То же для SELECT с вызовами nextval, pg_notify и других функций, которые не проверены is_read_only()
+        Внутри транзакции EXPLAIN выполняется в точке сохранения, которая затем откатывается, поэтому
+        ошибка EXPLAIN не прерывает транзакцию
+        """
+        statement = query_key.lstrip().upper()
+        if not statement.startswith(EXPLAIN_PREFIXES):
+            return
+
+        now = time.monotonic()
+        with query_stats_lock:
+            if now - last_explain_time.get(query_key, -explain_interval) < explain_interval:
+                return
+            last_explain_time[query_key] = now
+
+        use_savepoint = not self.connection.autocommit
+        explain_prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if is_read_only(query_key) else 'EXPLAIN '
+
+        try:
+            with self.connection.cursor(cursor_factory=extensions.cursor) as cur:
+                if use_savepoint:
+                    cur.execute("SAVEPOINT query_stats_explain;")
+                try:
+                    cur.execute(explain_prefix + query_key.rstrip().rstrip(';'), vars)
+                    plan = '\n'.join(row[0] for row in cur.fetchall())
+                finally:
+                    if use_savepoint:
+                        cur.execute("ROLLBACK TO SAVEPOINT query_stats_explain;")
+        except Exception as e:
+            logger.warning('Не удалось получить план запроса %s: %s', query_key, e)
+            return
+
+        logger.warning('Медленный запрос (%.1f мс): %s\n%s', elapsed_ms, query_key, plan)
+
+    def __iter__(self):
+        super().__iter__()
+        return self
+
+    def __next__(self):
+        # Серверный курсор при переборе в цикле получает строки пачками по itersize, минуя fetch*()
+        row = super().__next__()
+        record_bytes(self.query_key, [row])
+        return row
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            record_bytes(self.query_key, [row])
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        record_bytes(self.query_key, rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        record_bytes(self.query_key, rows)
+        return rows
@@ -0,0 +1,182 @@
+import argparse
+import concurrent.futures
+import data_batch
+import main
+import numpy as np
+import os
+import psycopg2
+from psycopg2 import sql
+import time
+
+
+# Внешние ключи дочерних таблиц на person: таблица - имя ограничения
+FOREIGN_KEY_LIST = [
+    ('phone_number', 'phone_number_person_id_fkey'),
+    ('email_address', 'email_address_person_id_fkey'),
+]
+
+
+def drop_foreign_keys(connection):
+    """
+    Удаляет внешние ключи из FOREIGN_KEY_LIST, чтобы COPY не проверял каждую строку дочерних таблиц
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    with main.transaction(connection, savepoint=False), connection.cursor() as cur:
+        for table_name, constraint_name in FOREIGN_KEY_LIST:
+            cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {};").
+                        format(sql.Identifier(table_name), sql.Identifier(constraint_name)))
+
+
+def create_foreign_keys(connection):
+    """
+    Создает внешние ключи из FOREIGN_KEY_LIST, если их нет. Ключ создается как NOT VALID
+    и затем проверяется одним проходом по таблице, как в main.migrate_cascade_foreign_keys().
+    Для секционированных таблиц NOT VALID не поддерживается, и ключ проверяется сразу при создании
+    :param connection: Получает соединение с базой данных
+    :return: Ничего не возвращает
+    """
+    not_valid = sql.SQL('') if main.tables_partitioned(connection) else sql.SQL(' NOT VALID')
+
+    with connection.cursor() as cur:
+        for table_name, constraint_name in FOREIGN_KEY_LIST:
+            cur.execute("SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s;",
+                        (table_name, constraint_name))
+            if cur.fetchone() is not None:
+                continue
+
+            with main.transaction(connection, savepoint=False):
+                cur.execute(sql.SQL("ALTER TABLE {0} ADD CONSTRAINT {1} FOREIGN KEY (person_id) "
+                                    "REFERENCES person (person_id) ON DELETE CASCADE{2};").
+                            format(sql.Identifier(table_name), sql.Identifier(constraint_name), not_valid))
+            with main.transaction(connection, savepoint=False):
+                cur.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {};").
+                            format(sql.Identifier(table_name), sql.Identifier(constraint_name)))
+
+
+def split_shards(clients_qty, shards_qty):
+    """
+    Делит клиентов на части, размеры которых отличаются не больше чем на одного клиента
+    :param clients_qty: Количество клиентов
+    :param shards_qty: Количество частей
+    :return: Список пар (смещение от начала диапазона, количество клиентов), пустые части отбрасываются
+    """
+    base_qty, extra_qty = divmod(clients_qty, shards_qty)
+    shards = []
+    offset = 0
+
+    for i in range(shards_qty):
+        shard_qty = base_qty + (1 if i < extra_qty else 0)
+        if shard_qty:
+            shards.append((offset, shard_qty))
+        offset += shard_qty
+
+    return shards
+
+
+def seed_shard(clients_qty, seed, chunk_size, connect_kwargs):
+    """
+    Генерирует и загружает одну часть клиентов в отдельном процессе через собственное соединение
+    person_id каждой пачки процесс берет из последовательности таблицы person сам, одним запросом nextval,
+    поэтому идентификаторы не пересекаются ни с другими процессами, ни с одновременной вставкой клиентов
+    :param clients_qty: Количество клиентов
+    :param seed: numpy.random.SeedSequence части
+    :param chunk_size: Количество клиентов в одной пачке COPY
+    :param connect_kwargs: Параметры подключения, передаются в psycopg2.connect
+    :return: Кортеж (количество загруженных клиентов, время загрузки в секундах)
+    """
+    start_time = time.perf_counter()
+
+    connection = psycopg2.connect(**connect_kwargs)
+    try:
+        loaded_qty = main.copy_clients(connection, data_batch.generate_clients_batch(clients_qty, seed, chunk_size),
+                                       chunk_size, output=False)
+    finally:
+        connection.close()
+
+    return loaded_qty, time.perf_counter() - start_time
+
+
+def parallel_seed(clients_qty, workers=None, seed=None, chunk_size=50000, output=True, **connect_kwargs):
+    """
+    Заполняет таблицы тестовыми клиентами в несколько процессов
+    Клиенты делятся между процессами поровну, у каждой части свое начальное значение генератора,
+    производное от seed. Каждый процесс генерирует свою часть
+    и загружает ее через COPY по своему соединению. Индексы и внешние ключи на время загрузки удаляются
+    и строятся заново после нее
+    :param clients_qty: Количество клиентов
+    :param workers: Количество процессов, None - по числу ядер процессора
+    :param seed: Начальное значение генератора случайных чисел, при одном и том же seed
+                 и количестве процессов данные совпадают, а person_id зависят от порядка загрузки пачек
+    :param chunk_size: Количество клиентов в одной пачке COPY
+    :param output: Печатать ли отчет о скорости загрузки
+    :param connect_kwargs: Параметры подключения, передаются в psycopg2.connect
+    :return: Словарь с количеством клиентов, временем загрузки, построения индексов и скоростью загрузки
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+
+    # Пул процессов без частей не создается
+    if clients_qty <= 0:
+        return {'clients': 0, 'workers': 0, 'load_s': 0, 'index_build_s': 0, 'total_s': 0, 'load_rows_per_s': 0,
+                'total_rows_per_s': 0, 'worker_rows_per_s': []}
+
+    start_time = time.perf_counter()
+
+    connection = psycopg2.connect(**connect_kwargs)
+    try:
+        main.create_tables(connection)
+        main.drop_indexes(connection)
+        drop_foreign_keys(connection)
+
+        shards = split_shards(clients_qty, workers)
+        seeds = np.random.SeedSequence(seed).spawn(len(shards))
+
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, len(shards))) as executor:
+                futures = [executor.submit(seed_shard, shard_qty, shard_seed, chunk_size, connect_kwargs)
+                           for (offset, shard_qty), shard_seed in zip(shards, seeds)]
+                shard_results = [future.result() for future in futures]
+            load_elapsed = time.perf_counter() - start_time
+        finally:
+            # Индексы и ключи восстанавливаются и после ошибки, чтобы не оставить таблицы без них
+            index_start_time = time.perf_counter()
+            create_foreign_keys(connection)
+            main.create_indexes(connection)
+            index_elapsed = time.perf_counter() - index_start_time
+    finally:
+        connection.close()
+
+    loaded_qty = sum(qty for qty, elapsed in shard_results)
+    total_elapsed = time.perf_counter() - start_time
+
+    result = {
+        'clients': loaded_qty,
+        'workers': len(shards),
+        'load_s': round(load_elapsed, 3),
+        'index_build_s': round(index_elapsed, 3),
+        'total_s': round(total_elapsed, 3),
+        'load_rows_per_s': round(loaded_qty / load_elapsed) if load_elapsed else 0,
+        'total_rows_per_s': round(loaded_qty / total_elapsed) if total_elapsed else 0,
+        'worker_rows_per_s': [round(qty / elapsed) if elapsed else 0 for qty, elapsed in shard_results],
+    }
+
+    if output:
+        print(f'\nЗагружено {result["clients"]} записей в {result["workers"]} процессов за {result["load_s"]} с '
+              f'({result["load_rows_per_s"]} записей/с), индексы и ключи построены за {result["index_build_s"]} с')
+        print(f'Всего {result["total_s"]} с ({result["total_rows_per_s"]} записей/с), по процессам: '
+              f'{", ".join(str(rate) for rate in result["worker_rows_per_s"])} записей/с')
+
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Параллельное заполнение базы данных тестовыми клиентами')
+    parser.add_argument('clients', type=int, help='Количество клиентов')
+    parser.add_argument('--dsn', default='', help='Строка подключения к базе данных')
+    parser.add_argument('--workers', type=int, help='Количество процессов, по умолчанию по числу ядер')
+    parser.add_argument('--seed', type=int, help='Начальное значение генератора случайных чисел')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Количество клиентов в одной пачке COPY')
+    args = parser.parse_args()
+
+    parallel_seed(args.clients, args.workers, args.seed, args.chunk_size, dsn=args.dsn)
@@ -0,0 +1,36 @@
+import os
+import psycopg2
+import pytest
+import sys
+import uuid
+
+
+# Модули проекта лежат в корне репозитория, тесты импортируют их напрямую
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def connection():
+    """
+    Соединение с временной базой данных, которая создается на сервере из переменной окружения TEST_DSN
+    и удаляется после теста. Без TEST_DSN тесты с базой данных пропускаются
+    """
+    dsn = os.environ.get('TEST_DSN')
+    if dsn is None:
+        pytest.skip('не задана переменная окружения TEST_DSN')
+
+    database_name = f'test_{uuid.uuid4().hex[:16]}'
+
+    admin_conn = psycopg2.connect(dsn)
+    admin_conn.autocommit = True
+    with admin_conn.cursor() as cur:
+        cur.execute(f'CREATE DATABASE {database_name};')
+
+    conn = psycopg2.connect(dsn, dbname=database_name)
+    try:
+        yield conn
+    finally:
+        conn.close()
+        with admin_conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE {database_name};')
+        admin_conn.close()
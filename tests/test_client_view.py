@@ -0,0 +1,60 @@
+import client_view
+import main
+
+
+def client_view_triggers_qty(connection):
+    """
+    Количество триггеров client_view на таблицах клиентов
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_trigger WHERE tgname LIKE '%%client_view%%' "
+                    "AND tgrelid IN ('person'::regclass, 'phone_number'::regclass, 'email_address'::regclass);")
+        return cur.fetchone()[0]
+
+
+def test_migrate_to_partitioned_keeps_client_view(connection):
+    main.create_tables(connection)
+    person_id = main.insert_new_client_data(connection, ('Егор', 'Иванов', 'Сергеевич', '1990-05-15',
+                                                         '79150000000', 'e_ivanov@mail.ru'), output=False)
+    main.create_client_view(connection)
+
+    assert main.migrate_to_partitioned(connection, 4, output=False)
+    assert client_view_triggers_qty(connection) == len(main.client_view_trigger_names())
+
+    main.insert_phone_num_for_existing_client(connection, '79150000001', person_id)
+    main.insert_new_client_data(connection, ('Анна', 'Петрова', '', '1985-01-02', '79160000000', 'a@mail.ru'),
+                                output=False)
+
+    assert main.verify_client_view(connection) == (0, [])
+
+
+def test_create_tables_repairs_client_view_triggers(connection):
+    main.create_tables(connection)
+    main.create_client_view(connection)
+    with connection.cursor() as cur:
+        cur.execute("DROP TRIGGER person_client_view_insert ON person;")
+    connection.commit()
+    main.insert_new_client_data(connection, ('Егор', 'Иванов', 'Сергеевич', '1990-05-15',
+                                             '79150000000', 'e_ivanov@mail.ru'), output=False)
+
+    main.create_tables(connection)
+
+    assert client_view_triggers_qty(connection) == len(main.client_view_trigger_names())
+    assert main.verify_client_view(connection) == (0, [])
+    assert not main.repair_client_view_triggers(connection)
+
+
+def test_run_command_verify(connection, capsys):
+    main.create_tables(connection)
+    main.create_client_view(connection)
+    with connection.cursor() as cur:
+        cur.execute("DELETE FROM client_view;")
+        cur.execute("ALTER TABLE person DISABLE TRIGGER person_client_view_insert;")
+    connection.commit()
+    main.insert_new_client_data(connection, ('Егор', 'Иванов', 'Сергеевич', '1990-05-15',
+                                             '79150000000', 'e_ivanov@mail.ru'), output=False)
+
+    assert client_view.run_command(connection, 'verify') == 1
+    assert client_view.run_command(connection, 'verify', repair=True) == 0
+    assert client_view.run_command(connection, 'verify') == 0
+    assert 'Расхождений client_view' in capsys.readouterr().out
@@ -0,0 +1,43 @@
+import data_batch
+import datetime
+import main
+import numpy as np
+
+
+def test_generate_data_batch_format():
+    clients = data_batch.generate_data_batch(500, np.random.default_rng(1))
+
+    assert len(clients) == 500
+    for first_name, second_name, third_name, date_of_birth, phone_num, email in clients:
+        assert first_name in main.MALE_FIRST_NAME_LIST + main.FEMALE_FIRST_NAME_LIST
+        assert second_name.rstrip('а') in main.MALE_SECOND_NAME_LIST
+        assert third_name
+        assert 1960 <= datetime.date.fromisoformat(date_of_birth).year <= 2021
+        assert main.is_valid_phone_number(phone_num) and 11 <= len(phone_num) <= 15 and phone_num[0] != '0'
+        assert main.is_valid_email_address(email)
+        assert email.split('@')[1] in main.DOMAIN_LIST
+
+
+def test_generate_data_batch_sex_consistent():
+    first_names, third_names, second_names, email_locals = data_batch.name_tables()
+
+    for first_name, second_name, third_name, *rest in data_batch.generate_data_batch(500, np.random.default_rng(2)):
+        sex = 0 if first_name in first_names[0] else 1
+        assert second_name in second_names[sex]
+        assert third_name in third_names[sex]
+
+
+def test_generate_clients_batch_reproducible():
+    clients = list(data_batch.generate_clients_batch(250, seed=3, batch_size=100))
+
+    assert len(clients) == 250
+    assert clients == list(data_batch.generate_clients_batch(250, seed=3, batch_size=100))
+    assert clients != list(data_batch.generate_clients_batch(250, seed=4, batch_size=100))
+
+
+def test_generate_clients_batch_empty():
+    assert list(data_batch.generate_clients_batch(0, seed=1)) == []
+
+
+def test_translit():
+    assert data_batch.translit('Иванов') == 'ivanov'
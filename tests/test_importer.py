@@ -0,0 +1,66 @@
+import datetime
+import importer
+import main
+import pytest
+
+
+def row(**values):
+    """
+    Строка файла с клиентом, у которого заполнены все поля
+    """
+    result = {'first_name': 'Егор', 'second_name': 'Иванов', 'third_name': 'Сергеевич',
+              'date_of_birth': '1990-05-15', 'phone_num': '79151234567', 'email': 'e.ivanov@mail.ru'}
+    result.update(values)
+    return result
+
+
+def test_validate_row():
+    assert importer.validate_row(row()) == ('Егор', 'Иванов', 'Сергеевич', datetime.date(1990, 5, 15),
+                                            '79151234567', 'e.ivanov@mail.ru')
+
+
+def test_validate_row_strips_and_empties_values():
+    values = importer.validate_row(row(first_name=' Егор ', third_name='  ', phone_num='', email=None))
+
+    assert values[0] == 'Егор'
+    assert values[2] is None
+    assert values[4:] == (None, None)
+
+
+def test_validate_row_drops_bad_phone_and_email_quietly(capsys):
+    values = importer.validate_row(row(phone_num='+7 915', email='ivanov'))
+
+    assert values[4:] == (None, None)
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.parametrize('values', [
+    {'first_name': ''},
+    {'second_name': None},
+    {'third_name': 5},
+    {'date_of_birth': '15.05.1990'},
+    {'date_of_birth': None},
+    {'date_of_birth': (datetime.date.today() + datetime.timedelta(days=1)).isoformat()},
+    {'first_name': 'Е' * 41},
+    {'email': 'e' * 240 + '@mail.ru.com'},
+])
+def test_validate_row_rejects(values):
+    with pytest.raises(ValueError):
+        importer.validate_row(row(**values))
+
+
+def test_validate_row_unparsed():
+    with pytest.raises(ValueError):
+        importer.validate_row(None)
+
+
+@pytest.mark.parametrize('load', [main.copy_clients, main.insert_clients_many])
+def test_bulk_load_skips_bad_email_quietly(connection, capsys, load):
+    main.create_tables(connection)
+
+    load(connection, [('Егор', 'Иванов', 'Сергеевич', datetime.date(1990, 5, 15), '79151234567', 'ivanov')])
+
+    assert 'ivanov' not in capsys.readouterr().out
+    with connection.cursor() as cur:
+        cur.execute("SELECT (SELECT count(*) FROM person), (SELECT count(*) FROM email_address);")
+        assert cur.fetchone() == (1, 0)
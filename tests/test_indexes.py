@@ -0,0 +1,33 @@
+import main
+import pytest
+
+
+def index_exists(connection, index_name):
+    """
+    Есть ли индекс с таким именем
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (index_name,))
+        return cur.fetchone()[0]
+
+
+def test_create_tables_without_indexes(connection):
+    main.create_tables(connection)
+
+    assert not any(index_exists(connection, index_name) for index_name, table_name, index_definition
+                   in main.INDEX_LIST)
+
+
+@pytest.mark.parametrize('partitions', [None, 4])
+def test_create_indexes_concurrently(connection, partitions):
+    main.create_tables(connection, partitions)
+    with connection.cursor() as cur:
+        cur.execute("CREATE INDEX person_first_name_idx ON person (first_name);")
+    connection.commit()
+
+    assert main.create_indexes(connection, concurrently=True) == len(main.INDEX_LIST)
+    assert not connection.autocommit
+    assert main.create_indexes(connection, concurrently=True) == 0
+    assert all(index_exists(connection, index_name) for index_name, table_name, index_definition
+               in main.INDEX_LIST)
+    assert not index_exists(connection, 'person_first_name_idx')
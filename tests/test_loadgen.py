@@ -0,0 +1,29 @@
+import loadgen
+import main
+import pytest
+import random
+
+
+def test_parse_mix():
+    assert loadgen.parse_mix('find=70, insert=10,update=15,delete=5') == \
+        {'find': 70, 'insert': 10, 'update': 15, 'delete': 5}
+
+
+def test_parse_mix_zero_weight():
+    assert loadgen.parse_mix('find=1,delete=0') == {'find': 1, 'delete': 0}
+
+
+@pytest.mark.parametrize('text', ['search=10', 'find=-1', 'find=0,delete=0', 'find', 'find=x'])
+def test_parse_mix_invalid(text):
+    with pytest.raises(ValueError):
+        loadgen.parse_mix(text)
+
+
+def test_generate_data_reproducible_with_rng():
+    rng_list = [random.Random(7), random.Random(7)]
+    # Общий генератор модуля random между вызовами не должен влиять на данные
+    first = [main.generate_data(rng_list[0].choice('mf'), rng_list[0]) for i in range(5)]
+    random.random()
+    second = [main.generate_data(rng_list[1].choice('mf'), rng_list[1]) for i in range(5)]
+
+    assert first == second
@@ -0,0 +1,151 @@
+import datetime
+import main
+import pytest
+
+
+def param_dict(**values):
+    """
+    Условия поиска в формате client_filter_params() с пустыми значениями по умолчанию
+    """
+    result = main.client_filter_params('', '', '', None, '', '')
+    result.update(values)
+    return result
+
+
+def test_client_filter_params():
+    assert main.client_filter_params('Егор', 'Иванов', 'Сергеевич', '1990-05-15', '7915%', 'e@mail.ru', 5) == \
+        {'person_id': 5, 'first_name': 'Егор', 'third_name': 'Сергеевич', 'second_name': 'Иванов',
+         'date_of_birth': '1990-05-15', 'phone_num_full': '7915%', 'email_full': 'e@mail.ru'}
+
+
+def test_select_query_shape_empty():
+    assert main.select_query_shape(param_dict()) == ((), [])
+
+
+def test_select_query_shape_text_columns_use_like():
+    shape, params = main.select_query_shape(param_dict(first_name='Егор', phone_num_full='7915%'))
+
+    assert shape == (('first_name', 'LIKE'), ('phone_num_full', 'LIKE'))
+    assert params == ['Егор', '7915%']
+
+
+def test_select_query_shape_case_insensitive(monkeypatch):
+    monkeypatch.setattr(main, 'case_insensitive_search', True)
+
+    assert main.select_query_shape(param_dict(second_name='ива%')) == ((('second_name', 'ILIKE'),), ['ива%'])
+
+
+def test_select_query_shape_person_id_overrides_date_of_birth():
+    shape, params = main.select_query_shape(param_dict(person_id=5, date_of_birth='1990-05-15'))
+
+    assert shape == (('person_id', '='),)
+    assert params == [5]
+
+
+def test_select_query_shape_date_of_birth():
+    date_of_birth = datetime.date(1990, 5, 15)
+
+    assert main.select_query_shape(param_dict(date_of_birth=date_of_birth)) == \
+        ((('date_of_birth', '='),), [date_of_birth])
+    assert main.select_query_shape(param_dict(date_of_birth='')) == ((), [])
+
+
+def test_select_query_shape_unknown_column():
+    with pytest.raises(ValueError):
+        main.select_query_shape({'password': 'x'})
+
+
+def test_client_view_shape_exact_values_use_equality():
+    shape, params = main.client_view_shape(param_dict(second_name='Иванов', first_name='Ег%',
+                                                      email_full='e_ivanov@mail.ru', person_id=3))
+
+    assert shape == (('first_name', 'LIKE'), ('second_name', '='), ('email_full', 'LIKE'), ('person_id', '='))
+    assert params == ['Ег%', 'Иванов', 'e_ivanov@mail.ru', 3]
+
+
+def test_generate_select_query_same_text_for_same_shape():
+    first_query, first_params = main.generate_select_query(param_dict(second_name='Иванов'))
+    second_query, second_params = main.generate_select_query(param_dict(second_name='Петров'))
+
+    assert first_query is second_query
+    assert (first_params, second_params) == (['Иванов'], ['Петров'])
+    assert 'Иванов' not in first_query
+
+
+def test_client_view_shape_keeps_ilike(monkeypatch):
+    monkeypatch.setattr(main, 'case_insensitive_search', True)
+
+    assert main.client_view_shape(param_dict(second_name='иванов'))[0] == (('second_name', 'ILIKE'),)
+
+
+@pytest.mark.parametrize('person_id', [0, 1, 123456789])
+def test_page_token_round_trip(person_id):
+    assert main.decode_page_token(main.encode_page_token(person_id)) == person_id
+
+
+def test_decode_page_token_first_page():
+    assert main.decode_page_token(None) == 0
+
+
+@pytest.mark.parametrize('page_token', ['', 'not a token', main.encode_page_token('x'),
+                                        'b2Zmc2V0OjEw'])  # 'offset:10'
+def test_decode_page_token_invalid(page_token):
+    with pytest.raises(ValueError):
+        main.decode_page_token(page_token)
+
+
+def test_generate_page_query_params():
+    query, params = main.generate_page_query(param_dict(second_name='Ив%'), 20, main.encode_page_token(100))
+
+    assert query == main.build_page_query((('second_name', 'LIKE'),))
+    assert params == ['Ив%', 100, 20, 'Ив%']
+
+
+def test_generate_page_query_client_view(monkeypatch):
+    monkeypatch.setattr(main, 'use_client_view', True)
+
+    query, params = main.generate_page_query(param_dict(second_name='Иванов'), 20)
+
+    assert 'FROM client_view WHERE second_name = %s AND person_id > %s ' in query
+    assert params == ['Иванов', 0, 20]
+
+
+def test_build_values_query():
+    assert main.build_values_query(main.INSERT_PHONES_VALUES_QUERY, 2, 3) == \
+        "INSERT INTO phone_number(phone_num_full, person_id) VALUES (%s, %s), (%s, %s), (%s, %s);"
+
+
+def test_is_valid_phone_number():
+    assert main.is_valid_phone_number('79151234567')
+    assert not main.is_valid_phone_number('')
+    assert not main.is_valid_phone_number('+7915')
+    assert not main.is_valid_phone_number(None)
+
+
+SIMILAR_ROW = (3, 'Егор', 'Сергеевич', 'Иванов', datetime.date(1990, 5, 15), ['79150000000'], [], 0.875)
+
+
+@pytest.mark.parametrize('autofit', [False, True])
+def test_print_table_similar_columns(capsys, autofit):
+    assert main.print_table([SIMILAR_ROW], autofit=autofit, columns=main.SIMILAR_COLUMN_LIST,
+                            column_widths=main.SIMILAR_COLUMN_WIDTH_LIST) == 1
+
+    output = capsys.readouterr().out
+    assert 'Сходство' in output
+    assert '0.875' in output
+
+
+def test_print_table_extra_column_without_header():
+    with pytest.raises(ValueError):
+        main.print_table([SIMILAR_ROW], autofit=True)
+
+
+def test_is_valid_email_address_quiet(capsys):
+    assert main.is_valid_email_address('e.ivanov@mail.ru')
+    assert not main.is_valid_email_address('', quiet=True)
+    assert not main.is_valid_email_address(None)
+    assert not main.is_valid_email_address('ivanov', quiet=True)
+    assert capsys.readouterr().out == ''
+
+    assert not main.is_valid_email_address('ivanov')
+    assert 'ivanov' in capsys.readouterr().out
@@ -0,0 +1,37 @@
+import main
+import pytest
+
+
+def partitions_qty(connection):
+    """
+    Количество секций таблицы person
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'person'::regclass;")
+        return cur.fetchone()[0]
+
+
+def test_create_tables_partitioned(connection):
+    main.create_tables(connection, 4)
+
+    assert main.tables_partitioned(connection)
+    assert partitions_qty(connection) == 4
+
+
+def test_create_tables_keeps_existing_partitions(connection):
+    main.create_tables(connection, 4)
+    main.create_tables(connection, 8)
+    main.create_tables(connection)
+
+    assert partitions_qty(connection) == 4
+
+
+def test_create_tables_partitions_on_unpartitioned_tables(connection):
+    main.create_tables(connection)
+
+    with pytest.raises(ValueError, match='migrate_to_partitioned'):
+        main.create_tables(connection, 4)
+    connection.rollback()
+
+    assert main.migrate_to_partitioned(connection, 4, output=False)
+    assert partitions_qty(connection) == 4
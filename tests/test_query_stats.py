@@ -0,0 +1,27 @@
+import main
+import pytest
+import query_stats
+
+
+@pytest.mark.parametrize('query', [
+    main.COUNT_CLIENTS_QUERY,
+    main.build_aggregated_query((('first_name', 'LIKE'),)),
+    main.build_similar_query('name'),
+    "WITH p AS (SELECT person_id FROM person) SELECT count(*) FROM p;",
+])
+def test_is_read_only(query):
+    assert query_stats.is_read_only(query)
+
+
+@pytest.mark.parametrize('query', [
+    main.INSERT_PERSON_QUERY,
+    main.NEXT_PERSON_IDS_QUERY,
+    main.NOTIFY_CLIENT_CACHE_QUERY,
+    "SELECT setval('person_person_id_seq', 100);",
+    "SELECT * FROM person WHERE person_id = %s FOR UPDATE;",
+    "WITH d AS (DELETE FROM person RETURNING person_id) SELECT count(*) FROM d;",
+    "SELECT my_volatile_function(person_id) FROM person;",
+    "EXECUTE find_client_1;",
+])
+def test_is_read_only_modifying(query):
+    assert not query_stats.is_read_only(query)
@@ -0,0 +1,198 @@
+import main
+from psycopg2 import extensions
+import pytest
+
+
+class FakeCursor:
+    """
+    Курсор, который записывает выполненные запросы в свое соединение
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, vars=None):
+        self.connection.queries.append(query)
+        self.connection.status = extensions.TRANSACTION_STATUS_INTRANS
+
+
+class FakeConnection:
+    """
+    Соединение без базы данных, которое считает commit и rollback и, как psycopg2,
+    открывает транзакцию первым запросом
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+
+def test_outer_block_commits_once():
+    connection = FakeConnection()
+
+    with main.transaction(connection) as unit:
+        for i in range(3):
+            with main.transaction(connection):
+                pass
+        assert connection.commits == 0
+        assert unit.pending_qty == 3
+
+    assert connection.commits == 1
+    assert unit.commits_qty == 1
+    assert connection not in main.units_of_work
+
+
+def test_nested_blocks_use_savepoints_by_depth():
+    connection = FakeConnection()
+
+    with main.transaction(connection):
+        with main.transaction(connection) as unit:
+            assert unit.depth == 1
+            with main.transaction(connection):
+                assert unit.depth == 2
+        assert unit.depth == 0
+
+    assert connection.queries == ['SAVEPOINT unit_of_work_1;', 'SAVEPOINT unit_of_work_2;',
+                                  'RELEASE SAVEPOINT unit_of_work_2;', 'RELEASE SAVEPOINT unit_of_work_1;']
+
+
+def test_nested_block_without_savepoint():
+    connection = FakeConnection()
+
+    with main.transaction(connection):
+        with main.transaction(connection, savepoint=False):
+            pass
+
+    assert connection.queries == []
+
+
+def test_exception_in_nested_block_rolls_back_to_savepoint():
+    connection = FakeConnection()
+
+    with main.transaction(connection) as unit:
+        with pytest.raises(ValueError):
+            with main.transaction(connection):
+                raise ValueError
+        # Операция с исключением не учитывается в группе
+        assert unit.pending_qty == 0
+
+    assert connection.queries == ['SAVEPOINT unit_of_work_1;', 'ROLLBACK TO SAVEPOINT unit_of_work_1;',
+                                  'RELEASE SAVEPOINT unit_of_work_1;']
+    assert (connection.commits, connection.rollbacks) == (1, 0)
+
+
+def test_exception_in_outer_block_rolls_back():
+    connection = FakeConnection()
+
+    with pytest.raises(ValueError):
+        with main.transaction(connection):
+            raise ValueError
+
+    assert (connection.commits, connection.rollbacks) == (0, 1)
+    assert connection not in main.units_of_work
+
+
+def test_group_size_commits_every_group():
+    connection = FakeConnection()
+
+    with main.transaction(connection, group_size=2) as unit:
+        for i in range(5):
+            with main.transaction(connection):
+                pass
+        # Две полные группы зафиксированы, пятая операция ждет выхода из блока
+        assert connection.commits == 2
+        assert unit.pending_qty == 1
+
+    assert connection.commits == 3
+    assert unit.commits_qty == 3
+
+
+def test_group_is_not_committed_inside_nested_block():
+    connection = FakeConnection()
+
+    with main.transaction(connection, group_size=1):
+        with main.transaction(connection):
+            with main.transaction(connection):
+                pass
+            assert connection.commits == 0
+        assert connection.commits == 1
+
+
+def test_group_interval_commits_open_transaction():
+    connection = FakeConnection()
+
+    with main.transaction(connection, group_interval_ms=0) as unit:
+        with main.transaction(connection, savepoint=False):
+            connection.cursor().execute('SELECT 1;')
+        assert connection.commits == 1
+
+        # Операция не открыла транзакцию, фиксировать нечего
+        with main.transaction(connection, savepoint=False):
+            pass
+        assert connection.commits == 1
+        assert unit.pending_qty == 1
+
+
+def test_synchronous_commit_off_once_per_transaction():
+    connection = FakeConnection()
+
+    with main.transaction(connection, group_size=2, synchronous_commit=False):
+        for i in range(3):
+            with main.transaction(connection, savepoint=False):
+                pass
+
+    assert connection.queries.count('SET LOCAL synchronous_commit = off;') == 2
+
+
+def test_cached_client_dropped_only_after_commit(monkeypatch):
+    monkeypatch.setattr(main, 'client_cache_notify', False)
+    connection = FakeConnection()
+    main.client_cache[-1] = (0, [])
+
+    try:
+        with main.transaction(connection):
+            main.invalidate_client(connection.cursor(), -1)
+            assert -1 in main.client_cache
+
+        assert -1 not in main.client_cache
+    finally:
+        main.client_cache.pop(-1, None)
+
+
+def test_cached_client_kept_after_rollback(monkeypatch):
+    monkeypatch.setattr(main, 'client_cache_notify', False)
+    connection = FakeConnection()
+    main.client_cache[-1] = (0, [])
+
+    try:
+        with pytest.raises(ValueError):
+            with main.transaction(connection):
+                main.invalidate_client(connection.cursor(), -1)
+                raise ValueError
+
+        assert -1 in main.client_cache
+    finally:
+        main.client_cache.pop(-1, None)